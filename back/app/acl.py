@@ -0,0 +1,104 @@
+"""Кэш прав доступа к спискам: (user_id, list_id) -> owner / shared / нет доступа.
+
+Запрос к lists/shared_lists делается только при промахе. Любое изменение прав
+(share, delete_list, будущий unshare, create_list) вызывает invalidate_list(),
+которое рассылается через app.bus — так воркеры остаются согласованными.
+"""
+import os
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from . import bus, profiling, queries
+from .cache import MemoryBackend, TTLCache
+
+OWNER = "owner"
+SHARED = "shared"
+_NONE = ""  # «доступа нет» тоже кэшируем, но коротко
+
+ACL_CACHE_SIZE = int(os.getenv("ACL_CACHE_SIZE", "10000"))
+ACL_CACHE_TTL = float(os.getenv("ACL_CACHE_TTL", "300"))
+ACL_CACHE_NEGATIVE_TTL = float(os.getenv("ACL_CACHE_NEGATIVE_TTL", "30"))
+
+CHANNEL = "acl"
+
+acl_cache = TTLCache(
+    MemoryBackend(ACL_CACHE_SIZE),
+    ttl=ACL_CACHE_TTL,
+    negative_ttl=ACL_CACHE_NEGATIVE_TTL,
+    is_negative=lambda perm: perm == _NONE,
+)
+# item_id -> list_id: элемент не переезжает между списками, так что только TTL/удаление
+item_list_cache = TTLCache(
+    MemoryBackend(ACL_CACHE_SIZE),
+    ttl=ACL_CACHE_TTL,
+    negative_ttl=ACL_CACHE_NEGATIVE_TTL,
+    is_negative=lambda list_id: list_id is None,
+)
+
+# Поколение списка входит в ключ: инвалидация = +1, старые записи
+# становятся недостижимыми и вытесняются LRU.
+# list_id -> (поколение, когда поднято). Через два ACL_CACHE_TTL после
+# последней инвалидации записей старых поколений уже нет (и догрузок,
+# начатых до неё) — поколение забываем, словарь не растёт вечно.
+_generations: "OrderedDict[int, tuple[int, float]]" = OrderedDict()
+GENERATION_KEEP = 2 * ACL_CACHE_TTL
+
+
+def _key(user_id: Optional[int], list_id: int) -> str:
+    generation = _generations.get(list_id)
+    return f"{user_id}:{list_id}:{generation[0] if generation else 0}"
+
+
+async def get_permission(db, user_id: Optional[int], list_id: int) -> Optional[str]:
+    """OWNER / SHARED / None. `db` — уже взятое соединение или его курсор (нужно только при промахе)."""
+    if not user_id:
+        return None
+
+    async def load() -> str:
+        perm = (await queries.run(db, "acl.permission", (list_id, user_id, list_id, user_id))).scalar()
+        return perm or _NONE
+
+    with profiling.phase("acl"):
+        return await acl_cache.get_or_load(_key(user_id, list_id), load) or None
+
+
+async def item_list_id(db, item_id: int) -> Optional[int]:
+    """В каком списке лежит элемент (None — элемента нет)."""
+    async def load() -> Optional[int]:
+        return (await queries.run(db, "acl.item_list", (item_id,))).scalar()
+
+    with profiling.phase("acl"):
+        return await item_list_cache.get_or_load(item_id, load)
+
+
+def remember_item(item_id: int, list_id: int) -> None:
+    item_list_cache.set(item_id, list_id)
+
+
+def forget_item(item_id: int) -> None:
+    item_list_cache.delete(item_id)
+
+
+async def invalidate_list(list_id: int) -> None:
+    """Права на список изменились — сбросить во всех воркерах."""
+    await bus.publish(CHANNEL, {"list_id": int(list_id)})
+
+
+def _on_invalidate(message: dict) -> None:
+    list_id = message["list_id"]
+    now = time.monotonic()
+    generation = _generations.pop(list_id, (0, now))[0] + 1
+    _generations[list_id] = (generation, now)  # в конец: порядок — по времени инвалидации
+    while _generations:
+        oldest, (_, bumped_at) = next(iter(_generations.items()))
+        if now - bumped_at < GENERATION_KEEP:
+            break
+        del _generations[oldest]
+
+
+bus.subscribe(CHANNEL, _on_invalidate)
+
+
+def stats() -> dict:
+    return {"acl": acl_cache.stats(), "item_list": item_list_cache.stats(), "generations": len(_generations)}
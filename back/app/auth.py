@@ -1,56 +1,57 @@
+import hashlib
+import hmac
 import os
+import time
 from datetime import datetime, timedelta, timezone
 
-from fastapi import APIRouter, FastAPI, Depends, HTTPException, Request
-from fastapi.middleware.cors import CORSMiddleware
+from fastapi import APIRouter, BackgroundTasks, Depends, Header, HTTPException
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from typing import Optional
 
 from jose import jwt, JWTError
-from passlib.context import CryptContext
-from werkzeug.security import check_password_hash as wz_check
+from mysql.connector import errors
 
-from app.schemas import LoginIn, RegisterIn
+from app.schemas import LoginIn, RegisterIn, TicketIn
+from . import bus, hashing, queries
+from .cache import MemoryBackend, TTLCache
 from .db import get_conn
+from .profiling import ProfiledRoute
 
 # JWT настройки
 JWT_SECRET = os.getenv("JWT_SECRET", "change_me")
 JWT_ALG = "HS256"
 JWT_EXPIRE_DAYS = int(os.getenv("JWT_EXPIRE_DAYS", "7"))
-
-# Настройка bcrypt через passlib
-pwd_ctx = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
+# Кэш проверенных токенов: sha256(токен) -> (user_id, exp)
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+# Как долго воркер верит проверенному токену, не спрашивая revoked_tokens:
+# столько logout может не доходить до воркеров без общей шины (app.bus)
+TOKEN_RECHECK = float(os.getenv("TOKEN_RECHECK", "300"))
+TOKEN_CHANNEL = "auth"
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+# Билет для query-строки (EventSource не шлёт Authorization): один список, одна цель, минута
+TICKET_TTL = int(os.getenv("TICKET_TTL", "60"))
+# свой ключ: билет не годится как Bearer-токен, а JWT — как билет
+TICKET_KEY = hmac.new(JWT_SECRET.encode(), b"ticket", hashlib.sha256).hexdigest()
 
 security = HTTPBearer(auto_error=False)
 
 # ---------- Пароли ----------
+# bcrypt/werkzeug считаются в пуле процессов app.hashing
 
-def hash_password(password: str) -> str:
-    """Хешируем новый пароль в bcrypt."""
-    return pwd_ctx.hash(password)
-
-
-def verify_password(password: str, stored_hash: str) -> bool:
-    """Проверка пароля: сначала bcrypt, потом werkzeug."""
-    # bcrypt-хэш
-    if stored_hash.startswith("$2b$") or stored_hash.startswith("$2a$"):
-        return pwd_ctx.verify(password, stored_hash)
-    # werkzeug-хэш
-    return wz_check(stored_hash, password)
-
-
-def rehash_if_needed(user_id: int, password: str, stored_hash: str) -> None:
+async def rehash_if_needed(user_id: int, password: str, stored_hash: str) -> None:
     """
     Если пароль был в старом формате werkzeug — пересчитываем в bcrypt.
+    Запускается фоновой задачей после ответа на /login.
     """
-    if stored_hash.startswith("$2b$") or stored_hash.startswith("$2a$"):
+    if hashing.is_bcrypt(stored_hash):
         return  # уже bcrypt
-    new_hash = pwd_ctx.hash(password)
-    with get_conn() as conn:
-        cur = conn.cursor()
-        cur.execute("UPDATE users SET password=%s WHERE id=%s", (new_hash, user_id))
-        conn.commit()
+    try:
+        new_hash = await hashing.hash_password(password)
+    except HTTPException:
+        return  # пул занят — обновим при следующем входе
+    async with get_conn() as conn:
+        # только если хэш не поменяли параллельно
+        await queries.run(conn, "users.rehash", (new_hash, user_id, stored_hash))
 
 
 # ---------- JWT ----------
@@ -59,46 +60,120 @@ def create_token(user_id: int) -> str:
     """Создаём JWT-токен с exp в UTC."""
     payload = {
         "sub": str(user_id),
+        "iat": time.time(),
         "exp": datetime.now(timezone.utc) + timedelta(days=JWT_EXPIRE_DAYS)
     }
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALG)
 
 
-def parse_token(token: str) -> int:
-    """Декодируем JWT и возвращаем user_id."""
+# ---------- Кэш проверенных токенов ----------
+
+def _until_exp(entry: tuple) -> float:
+    return max(0.0, min(entry[1] - time.time(), TOKEN_RECHECK))
+
+
+# запись живёт до exp токена, но не дольше TOKEN_RECHECK (потом снова проверяем отзыв)
+token_cache = TTLCache(MemoryBackend(TOKEN_CACHE_SIZE), ttl=0, ttl_of=_until_exp)
+# отозванные токены (logout), уже найденные в revoked_tokens или пришедшие по шине, — до их exp
+revoked_tokens = TTLCache(MemoryBackend(TOKEN_CACHE_SIZE), ttl=0, ttl_of=lambda exp: max(0.0, exp - time.time()))
+
+
+def _digest(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+async def authenticate(token: str) -> int:
+    """user_id по токену: jwt.decode и проверка отзыва в БД — только при промахе кэша."""
+    key = _digest(token)
+    if revoked_tokens.get(key) is not None:
+        raise HTTPException(status_code=401, detail="Token revoked")
+
+    async def load() -> tuple:
+        try:
+            data = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALG])
+            user_id, exp = int(data["sub"]), float(data["exp"])
+        except (JWTError, KeyError, ValueError):
+            raise HTTPException(status_code=401, detail="Invalid token")
+        async with get_conn() as conn:
+            revoked = (await queries.run(conn, "auth.is_revoked", (key,))).rows
+        if revoked:
+            revoked_tokens.set(key, exp)
+            raise HTTPException(status_code=401, detail="Token revoked")
+        return user_id, exp
+
+    user_id, _ = await token_cache.get_or_load(key, load)
+    return user_id
+
+
+async def revoke_token(token: str) -> None:
+    """Отозвать один токен (logout): запись в revoked_tokens переживает перезапуск,
+    шина сразу сбрасывает кэш воркеров."""
     try:
-        data = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALG])
-        return int(data["sub"])
-    except JWTError:
-        from fastapi import HTTPException
-        raise HTTPException(status_code=401, detail="Invalid or expired token")
+        exp = float(jwt.get_unverified_claims(token).get("exp", 0))
+    except (JWTError, ValueError):
+        return
+    if exp <= time.time():
+        return
+    key = _digest(token)
+    async with get_conn() as conn:
+        await queries.run(conn, "auth.revoke", (key, exp))
+        await queries.run(conn, "auth.purge_revoked")
+    await bus.publish(TOKEN_CHANNEL, {"digest": key, "exp": exp})
+
+
+def _on_revoke(message: dict) -> None:
+    token_cache.delete(message["digest"])
+    revoked_tokens.set(message["digest"], message["exp"])
+
 
-def get_user_id(creds: Optional[HTTPAuthorizationCredentials] = Depends(security)) -> Optional[int]:
+bus.subscribe(TOKEN_CHANNEL, _on_revoke)
+
+
+async def get_user_id(creds: Optional[HTTPAuthorizationCredentials] = Depends(security)) -> Optional[int]:
     if not creds:
         return None
+    return await authenticate(creds.credentials)
+
+
+def issue_ticket(user_id: int, list_id: int, scope: str) -> str:
+    exp = datetime.now(timezone.utc) + timedelta(seconds=TICKET_TTL)
+    return jwt.encode({"sub": str(user_id), "lid": list_id, "scp": scope, "exp": exp}, TICKET_KEY, algorithm=JWT_ALG)
+
+
+def check_ticket(ticket: str, list_id: int, scope: str) -> int:
+    """user_id из билета, выданного для этого списка и этой цели; иначе 401."""
     try:
-        return parse_token(creds.credentials)
-    except Exception:
-        raise HTTPException(status_code=401, detail="Invalid token")
-    
+        data = jwt.decode(ticket, TICKET_KEY, algorithms=[JWT_ALG])
+        if data["lid"] != list_id or data["scp"] != scope:
+            raise ValueError("wrong ticket scope")
+        return int(data["sub"])
+    except (JWTError, KeyError, ValueError):
+        raise HTTPException(status_code=401, detail="Invalid ticket")
+
+
+def require_admin(x_admin_token: str = Header("")):
+    # без ADMIN_TOKEN служебные ручки выключены
+    if not ADMIN_TOKEN or not hmac.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Access denied")
 
-router = APIRouter(prefix="/auth", tags=["auth"])
+
+router = APIRouter(prefix="/auth", tags=["auth"], route_class=ProfiledRoute)
 
 # --------- AUTH ----------
 @router.post("/register")
-def register(body: RegisterIn):
-    with get_conn() as conn:
-        cur = conn.cursor(dictionary=True)
-        cur.execute("SELECT id FROM users WHERE username=%s", (body.username,))
-        if cur.fetchone():
+async def register(body: RegisterIn):
+    # занятое имя отсекаем до хэша: иначе повторы тратят слот пула хэширования
+    async with get_conn() as conn:
+        if await queries.fetch_one(conn, "users.id_by_username", (body.username,)):
+            raise HTTPException(status_code=400, detail="Username already exists")
+    # bcrypt — CPU-bound, не держим ни event loop, ни соединение из пула
+    password_hash = await hashing.hash_password(body.password)
+    async with get_conn() as conn:
+        try:
+            user_id = (await queries.run(conn, "users.insert", (body.username, password_hash))).lastrowid
+        except errors.IntegrityError:
+            # имя заняли, пока считался хэш (уникальный ключ users.username)
             raise HTTPException(status_code=400, detail="Username already exists")
-
-        cur.execute(
-            "INSERT INTO users (username, password) VALUES (%s, %s)",
-            (body.username, hash_password(body.password))
-        )
-        conn.commit()
-        user_id = cur.lastrowid
 
     token = create_token(user_id)
     # фронт после регистрации сразу кладёт token/user_id в localStorage
@@ -106,23 +181,49 @@ def register(body: RegisterIn):
 
 
 @router.post("/login")
-def login(body: LoginIn):
-    with get_conn() as conn:
-        cur = conn.cursor(dictionary=True)
-        cur.execute("SELECT id, password FROM users WHERE username=%s", (body.username,))
-        row = cur.fetchone()
-        if not row or not verify_password(body.password, row["password"]):
-            raise HTTPException(status_code=401, detail="Invalid username or password")
+async def login(body: LoginIn, background_tasks: BackgroundTasks):
+    async with get_conn() as conn:
+        row = await queries.fetch_one(conn, "users.credentials", (body.username,))
+
+    # проверка хэша — вне соединения и вне event loop
+    if not row or not await hashing.verify_password(body.password, row["password"]):
+        raise HTTPException(status_code=401, detail="Invalid username or password")
+
+    # Автоматическая миграция пароля в bcrypt — уже после ответа
+    background_tasks.add_task(rehash_if_needed, row["id"], body.password, row["password"])
+
+    token = create_token(row["id"])
+    return {"message": "Login successful", "user_id": row["id"], "token": token}
+
+
+@router.post("/logout")
+async def logout(creds: Optional[HTTPAuthorizationCredentials] = Depends(security)):
+    if creds:
+        await revoke_token(creds.credentials)
+    return {"message": "Logged out"}
 
-        # Автоматическая миграция пароля в bcrypt
-        rehash_if_needed(row["id"], body.password, row["password"])
 
-        token = create_token(row["id"])
-        return {"message": "Login successful", "user_id": row["id"], "token": token}
+@router.post("/ticket")
+async def ticket(body: TicketIn, user_id: Optional[int] = Depends(get_user_id)):
+    """Билет на TICKET_TTL секунд для ?ticket= (SSE): полный JWT в URL не кладём —
+    URL оседает в логах прокси и истории браузера. Доступ к списку проверит сам эндпоинт."""
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    return {"ticket": issue_ticket(user_id, body.list_id, body.scope), "expires_in": TICKET_TTL}
+
+
+@router.get("/stats", dependencies=[Depends(require_admin)])
+async def auth_stats():
+    """Попадания в кэш проверенных токенов."""
+    return {
+        "tokens": token_cache.stats(),
+        "revoked": len(revoked_tokens.backend),
+        "hashing": hashing.stats.as_dict(),
+    }
 
 
 @router.get("/auth-check")
-def auth_check(user_id: int = Depends(get_user_id)):
+async def auth_check(user_id: int = Depends(get_user_id)):
     if not user_id:
         raise HTTPException(status_code=401, detail="Unauthorized")
     return {"message": "Authorized"}
\ No newline at end of file
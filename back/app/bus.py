@@ -0,0 +1,60 @@
+"""Шина событий между частями приложения (и воркерами).
+
+По умолчанию всё в памяти процесса: publish сразу вызывает подписчиков.
+Для нескольких uvicorn-воркеров подставляется backend с тем же интерфейсом
+(Redis pub/sub, LISTEN/NOTIFY и т.п.) через set_backend() — подписки
+переносятся, вызывающий код не меняется.
+"""
+import logging
+from abc import ABC, abstractmethod
+from typing import Any, Callable
+
+log = logging.getLogger(__name__)
+
+Handler = Callable[[Any], None]
+
+
+class BusBackend(ABC):
+    @abstractmethod
+    def subscribe(self, channel: str, handler: Handler) -> None: ...
+
+    @abstractmethod
+    async def publish(self, channel: str, message: Any) -> None: ...
+
+
+class LocalBus(BusBackend):
+    """Шина в пределах процесса."""
+
+    def __init__(self):
+        self.handlers: dict[str, list[Handler]] = {}
+
+    def subscribe(self, channel: str, handler: Handler) -> None:
+        self.handlers.setdefault(channel, []).append(handler)
+
+    async def publish(self, channel: str, message: Any) -> None:
+        for handler in self.handlers.get(channel, ()):
+            try:
+                handler(message)
+            except Exception:
+                log.exception("bus handler failed on %s", channel)
+
+
+_backend: BusBackend = LocalBus()
+_subscriptions: list[tuple[str, Handler]] = []
+
+
+def subscribe(channel: str, handler: Handler) -> None:
+    _subscriptions.append((channel, handler))
+    _backend.subscribe(channel, handler)
+
+
+async def publish(channel: str, message: Any) -> None:
+    await _backend.publish(channel, message)
+
+
+def set_backend(backend: BusBackend) -> None:
+    """Заменить транспорт; уже оформленные подписки переезжают на новый."""
+    global _backend
+    _backend = backend
+    for channel, handler in _subscriptions:
+        backend.subscribe(channel, handler)
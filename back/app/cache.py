@@ -0,0 +1,171 @@
+import asyncio
+import logging
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+log = logging.getLogger(__name__)
+
+
+@dataclass
+class CacheEntry:
+    """Значение + два срока: до fresh_until отдаём как есть,
+    до stale_until — отдаём и обновляем в фоне (stale-while-revalidate)."""
+    value: Any
+    fresh_until: float
+    stale_until: float
+
+
+class CacheBackend(ABC):
+    """Хранилище записей. По умолчанию — память процесса; при нескольких
+    воркерах можно подставить общее локальное хранилище с тем же интерфейсом."""
+
+    evictions: int = 0
+
+    @abstractmethod
+    def get(self, key: Hashable) -> Optional[CacheEntry]: ...
+
+    @abstractmethod
+    def set(self, key: Hashable, entry: CacheEntry) -> None: ...
+
+    @abstractmethod
+    def delete(self, key: Hashable) -> None: ...
+
+    @abstractmethod
+    def clear(self) -> None: ...
+
+    @abstractmethod
+    def __len__(self) -> int: ...
+
+
+class MemoryBackend(CacheBackend):
+    """Ограниченный LRU на OrderedDict."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.evictions = 0
+        self._data: "OrderedDict[Hashable, CacheEntry]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[CacheEntry]:
+        entry = self._data.get(key)
+        if entry is not None:
+            self._data.move_to_end(key)
+        return entry
+
+    def set(self, key: Hashable, entry: CacheEntry) -> None:
+        self._data[key] = entry
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class TTLCache:
+    """TTL-кэш поверх backend'а: отдельный TTL для «пустых» ответов,
+    фоновое обновление устаревших записей и счётчики hit/miss/eviction."""
+
+    def __init__(
+        self,
+        backend: CacheBackend,
+        ttl: float,
+        stale_ttl: float = 0.0,
+        negative_ttl: Optional[float] = None,
+        is_negative: Optional[Callable[[Any], bool]] = None,
+        ttl_of: Optional[Callable[[Any], Optional[float]]] = None,
+    ):
+        self.backend = backend
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.negative_ttl = ttl if negative_ttl is None else negative_ttl
+        self.is_negative = is_negative
+        # TTL из самого значения (например, до exp токена); None — обычный ttl
+        self.ttl_of = ttl_of
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+        self._refreshing: dict[Hashable, asyncio.Task] = {}
+
+    def get(self, key: Hashable) -> Optional[CacheEntry]:
+        """Запись, если она ещё не протухла окончательно."""
+        entry = self.backend.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() >= entry.stale_until:
+            self.backend.delete(key)
+            return None
+        return entry
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        negative = self.is_negative is not None and self.is_negative(value)
+        if ttl is None and self.ttl_of is not None:
+            ttl = self.ttl_of(value)
+        if ttl is None:
+            ttl = self.negative_ttl if negative else self.ttl
+        # для пустых ответов stale-окно не даём: пусть быстрее перезапросятся
+        stale = 0.0 if negative else self.stale_ttl
+        now = time.monotonic()
+        self.backend.set(key, CacheEntry(value, now + ttl, now + ttl + stale))
+
+    def delete(self, key: Hashable) -> None:
+        self.backend.delete(key)
+
+    def clear(self) -> None:
+        self.backend.clear()
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        entry = self.get(key)
+        if entry is not None:
+            if time.monotonic() < entry.fresh_until:
+                self.hits += 1
+            else:
+                self.stale_hits += 1
+                self._schedule_refresh(key, loader)
+            return entry.value
+
+        self.misses += 1
+        value = await loader()
+        self.set(key, value)
+        return value
+
+    def _schedule_refresh(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> None:
+        if key in self._refreshing:
+            return
+
+        async def refresh():
+            try:
+                self.set(key, await loader())
+                self.refreshes += 1
+            except Exception:
+                # оставляем устаревшее значение до stale_until
+                self.refresh_errors += 1
+                log.warning("cache refresh failed for %r", key, exc_info=True)
+            finally:
+                self._refreshing.pop(key, None)
+
+        self._refreshing[key] = asyncio.create_task(refresh())
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "size": len(self.backend),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "evictions": self.backend.evictions,
+            "refreshes": self.refreshes,
+            "refresh_errors": self.refresh_errors,
+            "hit_rate": round((self.hits + self.stale_hits) / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,103 @@
+"""Локальный каталог тайтлов Кинопоиска (таблица titles).
+
+Всё, что пришло из /movie/search, сохраняется по kp_id, а описание/год/рейтинг
+потом отдаются из MariaDB без похода в апстрим.
+"""
+import os
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from .db import get_conn
+
+# Сколько дней запись каталога считается свежей
+KP_CATALOG_TTL_DAYS = int(os.getenv("KP_CATALOG_TTL_DAYS", "30"))
+
+_UPSERT_SQL = """
+    INSERT INTO titles (
+        kp_id, name, alternative_name, en_name,
+        name_norm, alternative_name_norm, en_name_norm,
+        type, year, rating_kp, poster_url, poster_preview_url, genres, description
+    ) VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
+    ON DUPLICATE KEY UPDATE
+        name=VALUES(name),
+        alternative_name=VALUES(alternative_name),
+        en_name=VALUES(en_name),
+        name_norm=VALUES(name_norm),
+        alternative_name_norm=VALUES(alternative_name_norm),
+        en_name_norm=VALUES(en_name_norm),
+        type=VALUES(type),
+        year=VALUES(year),
+        rating_kp=VALUES(rating_kp),
+        poster_url=COALESCE(VALUES(poster_url), poster_url),
+        poster_preview_url=COALESCE(VALUES(poster_preview_url), poster_preview_url),
+        genres=COALESCE(VALUES(genres), genres),
+        description=COALESCE(VALUES(description), description),
+        updated_at=CURRENT_TIMESTAMP
+"""
+
+
+def doc_to_row(doc: Dict[str, Any], norm: Callable[[Optional[str]], str]) -> Optional[tuple]:
+    """Документ /movie/search -> кортеж для _UPSERT_SQL (None, если нет id)."""
+    kp_id = doc.get("id")
+    if not kp_id:
+        return None
+    name, alt, en = doc.get("name"), doc.get("alternativeName"), doc.get("enName")
+    poster = doc.get("poster") or {}
+    genres = ", ".join(g.get("name") for g in (doc.get("genres") or []) if g.get("name"))
+    year = doc.get("year")
+    return (
+        kp_id, name, alt, en,
+        norm(name)[:255], norm(alt)[:255], norm(en)[:255],
+        doc.get("type"),
+        year if isinstance(year, int) else None,
+        (doc.get("rating") or {}).get("kp"),
+        poster.get("url"),
+        poster.get("previewUrl"),
+        genres or None,
+        doc.get("description") or doc.get("shortDescription") or None,
+    )
+
+
+async def upsert_docs(docs: Iterable[Dict[str, Any]], norm: Callable[[Optional[str]], str]) -> int:
+    """Сохраняем/обновляем документы пачкой. Возвращает число строк в пачке."""
+    rows = [r for r in (doc_to_row(d, norm) for d in docs) if r]
+    if not rows:
+        return 0
+    async with get_conn() as conn:
+        cur = await conn.cursor()
+        await cur.executemany(_UPSERT_SQL, rows)
+        await conn.commit()
+    return len(rows)
+
+
+async def find_by_title(
+    title_norm: str,
+    type: Optional[str] = None,
+    year: Optional[int] = None,
+    limit: int = 5,
+) -> List[Dict[str, Any]]:
+    """Свежие записи, у которых name/alternativeName/enName после _norm совпадает с запросом.
+    Сначала совпавшие основным названием (name), затем по рейтингу."""
+    if not title_norm:
+        return []
+    where = [
+        "(name_norm=%s OR alternative_name_norm=%s OR en_name_norm=%s)",
+        "updated_at >= NOW() - INTERVAL %s DAY",
+    ]
+    params: list = [title_norm, title_norm, title_norm, KP_CATALOG_TTL_DAYS]
+    if type:
+        where.append("type=%s"); params.append(type)
+    if year:
+        where.append("year=%s"); params.append(year)
+    params.extend((title_norm, limit))
+
+    async with get_conn() as conn:
+        cur = await conn.cursor(dictionary=True)
+        await cur.execute(f"""
+            SELECT kp_id, name, alternative_name, en_name, type, year,
+                   rating_kp, poster_url, poster_preview_url, genres, description
+            FROM titles
+            WHERE {' AND '.join(where)}
+            ORDER BY name_norm=%s DESC, rating_kp IS NULL, rating_kp DESC, kp_id
+            LIMIT %s
+        """, params)
+        return await cur.fetchall()
@@ -0,0 +1,174 @@
+"""Сжатие ответов: brotli или gzip по Accept-Encoding клиента.
+
+Маленькие ответы (< COMPRESS_MIN_SIZE) и несжимаемые типы идут как есть:
+на паре сотен байт заголовки и CPU дороже выигрыша. Целиком готовое тело
+сжимается за раз (с Content-Length), потоковое — по чанкам с flush, чтобы
+клиент получал данные сразу. text/event-stream не трогаем. brotli —
+необязательная зависимость: без модуля остаётся только gzip.
+"""
+import os
+import zlib
+from typing import Optional
+
+from . import metrics
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli не установлен
+    brotli = None
+
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "5"))
+# для динамических ответов высокие уровни brotli слишком дороги по CPU
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+
+_COMPRESSIBLE = ("application/json", "application/x-ndjson", "application/javascript", "application/xml", "image/svg+xml", "text/")
+
+COMPRESSED_BYTES = metrics.Counter(
+    "twl_http_compression_bytes_total", "Response bytes before/after compression.", ("encoding", "stage"),
+)
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Лучшая кодировка из поддерживаемых; при равном q — br."""
+    supported = ("br", "gzip") if brotli is not None else ("gzip",)
+    weights: dict[str, float] = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name.strip()] = q
+    best, best_q = None, 0.0
+    for enc in supported:
+        q = weights.get(enc, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = enc, q
+    return best
+
+
+def _compressible(content_type: str) -> bool:
+    if content_type.startswith("text/event-stream"):
+        return False
+    return content_type.startswith(_COMPRESSIBLE)
+
+
+class _Encoder:
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._br = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            # wbits=31 — обёртка gzip вокруг deflate
+            self._z = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def chunk(self, data: bytes) -> bytes:
+        """Сжатый кусок потока, сразу пригодный к отправке."""
+        if self.encoding == "br":
+            return self._br.process(data) + self._br.flush()
+        return self._z.compress(data) + self._z.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        if self.encoding == "br":
+            return self._br.process(data) + self._br.finish()
+        return self._z.compress(data) + self._z.flush()
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = COMPRESS_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept = ""
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                accept = value.decode("latin-1")
+                break
+        encoding = choose_encoding(accept) if accept else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive, _Responder(send, encoding, self.minimum_size).send)
+
+
+class _Responder:
+    __slots__ = ("_send", "encoding", "minimum_size", "start", "encoder", "passthrough", "bytes_in", "bytes_out")
+
+    def __init__(self, send, encoding: str, minimum_size: int):
+        self._send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.start: Optional[dict] = None
+        self.encoder: Optional[_Encoder] = None
+        self.passthrough = False
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def _headers(self, compressed: bool, length: Optional[int]) -> list:
+        headers = []
+        for name, value in self.start.get("headers", []):
+            if compressed and name == b"content-length":
+                continue
+            if compressed and name == b"etag" and not value.startswith(b"W/"):
+                # другое тело — уже не тот же байт-в-байт ответ
+                value = b"W/" + value
+            headers.append((name, value))
+        headers.append((b"vary", b"Accept-Encoding"))
+        if compressed:
+            headers.append((b"content-encoding", self.encoding.encode()))
+            if length is not None:
+                headers.append((b"content-length", str(length).encode()))
+        return headers
+
+    async def send(self, message):
+        kind = message["type"]
+        if kind == "http.response.start":
+            self.start = message  # ждём первый кусок тела, чтобы решить
+            return
+        if self.passthrough:
+            await self._send(message)
+            return
+        if kind != "http.response.body":
+            # pathsend и прочие расширения — без сжатия
+            if self.encoder is None:
+                self.passthrough = True
+                await self._send(self.start)
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more = message.get("more_body", False)
+
+        if self.encoder is None:
+            headers = dict(self.start.get("headers", []))
+            content_type = headers.get(b"content-type", b"").decode("latin-1")
+            small = not more and len(body) < self.minimum_size
+            if b"content-encoding" in headers or not _compressible(content_type) or small:
+                self.passthrough = True
+                await self._send({**self.start, "headers": self._headers(False, None)})
+                await self._send(message)
+                return
+            self.encoder = _Encoder(self.encoding)
+            if not more:
+                data = self.encoder.finish(body)
+                self._count(len(body), len(data))
+                await self._send({**self.start, "headers": self._headers(True, len(data))})
+                await self._send({"type": "http.response.body", "body": data})
+                return
+            await self._send({**self.start, "headers": self._headers(True, None)})
+
+        data = self.encoder.chunk(body) if more else self.encoder.finish(body)
+        self._count(len(body), len(data))
+        await self._send({"type": "http.response.body", "body": data, "more_body": more})
+
+    def _count(self, raw: int, packed: int) -> None:
+        COMPRESSED_BYTES.inc(self.encoding, "in", amount=raw)
+        COMPRESSED_BYTES.inc(self.encoding, "out", amount=packed)
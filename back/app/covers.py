@@ -0,0 +1,383 @@
+"""Локальный кэш обложек: GET /covers/{item_id}?w= и /covers/title/{kp_id}?w=.
+
+Постер скачивается один раз (одновременные первые запросы склеиваются в одну
+загрузку) и хранится на диске по sha256 содержимого:
+
+    COVERS_DIR/src/ab/<sha>           — оригинал
+    COVERS_DIR/thumbs/ab/<sha>-<w>.webp|jpg  — превью фиксированных ширин
+    COVERS_DIR/urls/cd/<sha256(url)>  — какой sha у этого URL
+
+Превью делает Pillow (необязательная зависимость: без неё отдаётся оригинал),
+WebP — если браузер его принимает, иначе JPEG. Отдача — файлом с ETag и
+долгим Cache-Control. Размер кэша держит фоновый sweeper: при превышении
+COVERS_MAX_BYTES удаляются давно не читанные файлы (mtime обновляется при
+отдаче). Скачиваем только с хостов из COVER_HOSTS — cover_url задаёт
+пользователь; с остальных отвечаем 404, и фронтенд грузит оригинал сам
+(onCoverError). Обложка элемента — только по подписи ?sig= из выдачи /items.
+"""
+import asyncio
+import hashlib
+import hmac
+import io
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Optional
+from urllib.parse import urlsplit
+
+import httpx
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import FileResponse
+
+from . import metrics, queries
+from .cache import MemoryBackend, TTLCache
+from .auth import JWT_SECRET, require_admin
+from .db import get_conn
+from .profiling import ProfiledRoute
+from .singleflight import SingleFlight
+
+try:
+    from PIL import Image
+except ImportError:  # pragma: no cover - Pillow не установлен
+    Image = None
+
+log = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/covers", tags=["covers"], route_class=ProfiledRoute)
+
+COVERS_DIR = Path(os.getenv("COVERS_DIR", str(Path(__file__).resolve().parent.parent / "covers_cache")))
+COVERS_MAX_BYTES = int(os.getenv("COVERS_MAX_BYTES", str(1024 * 1024 * 1024)))
+COVERS_SWEEP_INTERVAL = float(os.getenv("COVERS_SWEEP_INTERVAL", "300"))
+# Ширины превью: запрошенная округляется вверх до ближайшей
+COVER_WIDTHS = tuple(sorted(int(w) for w in os.getenv("COVER_WIDTHS", "160,320,640").split(",")))
+COVER_MAX_SOURCE_BYTES = int(os.getenv("COVER_MAX_SOURCE_BYTES", str(10 * 1024 * 1024)))
+COVER_FETCH_TIMEOUT = float(os.getenv("COVER_FETCH_TIMEOUT", "10"))
+# сколько не пытаться снова скачать URL, который не скачался или не декодируется
+COVER_RETRY_AFTER = float(os.getenv("COVER_RETRY_AFTER", "3600"))
+COVER_HOSTS = tuple(h.strip().lower() for h in os.getenv(
+    "COVER_HOSTS",
+    "st.kp.yandex.net,avatars.mds.yandex.net,kinopoiskapiunofficial.tech,image.openmoviedb.com,imagetmdb.com",
+).split(",") if h.strip())
+WEBP_QUALITY = int(os.getenv("COVER_WEBP_QUALITY", "80"))
+JPEG_QUALITY = int(os.getenv("COVER_JPEG_QUALITY", "82"))
+
+# сутки без вопросов, потом ещё неделю отдаём из кэша браузера и проверяем по ETag
+CACHE_CONTROL = "public, max-age=86400, stale-while-revalidate=604800"
+
+COVER_REQUESTS = metrics.Counter("twl_cover_requests_total", "Cover requests by outcome.", ("result",))
+
+_MAGIC = ((b"\xff\xd8\xff", "image/jpeg"), (b"\x89PNG", "image/png"), (b"GIF8", "image/gif"))
+
+downloads = SingleFlight()
+renders = SingleFlight()
+# URL -> причина: такие обложки сразу 404, без загрузки и Pillow
+not_cacheable = TTLCache(MemoryBackend(4096), ttl=COVER_RETRY_AFTER)
+_client: Optional[httpx.AsyncClient] = None
+_sweeper: Optional[asyncio.Task] = None
+
+
+class NotCacheable(Exception):
+    """Источник не с разрешённого хоста или не картинка — 404, оригинал фронтенд берёт сам."""
+
+
+# ---------- диск ----------
+
+def _sharded(kind: str, name: str) -> Path:
+    return COVERS_DIR / kind / name[:2] / name
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def _url_key(url: str) -> str:
+    return hashlib.sha256(url.encode()).hexdigest()
+
+
+def _thumb_path(sha: str, width: int, fmt: str) -> Path:
+    # без Pillow (fmt="src") отдаётся сам оригинал
+    return _sharded("src", sha) if fmt == "src" else _sharded("thumbs", f"{sha}-{width}.{fmt}")
+
+
+def _known_sha(url: str, width: int, fmt: str) -> Optional[str]:
+    """sha по URL, если на диске есть оригинал или уже нужное превью."""
+    try:
+        sha = _sharded("urls", _url_key(url)).read_text().strip()
+    except FileNotFoundError:
+        return None
+    if _sharded("src", sha).exists() or _thumb_path(sha, width, fmt).exists():
+        return sha
+    return None
+
+
+def _media_type(data: bytes) -> Optional[str]:
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    for magic, media_type in _MAGIC:
+        if data.startswith(magic):
+            return media_type
+    return None
+
+
+def _touch(*paths: Path) -> None:
+    # mtime — время последней отдачи: по нему sweeper решает, что удалять
+    for path in paths:
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+
+# ---------- загрузка и превью ----------
+
+def _allowed(url: str) -> bool:
+    parts = urlsplit(url)
+    host = (parts.hostname or "").lower()
+    return parts.scheme in ("http", "https") and any(host == h or host.endswith("." + h) for h in COVER_HOSTS)
+
+
+def _get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        # свой клиент: ключ API Кинопоиска из kp_client на CDN не уходит
+        _client = httpx.AsyncClient(timeout=COVER_FETCH_TIMEOUT, follow_redirects=False)
+    return _client
+
+
+async def _download(url: str) -> str:
+    """Скачать оригинал, положить по sha содержимого; вернуть sha."""
+    started = time.perf_counter()
+    error = None
+    try:
+        async with _get_client().stream("GET", url) as r:
+            if r.status_code != 200:
+                raise NotCacheable(f"upstream status {r.status_code}")
+            chunks, size = [], 0
+            async for chunk in r.aiter_bytes():
+                size += len(chunk)
+                if size > COVER_MAX_SOURCE_BYTES:
+                    raise NotCacheable("source too large")
+                chunks.append(chunk)
+    except httpx.HTTPError as e:
+        error = type(e).__name__
+        raise NotCacheable(error) from e
+    finally:
+        metrics.observe_upstream("covers", "download", time.perf_counter() - started, error)
+    data = b"".join(chunks)
+    if _media_type(data) is None:
+        raise NotCacheable("not an image")
+    sha = hashlib.sha256(data).hexdigest()
+    await asyncio.to_thread(_store_source, url, sha, data)
+    return sha
+
+
+def _store_source(url: str, sha: str, data: bytes) -> None:
+    src = _sharded("src", sha)
+    if not src.exists():  # один и тот же постер под разными URL — один файл
+        _write_atomic(src, data)
+    _write_atomic(_sharded("urls", _url_key(url)), sha.encode())
+
+
+async def source_sha(url: str, width: int, fmt: str) -> str:
+    sha = await asyncio.to_thread(_known_sha, url, width, fmt)
+    if sha is not None:
+        return sha
+    return await downloads.do(url, lambda: _download(url))
+
+
+def _render(sha: str, width: int, fmt: str) -> Path:
+    path = _thumb_path(sha, width, fmt)
+    if path.exists():
+        return path
+    try:
+        with Image.open(_sharded("src", sha)) as img:
+            img = img.convert("RGB")
+            if img.width > width:
+                img = img.resize((width, max(1, round(img.height * width / img.width))), Image.LANCZOS)
+            out = io.BytesIO()
+            if fmt == "webp":
+                img.save(out, "WEBP", quality=WEBP_QUALITY, method=4)
+            else:
+                img.save(out, "JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+    except FileNotFoundError:
+        raise
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        # битый или подсунутый файл с магией картинки — не 500, а «не кэшируется»
+        raise NotCacheable(f"decode error: {e}") from e
+    _write_atomic(path, out.getvalue())
+    return path
+
+
+def snap_width(w: Optional[int]) -> int:
+    if w is None:
+        return COVER_WIDTHS[-1]
+    return next((x for x in COVER_WIDTHS if x >= w), COVER_WIDTHS[-1])
+
+
+def choose_format(accept: str) -> str:
+    return "webp" if "image/webp" in accept else "jpg"
+
+
+async def thumbnail(sha: str, width: int, fmt: str) -> tuple[Path, str]:
+    """Файл превью (или оригинала без Pillow) и его media type."""
+    path = _thumb_path(sha, width, fmt)
+    if Image is None:
+        media_type = await asyncio.to_thread(lambda: _media_type(path.read_bytes()[:16]))
+        return path, media_type or "application/octet-stream"
+    if not path.exists():
+        # Pillow — CPU; одна генерация на превью даже при толпе запросов
+        path = await renders.do((sha, width, fmt), lambda: asyncio.to_thread(_render, sha, width, fmt))
+    return path, "image/webp" if fmt == "webp" else "image/jpeg"
+
+
+# ---------- sweeper ----------
+
+def sweep(max_bytes: int = COVERS_MAX_BYTES) -> dict:
+    """Удалить давно не читанные файлы, пока кэш не станет меньше 90% лимита."""
+    files = []
+    total = 0
+    for kind in ("src", "thumbs", "urls"):
+        for root, _, names in os.walk(COVERS_DIR / kind):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+    removed = freed = 0
+    if total > max_bytes:
+        target = max_bytes * 0.9
+        for _, size, path in sorted(files):
+            if total - freed <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            removed += 1
+            freed += size
+    return {"files": len(files) - removed, "bytes": total - freed, "removed": removed, "freed": freed}
+
+
+async def _sweep_loop() -> None:
+    while True:
+        try:
+            result = await asyncio.to_thread(sweep)
+            if result["removed"]:
+                log.info("covers sweep: removed %s files, freed %s bytes", result["removed"], result["freed"])
+        except Exception:
+            log.exception("covers sweep failed")
+        await asyncio.sleep(COVERS_SWEEP_INTERVAL)
+
+
+async def start() -> None:
+    """Клиент загрузок и sweeper живут столько же, сколько приложение (lifespan)."""
+    global _sweeper
+    _get_client()
+    if _sweeper is None:
+        _sweeper = asyncio.create_task(_sweep_loop())
+
+
+async def stop() -> None:
+    global _client, _sweeper
+    if _sweeper is not None:
+        _sweeper.cancel()
+        try:
+            await _sweeper
+        except asyncio.CancelledError:
+            pass
+        _sweeper = None
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+# ---------- эндпоинты ----------
+
+def sign(item_id: int) -> str:
+    """Подпись для /covers/{item_id}: <img> не шлёт Authorization, поэтому доступ
+    к списку подтверждает sig, который отдаёт только выдача элементов (/items)."""
+    return hmac.new(JWT_SECRET.encode(), f"cover:{item_id}".encode(), hashlib.sha256).hexdigest()[:32]
+
+
+def _not_cacheable(url: str, e: NotCacheable) -> HTTPException:
+    log.info("cover not cacheable (%s): %s", e, url)
+    not_cacheable.set(url, str(e))
+    COVER_REQUESTS.inc("not_cacheable")
+    return HTTPException(status_code=404, detail="Cover is not cacheable")
+
+
+async def _serve(request: Request, url: Optional[str], w: Optional[int]) -> Response:
+    # cover_url задаёт пользователь: никуда не редиректим — иначе открытый редирект
+    if not url:
+        COVER_REQUESTS.inc("missing")
+        raise HTTPException(status_code=404, detail="No cover")
+    if not _allowed(url):
+        COVER_REQUESTS.inc("not_cacheable")
+        raise HTTPException(status_code=404, detail="Cover is not cacheable")
+    if not_cacheable.get(url) is not None:
+        COVER_REQUESTS.inc("not_cacheable")
+        raise HTTPException(status_code=404, detail="Cover is not cacheable")
+    width = snap_width(w)
+    fmt = choose_format(request.headers.get("accept", "")) if Image is not None else "src"
+    try:
+        sha = await source_sha(url, width, fmt)
+    except NotCacheable as e:
+        raise _not_cacheable(url, e)
+
+    etag = f'"{sha[:20]}-{width}-{fmt}"'
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL, "Vary": "Accept"}
+    if etag in {t.strip().removeprefix("W/") for t in request.headers.get("if-none-match", "").split(",")}:
+        COVER_REQUESTS.inc("not_modified")
+        return Response(status_code=304, headers=headers)
+
+    try:
+        try:
+            path, media_type = await thumbnail(sha, width, fmt)
+        except FileNotFoundError:
+            # sweeper удалил оригинал между проверкой и чтением — скачиваем заново
+            sha = await downloads.do(url, lambda: _download(url))
+            path, media_type = await thumbnail(sha, width, fmt)
+    except NotCacheable as e:
+        raise _not_cacheable(url, e)
+
+    # оригинал и запись URL — тоже «свежие», иначе sweeper снесёт их у самых ходовых обложек
+    await asyncio.to_thread(_touch, path, _sharded("src", sha), _sharded("urls", _url_key(url)))
+    COVER_REQUESTS.inc("file")
+    return FileResponse(path, media_type=media_type, headers=headers)
+
+
+@router.get("/title/{kp_id}")
+async def title_cover(request: Request, kp_id: int, w: Optional[int] = Query(None, ge=16, le=2048)):
+    """Постер из каталога titles (результаты поиска Кинопоиска)."""
+    async with get_conn() as conn:
+        row = await queries.fetch_one(conn, "covers.title_url", (kp_id,))
+    return await _serve(request, row and (row["poster_url"] or row["poster_preview_url"]), w)
+
+
+@router.get("/stats", dependencies=[Depends(require_admin)])
+async def covers_stats():
+    """Загрузки (склеенные запросы) и генерация превью."""
+    return {"downloads": downloads.stats(), "renders": renders.stats(), "not_cacheable": len(not_cacheable.backend),
+            "pillow": Image is not None}
+
+
+@router.get("/{item_id}")
+async def item_cover(
+    request: Request,
+    item_id: int,
+    w: Optional[int] = Query(None, ge=16, le=2048, description=f"Ширина; округляется до {COVER_WIDTHS}"),
+    sig: str = Query(..., description="cover_sig элемента из выдачи /items"),
+):
+    """Обложка элемента списка: доступ — по подписи sig (см. sign)."""
+    if not hmac.compare_digest(sig, sign(item_id)):
+        raise HTTPException(status_code=403, detail="Access denied")
+    async with get_conn() as conn:
+        url = (await queries.run(conn, "covers.item_url", (item_id,))).scalar()
+    return await _serve(request, url, w)
@@ -1,6 +1,16 @@
+import asyncio
 import os
-import mysql.connector
-from mysql.connector import pooling
+import re
+import time
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import AsyncIterator, Optional
+
+from fastapi import HTTPException
+from mysql.connector.aio.pooling import MySQLConnectionPool, PooledMySQLConnection
+from mysql.connector.constants import ClientFlag
+
+from . import metrics, profiling
 
 # Конфигурация берётся из .env
 DB_CFG = dict(
@@ -10,11 +20,213 @@ DB_CFG = dict(
     password=os.getenv("MYSQL_PASSWORD", ""),
     database=os.getenv("MYSQL_DATABASE", ""),
     charset="utf8mb4",
+    # каждый statement — своя транзакция; многошаговые записи открывают её явно
+    autocommit=True,
+    # курсоры по умолчанию буферизованные; для стриминга — cursor(buffered=False)
+    buffered=True,
+    # rowcount у UPDATE = найденные строки, а не изменённые (PATCH без изменений — не «нет строки»)
+    client_flags=[ClientFlag.FOUND_ROWS],
 )
 
-# Пул соединений
-cnxpool = pooling.MySQLConnectionPool(pool_name="twl_pool", pool_size=5, **DB_CFG)
+# Размер пула (у mysql-connector максимум 32 соединения на пул)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+# Сколько запрос ждёт свободное соединение, прежде чем получить 503
+DB_ACQUIRE_TIMEOUT = float(os.getenv("DB_ACQUIRE_TIMEOUT", "5"))
+
+
+class PoolStats:
+    """Счётчики ожидания соединений из пула."""
+
+    def __init__(self):
+        self.acquired = 0
+        self.waited = 0          # сколько раз пришлось ждать свободное соединение
+        self.wait_total = 0.0    # суммарное ожидание, сек
+        self.wait_max = 0.0
+        self.timeouts = 0
+        self.in_use = 0
+        self.max_in_use = 0
+
+    def as_dict(self) -> dict:
+        return {
+            "size": DB_POOL_SIZE,
+            "in_use": self.in_use,
+            "max_in_use": self.max_in_use,
+            "acquired": self.acquired,
+            "waited": self.waited,
+            "timeouts": self.timeouts,
+            "wait_avg_ms": round(self.wait_total / self.acquired * 1000, 3) if self.acquired else 0.0,
+            "wait_max_ms": round(self.wait_max * 1000, 3),
+        }
+
+
+pool_stats = PoolStats()
+
+
+# ---------- имена запросов для метрик ----------
+
+_VERB_TABLE = re.compile(
+    r"^\s*(?:\(\s*)?(select|insert|update|delete|replace|show|set|start|commit|rollback)\b"
+    r"(?:.*?\b(?:from|into|update|join)\s+`?(\w+))?",
+    re.IGNORECASE | re.DOTALL,
+)
+
+
+@lru_cache(maxsize=1024)
+def query_name(sql: str) -> str:
+    """«select:items», «insert:item_genres» — метка для метрик вместо сырого SQL.
+    Текстов запросов в коде конечное число, поэтому разбор кэшируется."""
+    m = _VERB_TABLE.match(sql)
+    if not m:
+        return "other"
+    verb = m.group(1).lower()
+    if verb == "update":
+        table = re.match(r"\s*update\s+`?(\w+)", sql, re.IGNORECASE)
+        return f"update:{table.group(1).lower()}" if table else verb
+    return f"{verb}:{m.group(2).lower()}" if m.group(2) else verb
+
+
+def record_statement(name: str, operation: str, params, elapsed: float, many: bool = False) -> None:
+    """Метрики + профиль запроса для одного statement'а (и для app.queries)."""
+    metrics.SQL_SECONDS.observe(elapsed, name)
+    profiling.record_sql(name, operation, params, elapsed, many=many)
+
+
+class TimedCursor:
+    """Курсор, который меряет execute/executemany (метрики + профиль запроса,
+    см. app.profiling); остальное — как у исходного."""
+
+    __slots__ = ("_cur",)
+
+    def __init__(self, cur):
+        self._cur = cur
+
+    @property
+    def raw_connection(self):
+        """Соединение коннектора под курсором (для подготовленных выражений app.queries)."""
+        return self._cur._connection
+
+    async def execute(self, operation, params=(), *args, **kwargs):
+        name = query_name(operation)
+        started = time.perf_counter()
+        try:
+            return await self._cur.execute(operation, params, *args, **kwargs)
+        except Exception:
+            metrics.SQL_ERRORS.inc(name)
+            raise
+        finally:
+            record_statement(name, operation, params, time.perf_counter() - started)
+
+    async def executemany(self, operation, seq_params, *args, **kwargs):
+        name = query_name(operation)
+        started = time.perf_counter()
+        try:
+            return await self._cur.executemany(operation, seq_params, *args, **kwargs)
+        except Exception:
+            metrics.SQL_ERRORS.inc(name)
+            raise
+        finally:
+            record_statement(name, operation, seq_params, time.perf_counter() - started, many=True)
+
+    def __getattr__(self, item):
+        return getattr(self._cur, item)
+
+    def __aiter__(self):
+        return self._cur.__aiter__()
+
+
+class TimedConnection:
+    """Обёртка соединения из пула: cursor() отдаёт TimedCursor."""
+
+    __slots__ = ("_conn",)
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    async def cursor(self, *args, **kwargs):
+        return TimedCursor(await self._conn.cursor(*args, **kwargs))
+
+    @property
+    def raw_connection(self):
+        """Соединение коннектора за обёрткой пула: живёт дольше одной выдачи из пула."""
+        return self._conn._cnx
+
+    def __getattr__(self, item):
+        return getattr(self._conn, item)
+
+_pool: Optional[MySQLConnectionPool] = None
+# Очередь ожидающих: у пула коннектора нет ожидания, он сразу падает с "pool exhausted"
+_slots: Optional[asyncio.Semaphore] = None
+_init_lock = asyncio.Lock()
+
+
+async def init_pool() -> None:
+    """Открываем пул (lifespan приложения; скрипты — лениво через get_conn)."""
+    global _pool, _slots
+    async with _init_lock:
+        if _pool is not None:
+            return
+        pool = MySQLConnectionPool(
+            pool_name="twl_pool",
+            pool_size=DB_POOL_SIZE,
+            # сброс сессии на каждом возврате — лишний round trip; сессионных переменных мы не держим
+            pool_reset_session=False,
+            **DB_CFG,
+        )
+        await pool.initialize_pool()
+        _pool, _slots = pool, asyncio.Semaphore(DB_POOL_SIZE)
+        metrics.DB_POOL_SIZE.set(value=DB_POOL_SIZE)
+
+
+async def close_pool() -> None:
+    global _pool, _slots
+    async with _init_lock:
+        if _pool is not None:
+            await _pool.close_pool()
+        _pool, _slots = None, None
+
+
+@asynccontextmanager
+async def get_conn() -> AsyncIterator[PooledMySQLConnection]:
+    """Получить соединение с БД из пула (ждём не дольше DB_ACQUIRE_TIMEOUT)."""
+    if _pool is None:
+        await init_pool()
+
+    waited = 0.0
+    if not _slots.locked():
+        await _slots.acquire()  # свободный слот есть — без ожидания
+    else:
+        pool_stats.waited += 1
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(_slots.acquire(), DB_ACQUIRE_TIMEOUT)
+        except asyncio.TimeoutError:
+            pool_stats.timeouts += 1
+            metrics.DB_POOL_TIMEOUTS.inc()
+            raise HTTPException(status_code=503, detail="Database is busy, try again later")
+        waited = time.perf_counter() - started
+    pool_stats.acquired += 1
+    pool_stats.wait_total += waited
+    pool_stats.wait_max = max(pool_stats.wait_max, waited)
+    metrics.DB_POOL_WAIT_SECONDS.observe(waited)
+
+    try:
+        conn = await _pool.get_connection()
+    except BaseException:
+        _slots.release()
+        raise
 
-def get_conn():
-    """Получить соединение с БД из пула"""
-    return cnxpool.get_connection()
+    pool_stats.in_use += 1
+    pool_stats.max_in_use = max(pool_stats.max_in_use, pool_stats.in_use)
+    metrics.DB_POOL_IN_USE.inc()
+    try:
+        yield TimedConnection(conn)
+    finally:
+        try:
+            # незакоммиченная транзакция не должна уехать в пул
+            if conn.in_transaction:
+                await conn.rollback()
+        finally:
+            await conn.close()  # возвращает соединение в пул
+            pool_stats.in_use -= 1
+            metrics.DB_POOL_IN_USE.dec()
+            _slots.release()
@@ -0,0 +1,173 @@
+"""Живая лента изменений списка: GET /lists/{id}/events (Server-Sent Events).
+
+Маршруты изменений после commit публикуют компактный дифф в app.bus
+(канал "list_events"); в каждом воркере хаб раскладывает его по открытым
+потокам этого списка и в ограниченный буфер повтора. С несколькими
+воркерами достаточно подставить backend шины (bus.set_backend).
+
+id события — lists.version после изменения: он один и тот же во всех
+воркерах, поэтому Last-Event-ID работает после переподключения к любому из
+них. Если в буфере нет всех версий после Last-Event-ID (буфер вытеснен или
+версию поднял скрипт без события), клиент получает `reset` и перечитывает список.
+"""
+import asyncio
+import os
+from collections import OrderedDict, deque
+from typing import Optional
+
+from . import bus, metrics
+from .responses import dumps
+
+CHANNEL = "list_events"
+
+# Событий на список в буфере повтора и сколько списков держать (LRU)
+SSE_REPLAY_SIZE = int(os.getenv("SSE_REPLAY_SIZE", "256"))
+SSE_REPLAY_LISTS = int(os.getenv("SSE_REPLAY_LISTS", "1024"))
+# Потоков на пользователя в одном воркере
+SSE_MAX_PER_USER = int(os.getenv("SSE_MAX_PER_USER", "5"))
+# Неотправленных событий на поток: медленный клиент получает reset, а не копит память
+SSE_QUEUE_SIZE = int(os.getenv("SSE_QUEUE_SIZE", "100"))
+SSE_HEARTBEAT = float(os.getenv("SSE_HEARTBEAT", "20"))
+# Через сколько EventSource переподключается после обрыва
+SSE_RETRY_MS = int(os.getenv("SSE_RETRY_MS", "3000"))
+
+SSE_CONNECTIONS = metrics.Gauge("twl_sse_connections", "Open SSE streams.")
+SSE_EVENTS = metrics.Counter("twl_sse_events_total", "SSE events delivered to streams.", ("event",))
+
+
+class TooManyStreams(Exception):
+    pass
+
+
+class Subscription:
+    __slots__ = ("list_id", "user_id", "queue", "overflowed")
+
+    def __init__(self, list_id: int, user_id: int):
+        self.list_id = list_id
+        self.user_id = user_id
+        self.queue: asyncio.Queue = asyncio.Queue(SSE_QUEUE_SIZE)
+        self.overflowed = False
+
+    def push(self, message: Optional[dict]) -> None:
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # None в конце очереди — поток закончится reset'ом
+            self.overflowed = True
+            self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+
+class Hub:
+    def __init__(self):
+        self.replay: OrderedDict[int, deque] = OrderedDict()
+        self.streams: dict[int, set[Subscription]] = {}
+        self.per_user: dict[int, int] = {}
+
+    def subscribe(self, list_id: int, user_id: int) -> Subscription:
+        if self.per_user.get(user_id, 0) >= SSE_MAX_PER_USER:
+            raise TooManyStreams
+        self.per_user[user_id] = self.per_user.get(user_id, 0) + 1
+        sub = Subscription(list_id, user_id)
+        self.streams.setdefault(list_id, set()).add(sub)
+        SSE_CONNECTIONS.inc()
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        subs = self.streams.get(sub.list_id)
+        if subs is None or sub not in subs:
+            return
+        subs.discard(sub)
+        if not subs:
+            del self.streams[sub.list_id]
+        left = self.per_user[sub.user_id] - 1
+        if left:
+            self.per_user[sub.user_id] = left
+        else:
+            del self.per_user[sub.user_id]
+        SSE_CONNECTIONS.dec()
+
+    def since(self, list_id: int, last_version: int, current: int) -> Optional[list[dict]]:
+        """События с версиями last_version+1..current; None — в буфере их нет целиком."""
+        buffered = {m["v"]: m for m in self.replay.get(list_id, ()) if last_version < m["v"] <= current}
+        if len(buffered) != current - last_version:
+            return None
+        return [buffered[v] for v in sorted(buffered)]
+
+    def dispatch(self, message: dict) -> None:
+        list_id = message["list_id"]
+        if message.get("v") is not None:
+            buf = self.replay.get(list_id)
+            if buf is None:
+                buf = self.replay[list_id] = deque(maxlen=SSE_REPLAY_SIZE)
+                if len(self.replay) > SSE_REPLAY_LISTS:
+                    self.replay.popitem(last=False)
+            else:
+                self.replay.move_to_end(list_id)
+            buf.append(message)
+        elif message["event"] == "list_deleted":
+            self.replay.pop(list_id, None)
+        for sub in self.streams.get(list_id, ()):
+            sub.push(message)
+
+
+hub = Hub()
+
+
+async def publish(list_id: int, version: Optional[int], event: str, data: dict) -> None:
+    """Вызывать после commit: подписчики могут сразу перечитать данные."""
+    await bus.publish(CHANNEL, {"list_id": int(list_id), "v": version, "event": event, "data": data})
+
+
+async def publish_many(versions: dict[int, int], event: str, data_by_list: dict[int, dict]) -> None:
+    for list_id, data in data_by_list.items():
+        await publish(list_id, versions.get(list_id), event, data)
+
+
+bus.subscribe(CHANNEL, hub.dispatch)
+
+
+def format_event(event: str, data: dict, event_id: Optional[int] = None) -> bytes:
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {event}\ndata: ".encode() + dumps(data) + b"\n\n"
+
+
+def _render(message: dict) -> bytes:
+    SSE_EVENTS.inc(message["event"])
+    return format_event(message["event"], {"v": message["v"], **message["data"]}, message["v"])
+
+
+async def stream(sub: Subscription, current: int, last_event_id: Optional[int], is_disconnected):
+    """Тело ответа: начальное состояние (повтор или version/reset), затем живые события."""
+    try:
+        yield f"retry: {SSE_RETRY_MS}\n\n".encode()
+        replayed = None
+        if last_event_id is not None and last_event_id <= current:
+            replayed = hub.since(sub.list_id, last_event_id, current)
+        if replayed is None:
+            # без Last-Event-ID — только текущая версия; с дырой в буфере — перечитать список
+            event = "version" if last_event_id is None else "reset"
+            yield format_event(event, {"v": current}, current)
+        else:
+            for message in replayed:
+                yield _render(message)
+        while True:
+            try:
+                message = await asyncio.wait_for(sub.queue.get(), SSE_HEARTBEAT)
+            except asyncio.TimeoutError:
+                if await is_disconnected():
+                    break
+                yield b": ping\n\n"
+                continue
+            if message is None:
+                yield format_event("reset", {"v": None})
+                break
+            if message["v"] is not None and message["v"] <= current:
+                continue  # уже ушло в начальном состоянии
+            yield _render(message)
+            if message["event"] == "list_deleted":
+                break
+    finally:
+        hub.unsubscribe(sub)
@@ -0,0 +1,118 @@
+"""Хэширование паролей в отдельном пуле процессов.
+
+bcrypt/scrypt — это сотни миллисекунд чистого CPU. В пуле процессов они не
+держат ни event loop, ни GIL, а число одновременных вычислений и длина
+очереди ограничены: при переполнении сразу отвечаем 503, а не копим запросы.
+"""
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from fastapi import HTTPException
+from passlib.context import CryptContext
+from werkzeug.security import check_password_hash as wz_check
+
+# Стоимость bcrypt (log2 раундов); при смене старые хэши продолжают проверяться
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Сколько хэшей считается одновременно (= процессов в пуле)
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Сколько запросов может ждать своей очереди сверх работающих
+HASH_QUEUE_LIMIT = int(os.getenv("HASH_QUEUE_LIMIT", "32"))
+
+# Настройка bcrypt через passlib
+pwd_ctx = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+
+def is_bcrypt(stored_hash: str) -> bool:
+    return stored_hash.startswith("$2b$") or stored_hash.startswith("$2a$")
+
+
+# ---------- Выполняется в процессах пула ----------
+
+def _hash(password: str) -> str:
+    """Хешируем новый пароль в bcrypt."""
+    return pwd_ctx.hash(password)
+
+
+def _verify(password: str, stored_hash: str) -> bool:
+    """Проверка пароля: сначала bcrypt, потом werkzeug."""
+    if is_bcrypt(stored_hash):
+        return pwd_ctx.verify(password, stored_hash)
+    return wz_check(stored_hash, password)
+
+
+# ---------- Сервис ----------
+
+class HashingStats:
+    def __init__(self):
+        self.completed = 0
+        self.rejected = 0
+        self.pending = 0
+        self.max_pending = 0
+
+    def as_dict(self) -> dict:
+        return {
+            "workers": HASH_WORKERS,
+            "queue_limit": HASH_QUEUE_LIMIT,
+            "bcrypt_rounds": BCRYPT_ROUNDS,
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+
+stats = HashingStats()
+_executor: Optional[ProcessPoolExecutor] = None
+_slots: Optional[asyncio.Semaphore] = None
+
+
+def start() -> None:
+    """Пул процессов (lifespan; без lifespan — лениво при первом вызове)."""
+    global _executor, _slots
+    if _executor is None:
+        # spawn: fork из процесса с event loop и потоками небезопасен
+        _executor = ProcessPoolExecutor(
+            max_workers=HASH_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        _slots = asyncio.Semaphore(HASH_WORKERS)
+
+
+async def stop() -> None:
+    global _executor, _slots
+    executor, _executor, _slots = _executor, None, None
+    if executor is not None:
+        # ждём процессы в потоке, не блокируя цикл событий
+        await asyncio.to_thread(executor.shutdown, wait=True, cancel_futures=True)
+
+
+async def _run(fn, *args):
+    if _executor is None:
+        start()
+    if stats.pending >= HASH_WORKERS + HASH_QUEUE_LIMIT:
+        stats.rejected += 1
+        raise HTTPException(
+            status_code=503,
+            detail="Too many password operations in progress, try again later",
+            headers={"Retry-After": "1"},
+        )
+    stats.pending += 1
+    stats.max_pending = max(stats.max_pending, stats.pending)
+    try:
+        async with _slots:
+            result = await asyncio.get_running_loop().run_in_executor(_executor, fn, *args)
+        stats.completed += 1
+        return result
+    finally:
+        stats.pending -= 1
+
+
+async def hash_password(password: str) -> str:
+    return await _run(_hash, password)
+
+
+async def verify_password(password: str, stored_hash: str) -> bool:
+    return await _run(_verify, password, stored_hash)
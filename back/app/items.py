@@ -1,94 +1,264 @@
-from typing import Literal, Optional
-from fastapi import APIRouter, Depends, HTTPException, Query
+import base64
+import json
+import os
+from typing import List, Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from mysql.connector import Error as MySQLError
 
+from app import acl, covers, events, list_stats, queries, textnorm, versions
+from app.profiling import ProfiledRoute
+from app.responses import ORJSONResponse
 from app.auth import get_user_id
-from app.schemas import ItemCreate, ItemPatch
+from app.schemas import ItemBatchCreate, ItemBatchDelete, ItemBatchPatch, ItemCreate, ItemPatch
+from app.queries import MAX_GENRE_FILTERS, MAX_SEARCH_TERMS, SORT_WHITELIST  # сами SQL — в реестре app.queries
 from .db import get_conn  # у тебя уже есть
 # если у тебя есть авторизация — добавь Depends(...) при необходимости
 
-router = APIRouter(prefix="/items", tags=["items"])
+router = APIRouter(prefix="/items", tags=["items"], route_class=ProfiledRoute)
+
+GENRE_MAX_LEN = 64
+
+# Максимум элементов в одном запросе /items/batch
+ITEMS_BATCH_MAX = int(os.getenv("ITEMS_BATCH_MAX", "500"))
+
+
+def split_genres(genre: Optional[str]) -> list[str]:
+    """«драма, криминал» -> ["драма", "криминал"] (без пустых и повторов)."""
+    seen, result = set(), []
+    for g in (genre or "").split(","):
+        g = g.strip()[:GENRE_MAX_LEN]
+        if g and g.lower() not in seen:
+            seen.add(g.lower())
+            result.append(g)
+    return result
+
+
+async def _sync_item_genres(conn, item_id: int, list_id: int, genre: Optional[str], replace: bool = False) -> None:
+    """Держим item_genres в согласии с items.genre (в той же транзакции)."""
+    if replace:
+        await queries.run(conn, "item_genres.delete_item", (item_id,))
+    genres = split_genres(genre)
+    if genres:
+        await queries.run_many(conn, "item_genres.insert", [(item_id, list_id, g) for g in genres])
+
+
+async def _sync_title_tokens(conn, item_id: int, list_id: int, title: str, replace: bool = False) -> None:
+    """Слова названия для GET /items/search (в той же транзакции)."""
+    if replace:
+        await queries.run(conn, "item_title_tokens.delete_item", (item_id,))
+    words = textnorm.tokens(title)
+    if words:
+        await queries.run_many(conn, "item_title_tokens.insert", [(list_id, w, item_id) for w in words])
+
+
+def _genre_params(list_id: int, genres: list[str], mode: str) -> tuple[str, list]:
+    """Вариант фильтра и его параметры: свободные слоты IN добиваются NULL."""
+    if not genres:
+        return "none", []
+    params: list = [list_id, *genres, *[None] * (MAX_GENRE_FILTERS - len(genres))]
+    if mode == "all" and len(genres) > 1:
+        return "all", [*params, len(genres)]
+    return "any", params
+
+def _encode_cursor(sort_by: str, order: str, direction: str, row: dict) -> str:
+    """Непрозрачный курсор: (значение сортировки, id) + для какой сортировки он выдан."""
+    key = SORT_WHITELIST[sort_by].split(".", 1)[1]
+    raw = json.dumps(
+        {"s": sort_by, "o": order, "d": direction, "v": row.get(key), "id": row["id"]},
+        default=str, separators=(",", ":"),
+    )
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str, sort_by: str, order: str) -> dict:
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        int(data["id"])
+    except (ValueError, TypeError, KeyError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if data.get("s") != sort_by or data.get("o") != order or data.get("d") not in ("next", "prev"):
+        raise HTTPException(status_code=400, detail="Cursor does not match sort parameters")
+    return data
+
+
+def _keyset_params(column: str, value, last_id: int) -> tuple[str, list]:
+    """Вид keyset-условия (см. queries._keyset_sql) и его параметры."""
+    if column == "i.id":
+        return "after", [last_id]
+    if value is None:
+        return "after_null", [last_id]
+    return "after", [value, value, last_id]
 
-# Белый список колонок сортировки (ключ=имя из API → значение=SQL-выражение)
-SORT_WHITELIST: dict[str, str] = {
-    "created_at": "i.id",
-    "title":      "i.title",
-    "year":       "i.year",
-    "rating":     "i.rating",
-    "genre":      "i.genre"
-}
 
 @router.get("")
-def get_items(
+async def get_items(
+    request: Request,
     list_id: int,
     user_id: int = Depends(get_user_id),
     sort_by: Literal["created_at","title","year","rating","genre"] = Query("created_at"),
     order:   Literal["asc","desc"] = Query("desc"),
     limit:   int = Query(50, ge=1, le=200),
     offset:  int = Query(0, ge=0),
-    genre_filter: Optional[str] = Query(None, description="Фильтр по жанру"),
+    cursor:  Optional[str] = Query(None, description="next_cursor/prev_cursor из прошлого ответа"),
+    genre_filter: Optional[str] = Query(None, description="Фильтр по жанру (один, для старых клиентов)"),
+    genres: Optional[List[str]] = Query(None, description="Фильтр по нескольким жанрам"),
+    genre_mode: Literal["any","all"] = Query("any", description="any — хотя бы один жанр, all — все"),
 ):
-    # 1) проверяем доступ к списку (как у тебя и было)
-    with get_conn() as conn:
-        cur = conn.cursor(dictionary=True)
-        cur.execute("""
-            SELECT 1 FROM lists WHERE id=%s AND user_id=%s
-            UNION
-            SELECT 1 FROM shared_lists WHERE list_id=%s AND shared_with_id=%s
-        """, (list_id, user_id, list_id, user_id))
-        if not cur.fetchone():
-            raise HTTPException(status_code=403, detail="Access denied")
-
-        # 2) формируем ORDER BY из белого списка (никаких подстановок «как есть»!)
-        column = SORT_WHITELIST[sort_by]
-        direction = "ASC" if order == "asc" else "DESC"
-        # стабильная сортировка добавочно по id
-        order_clause = f"{column} {direction}, i.id {direction}"
+    """Страница элементов списка.
+    С `cursor` — keyset-пагинация (ограниченное чтение по индексу (list_id, колонка, id));
+    без него работает старый `offset` для прежних клиентов.
+    ETag = версия списка + параметры запроса: совпал — 304 без выборки.
+    """
+    cur_data = _decode_cursor(cursor, sort_by, order) if cursor else None
+    genre_list = split_genres(",".join([*(genres or []), genre_filter or ""]))
+    if len(genre_list) > MAX_GENRE_FILTERS:
+        raise HTTPException(status_code=400, detail=f"Too many genres (max {MAX_GENRE_FILTERS})")
 
-        # WHERE
-        where_parts = ["i.list_id=%s"]
-        params = [list_id]
+    # 1) проверяем доступ к списку (через кэш прав, запрос в БД только при промахе)
+    async with get_conn() as conn:
+        if not await acl.get_permission(conn, user_id, list_id):
+            raise HTTPException(status_code=403, detail="Access denied")
+        version = await versions.list_version(conn, list_id)
+        if version is None:
+            raise HTTPException(status_code=403, detail="Access denied")
+        etag = versions.make_etag("items", list_id, version, versions.query_fingerprint(request))
+        if (not_modified := versions.not_modified(request, etag)) is not None:
+            return not_modified
 
-        if genre_filter:
-            where_parts.append("i.genre LIKE %s")
-            params.append(f"%{genre_filter}%")
+        # 2) готовый вариант запроса из реестра (колонка только из белого списка)
+        ascending = order == "asc"
+        backwards = bool(cur_data) and cur_data["d"] == "prev"
+        # назад по страницам — читаем в обратном порядке и разворачиваем
+        scan_asc = ascending != backwards
 
-        where_sql = " AND ".join(where_parts)
+        params: list = [list_id]
+        genre_variant, genre_params = _genre_params(list_id, genre_list, genre_mode)
+        params.extend(genre_params)
+        if cur_data:
+            page_mode, keyset = _keyset_params(SORT_WHITELIST[sort_by], cur_data["v"], int(cur_data["id"]))
+            params.extend(keyset)
+            params.append(limit + 1)  # limit+1: лишняя строка честно говорит, есть ли ещё
+        else:
+            page_mode = "offset"
+            params.extend((limit + 1, offset))
 
-        cur.execute(f"""
-            SELECT i.*
-            FROM items i
-            WHERE {where_sql}
-            ORDER BY {order_clause}
-            LIMIT %s OFFSET %s
-        """, (*params, limit, offset))
+        name = queries.page_statement(sort_by, scan_asc, genre_variant, page_mode)
+        # строки — кортежами, словари собираем сами по одному списку колонок на страницу
+        rows = (await queries.run(conn, name, params)).dicts()
+    _sign_covers(rows)
 
-        rows = cur.fetchall()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    if backwards:
+        rows.reverse()
+        has_more, has_prev = True, more
+    else:
+        has_more, has_prev = more, bool(cur_data) or offset > 0
 
-    return {
+    # сразу ORJSONResponse: без jsonable_encoder по каждой строке
+    response = ORJSONResponse({
         "items": rows,
         "list_id": list_id,
         "sort_by": sort_by,
         "order": order,
         "limit": limit,
         "offset": offset,
-    }
+        "has_more": has_more,
+        "next_cursor": _encode_cursor(sort_by, order, "next", rows[-1]) if rows and has_more else None,
+        "prev_cursor": _encode_cursor(sort_by, order, "prev", rows[0]) if rows and has_prev else None,
+    })
+    versions.set_validators(response, etag)
+    return response
+
+def _encode_search_cursor(terms: list[str], row: dict) -> str:
+    raw = json.dumps({"t": " ".join(terms), "sc": row["score"], "id": row["id"]},
+                     ensure_ascii=False, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_search_cursor(cursor: str, terms: list[str]) -> dict:
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        data["sc"], data["id"] = int(data["sc"]), int(data["id"])
+    except (ValueError, TypeError, KeyError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if data.get("t") != " ".join(terms):
+        raise HTTPException(status_code=400, detail="Cursor does not match query")
+    return data
+
+
+@router.get("/search")
+async def search_items(
+    q: str = Query(..., min_length=1, max_length=200, description="Слова названия (последние могут быть началом слова)"),
+    user_id: int = Depends(get_user_id),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="next_cursor из прошлого ответа"),
+):
+    """Поиск по названиям во всех своих и расшаренных списках.
+    Слова нормализуются как названия Кинопоиска (textnorm); каждое ищется по индексу
+    item_title_tokens (list_id, token, item_id) только в доступных списках — точно
+    или как начало слова. Выше — где больше точных совпадений; keyset по (score, id).
+    """
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    terms = textnorm.tokens(q)[:MAX_SEARCH_TERMS]
+    if not terms:
+        return {"items": [], "q": q, "terms": [], "limit": limit, "has_more": False, "next_cursor": None}
+    after = _decode_search_cursor(cursor, terms) if cursor else None
+
+    params: list = [user_id, user_id]
+    for term in terms:
+        params.extend((term, term + "%"))
+    if after:
+        params.extend((after["sc"], after["sc"], after["id"]))
+    params.append(limit + 1)
+    async with get_conn() as conn:
+        rows = (await queries.run(conn, queries.search_statement(len(terms), bool(after)), params)).dicts()
+    _sign_covers(rows)
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return ORJSONResponse({
+        "items": rows,
+        "q": q,
+        "terms": terms,
+        "limit": limit,
+        "has_more": has_more,
+        "next_cursor": _encode_search_cursor(terms, rows[-1]) if rows and has_more else None,
+    })
+
+def _sign_covers(rows: list[dict]) -> None:
+    # подпись для <img src="/covers/{id}?sig=">: получает только тот, кто видит элемент
+    for row in rows:
+        row["cover_sig"] = covers.sign(row["id"])
+
+
+def _new_item(item_id: int, it: ItemCreate) -> dict:
+    """Строка нового элемента для события added (остальные колонки — по умолчанию)."""
+    return {"id": item_id, "list_id": it.list_id, "title": it.title, "type": it.type,
+            "cover_url": it.cover_url or "", "genre": it.genre, "year": None, "rating": None,
+            "watched": 0, "description": None, "cover_sig": covers.sign(item_id)}
+
 
 @router.post("", status_code=201)
-def add_item(body: ItemCreate, user_id: int = Depends(get_user_id)):
-    with get_conn() as conn:
-        cur = conn.cursor(dictionary=True)
-        cur.execute("SELECT 1 FROM lists WHERE id=%s AND user_id=%s", (body.list_id, user_id))
-        if not cur.fetchone():
+async def add_item(body: ItemCreate, user_id: int = Depends(get_user_id)):
+    async with get_conn() as conn:
+        if await acl.get_permission(conn, user_id, body.list_id) != acl.OWNER:
             raise HTTPException(status_code=403, detail="Access denied")
-        cur.execute("""
-            INSERT INTO items (list_id, title, type, cover_url, genre) VALUES (%s,%s,%s,%s,%s)
-        """, (body.list_id, body.title, body.type, body.cover_url or "", body.genre))
-        conn.commit()
+        await conn.start_transaction()
+        item_id = (await queries.run(conn, "items.insert", (
+            body.list_id, body.title, body.type, body.cover_url or "", body.genre,
+        ))).lastrowid
+        await _sync_item_genres(conn, item_id, body.list_id, body.genre)
+        await _sync_title_tokens(conn, item_id, body.list_id, body.title)
+        version = await list_stats.touch(conn, body.list_id, items=1, genres=bool(split_genres(body.genre)))
+        await conn.commit()
+    acl.remember_item(item_id, body.list_id)
+    await events.publish(body.list_id, version, "added", {"items": [_new_item(item_id, body)]})
     return {"message": "Item added"}
 
-@router.patch("")
-def patch_item(body: ItemPatch, user_id: int = Depends(get_user_id)):
+def _patch_fields(body: ItemPatch) -> tuple[list[str], list]:
+    """SET-часть UPDATE из переданных полей."""
     fields, params = [], []
     if body.year is not None:
         fields.append("year=%s"); params.append(body.year)
@@ -100,70 +270,260 @@ def patch_item(body: ItemPatch, user_id: int = Depends(get_user_id)):
         fields.append("cover_url=%s"); params.append(body.cover_url)
     if body.watched is not None:
         fields.append("watched=%s"); params.append(1 if body.watched else 0)
+    if body.genre is not None:
+        fields.append("genre=%s"); params.append(body.genre)
+    return fields, params
+
+
+def _changed(item_id: int, fields: list[str], params: list) -> dict:
+    """Дифф для события patched: {"id": ..., колонка: новое значение}."""
+    return {"id": item_id, **{f.split("=", 1)[0]: v for f, v in zip(fields, params)}}
+
+
+@router.patch("")
+async def patch_item(body: ItemPatch, user_id: int = Depends(get_user_id)):
+    fields, params = _patch_fields(body)
     if not fields:
         raise HTTPException(status_code=400, detail="No changes provided")
 
-    with get_conn() as conn:
-        cur = conn.cursor(dictionary=True)
-        # владение по item -> list -> user
-        cur.execute("""
-            SELECT l.user_id FROM items i
-            JOIN lists l ON i.list_id = l.id
-            WHERE i.id=%s
-        """, (body.id,))
-        row = cur.fetchone()
-        if not row or row["user_id"] != user_id:
+    async with get_conn() as conn:
+        # владение по item -> list -> user (оба шага через кэш)
+        list_id = await acl.item_list_id(conn, body.id)
+        if list_id is None or await acl.get_permission(conn, user_id, list_id) != acl.OWNER:
             raise HTTPException(status_code=403, detail="Access denied")
-        params.append(body.id)
-        cur.execute(f"UPDATE items SET {', '.join(fields)} WHERE id=%s", params)
-        conn.commit()
+        diff = _changed(body.id, fields, params)
+        params.extend([body.id, list_id])
+        await conn.start_transaction()
+        old_watched = None
+        if body.watched is not None:
+            old_watched = (await queries.run(conn, "items.lock_watched", (body.id, list_id))).scalar()
+        updated = await queries.run(conn, "items.update", params, fields=", ".join(fields))
+        if not updated.rowcount:
+            # элемент успели удалить — кэш item -> list устарел
+            acl.forget_item(body.id)
+            raise HTTPException(status_code=403, detail="Access denied")
+        if body.genre is not None:
+            await _sync_item_genres(conn, body.id, list_id, body.genre, replace=True)
+        if body.title is not None:
+            await _sync_title_tokens(conn, body.id, list_id, body.title, replace=True)
+        watched = int(body.watched) - old_watched if old_watched is not None else 0
+        version = await list_stats.touch(conn, list_id, watched=watched, genres=body.genre is not None)
+        await conn.commit()
+    await events.publish(list_id, version, "patched", {"items": [diff]})
     return {"message": "Item updated"}
 
 @router.delete("")
-def delete_item(body: dict, user_id: int = Depends(get_user_id)):
+async def delete_item(body: dict, user_id: int = Depends(get_user_id)):
     item_id = body.get("id")
-    with get_conn() as conn:
-        cur = conn.cursor(dictionary=True)
-        cur.execute("""
-            SELECT l.user_id FROM items i JOIN lists l ON i.list_id=l.id WHERE i.id=%s
-        """, (item_id,))
-        row = cur.fetchone()
-        if not row or row["user_id"] != user_id:
+    async with get_conn() as conn:
+        list_id = await acl.item_list_id(conn, item_id)
+        if list_id is None or await acl.get_permission(conn, user_id, list_id) != acl.OWNER:
             raise HTTPException(status_code=403, detail="Access denied")
-        cur.execute("DELETE FROM items WHERE id=%s", (item_id,))
-        conn.commit()
+        await conn.start_transaction()
+        genres = await queries.run(conn, "item_genres.delete_item", (item_id,))
+        await queries.run(conn, "item_title_tokens.delete_item", (item_id,))
+        deleted = await queries.run(conn, "items.delete", (item_id, list_id))
+        version = None
+        if deleted.rows:
+            version = await list_stats.touch(conn, list_id, items=-1, watched=-int(deleted.scalar() or 0),
+                                             genres=bool(genres.rowcount))
+        await conn.commit()
+    acl.forget_item(item_id)
+    if version is not None:
+        await events.publish(list_id, version, "deleted", {"ids": [item_id]})
     return {"message": "Item deleted"}
 
+# ---------- Пакетные операции ----------
+# Одна проверка прав на каждый затронутый список, многострочная запись,
+# один commit. Ответ — статус по каждому элементу в порядке запроса.
+
+def _check_batch_size(n: int) -> None:
+    if not n:
+        raise HTTPException(status_code=400, detail="Empty batch")
+    if n > ITEMS_BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"Batch too large (max {ITEMS_BATCH_MAX})")
+
+
+async def _owned_lists(conn, user_id: int, list_ids) -> set[int]:
+    return {lid for lid in set(list_ids) if await acl.get_permission(conn, user_id, lid) == acl.OWNER}
+
+
+async def _lock_items(conn, ids: list[int]) -> tuple[dict[int, int], dict[int, int]]:
+    """item_id -> list_id и item_id -> watched для существующих элементов;
+    строки блокируются до commit."""
+    locked = await queries.run(conn, "items.lock_batch", ids, ids=queries.placeholders(len(ids)))
+    return ({item_id: list_id for item_id, list_id, _ in locked.rows},
+            {item_id: int(watched or 0) for item_id, _, watched in locked.rows})
+
+
+def _batch_response(results: list[dict]) -> dict:
+    counts: dict[str, int] = {}
+    for r in results:
+        counts[r["status"]] = counts.get(r["status"], 0) + 1
+    return {"results": results, "counts": counts}
+
+
+@router.post("/batch")
+async def add_items_batch(body: ItemBatchCreate, user_id: int = Depends(get_user_id)):
+    _check_batch_size(len(body.items))
+    results: list[dict] = [{"index": i, "status": "forbidden"} for i in range(len(body.items))]
+    added: dict[int, dict] = {}
+    new_versions: dict[int, int] = {}
+
+    async with get_conn() as conn:
+        owned = await _owned_lists(conn, user_id, (it.list_id for it in body.items))
+        accepted = [(i, it) for i, it in enumerate(body.items) if it.list_id in owned]
+        if accepted:
+            await conn.start_transaction()
+            # один INSERT ... VALUES (...),(...) RETURNING id
+            inserted = await queries.run(
+                conn, "items.insert_batch",
+                [v for _, it in accepted for v in (it.list_id, it.title, it.type, it.cover_url or "", it.genre)],
+                rows=queries.value_rows("(%s,%s,%s,%s,%s)", len(accepted)),
+            )
+            genre_rows, token_rows = [], []
+            changes = list_stats.Changes()
+            for (i, it), (item_id,) in zip(accepted, inserted.rows):
+                results[i] = {"index": i, "id": item_id, "status": "created"}
+                item_genres = split_genres(it.genre)
+                genre_rows.extend((item_id, it.list_id, g) for g in item_genres)
+                token_rows.extend((it.list_id, w, item_id) for w in textnorm.tokens(it.title))
+                changes.add(it.list_id, items=1, genres=bool(item_genres))
+                added.setdefault(it.list_id, {"items": []})["items"].append(_new_item(item_id, it))
+            await queries.run_many(conn, "item_genres.insert", genre_rows)
+            await queries.run_many(conn, "item_title_tokens.insert", token_rows)
+            new_versions = await list_stats.apply(conn, changes)
+            await conn.commit()
+
+    for r in results:
+        if r["status"] == "created":
+            acl.remember_item(r["id"], body.items[r["index"]].list_id)
+    await events.publish_many(new_versions, "added", added)
+    return _batch_response(results)
+
+
+@router.patch("/batch")
+async def patch_items_batch(body: ItemBatchPatch, user_id: int = Depends(get_user_id)):
+    _check_batch_size(len(body.items))
+    results: list[dict] = []
+    # элементы с одинаковым набором полей обновляются одним executemany
+    groups: dict[tuple[str, ...], list[list]] = {}
+    regenre: dict[int, tuple[int, Optional[str]]] = {}
+    retitle: dict[int, tuple[int, str]] = {}
+    touched: set[int] = set()
+    patched: dict[int, dict] = {}
+
+    async with get_conn() as conn:
+        await conn.start_transaction()
+        item_lists, was_watched = await _lock_items(conn, list({it.id for it in body.items}))
+        owned = await _owned_lists(conn, user_id, item_lists.values())
+
+        for i, it in enumerate(body.items):
+            fields, params = _patch_fields(it)
+            list_id = item_lists.get(it.id)
+            if list_id is None:
+                status = "not_found"
+            elif list_id not in owned:
+                status = "forbidden"
+            elif not fields:
+                status = "unchanged"
+            else:
+                status = "updated"
+                groups.setdefault(tuple(fields), []).append([*params, it.id, list_id])
+                touched.add(list_id)
+                patched.setdefault(list_id, {"items": []})["items"].append(_changed(it.id, fields, params))
+                if it.genre is not None:
+                    regenre[it.id] = (list_id, it.genre)
+                if it.title is not None:
+                    retitle[it.id] = (list_id, it.title)
+            results.append({"index": i, "id": it.id, "status": status})
+
+        is_watched = dict(was_watched)
+        for fields, rows in groups.items():
+            await queries.run_many(conn, "items.update", rows, fields=", ".join(fields))
+            if "watched=%s" in fields:
+                # итог по элементу — в порядке выполнения групп, а не запроса
+                pos = fields.index("watched=%s")
+                is_watched.update((row[-2], row[pos]) for row in rows)
+        if regenre:
+            ids = list(regenre)
+            await queries.run(conn, "item_genres.delete_items", ids, ids=queries.placeholders(len(ids)))
+            genre_rows = [(item_id, lid, g) for item_id, (lid, genre) in regenre.items() for g in split_genres(genre)]
+            await queries.run_many(conn, "item_genres.insert", genre_rows)
+        if retitle:
+            ids = list(retitle)
+            await queries.run(conn, "item_title_tokens.delete_items", ids, ids=queries.placeholders(len(ids)))
+            token_rows = [(lid, w, item_id) for item_id, (lid, title) in retitle.items() for w in textnorm.tokens(title)]
+            await queries.run_many(conn, "item_title_tokens.insert", token_rows)
+        changes = list_stats.Changes()
+        for list_id in touched:
+            changes.add(list_id)
+        for item_id, watched in is_watched.items():
+            if watched != was_watched[item_id]:
+                changes.add(item_lists[item_id], watched=watched - was_watched[item_id])
+        for list_id, _ in regenre.values():
+            changes.add(list_id, genres=True)
+        new_versions = await list_stats.apply(conn, changes)
+        await conn.commit()
+
+    for item_id, list_id in item_lists.items():
+        acl.remember_item(item_id, list_id)
+    await events.publish_many(new_versions, "patched", patched)
+    return _batch_response(results)
+
+
+@router.delete("/batch")
+async def delete_items_batch(body: ItemBatchDelete, user_id: int = Depends(get_user_id)):
+    _check_batch_size(len(body.ids))
+    ids = list(dict.fromkeys(body.ids))
+    removed: dict[int, dict] = {}
+    new_versions: dict[int, int] = {}
+
+    async with get_conn() as conn:
+        await conn.start_transaction()
+        item_lists, was_watched = await _lock_items(conn, ids)
+        owned = await _owned_lists(conn, user_id, item_lists.values())
+        doomed = [item_id for item_id, list_id in item_lists.items() if list_id in owned]
+        if doomed:
+            placeholders = queries.placeholders(len(doomed))
+            await queries.run(conn, "item_genres.delete_items", doomed, ids=placeholders)
+            await queries.run(conn, "item_title_tokens.delete_items", doomed, ids=placeholders)
+            await queries.run(conn, "items.delete_batch", doomed, ids=placeholders)
+            changes = list_stats.Changes()
+            for item_id in doomed:
+                changes.add(item_lists[item_id], items=-1, watched=-was_watched[item_id], genres=True)
+                removed.setdefault(item_lists[item_id], {"ids": []})["ids"].append(item_id)
+            new_versions = await list_stats.apply(conn, changes)
+        await conn.commit()
+    await events.publish_many(new_versions, "deleted", removed)
+
+    results = []
+    for i, item_id in enumerate(body.ids):
+        if item_id not in item_lists:
+            status = "not_found"
+            acl.forget_item(item_id)
+        elif item_lists[item_id] not in owned:
+            status = "forbidden"
+        else:
+            status = "deleted"
+            acl.forget_item(item_id)
+        results.append({"index": i, "id": item_id, "status": status})
+    return _batch_response(results)
+
 @router.get("/genres")
-def get_genres(list_id: int, user_id: int = Depends(get_user_id)):
-    with get_conn() as conn:
-        cur = conn.cursor(dictionary=True)
+async def get_genres(request: Request, response: Response, list_id: int, user_id: int = Depends(get_user_id)):
+    async with get_conn() as conn:
         # Проверка доступа
-        cur.execute("""
-            SELECT 1 FROM lists WHERE id=%s AND user_id=%s
-            UNION
-            SELECT 1 FROM shared_lists WHERE list_id=%s AND shared_with_id=%s
-        """, (list_id, user_id, list_id, user_id))
-        if not cur.fetchone():
+        if not await acl.get_permission(conn, user_id, list_id):
             raise HTTPException(status_code=403, detail="Access denied")
+        version = await versions.list_version(conn, list_id)
+        if version is None:
+            raise HTTPException(status_code=403, detail="Access denied")
+        etag = versions.make_etag("genres", list_id, version)
+        if (not_modified := versions.not_modified(request, etag)) is not None:
+            return not_modified
 
-        # Берём все непустые жанры
-        cur.execute("""
-            SELECT genre
-            FROM items
-            WHERE list_id=%s AND genre IS NOT NULL AND genre <> ''
-        """, (list_id,))
-        rows = cur.fetchall()
-
-    # Разделяем по запятой, убираем пробелы и делаем уникальные
-    genres_set = set()
-    for row in rows:
-        parts = [g.strip() for g in row["genre"].split(",")]
-        for g in parts:
-            if g:
-                genres_set.add(g)
-
-    # Отсортировать по алфавиту
-    genres_list = sorted(genres_set, key=lambda s: s.lower())
+        genres = await queries.run(conn, "item_genres.for_list", (list_id,))
 
-    return genres_list
+    versions.set_validators(response, etag)
+    return [row[0] for row in genres.rows]
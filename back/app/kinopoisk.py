@@ -1,17 +1,161 @@
+import asyncio
 import os
+import logging
+import re
 from typing import Optional, Literal
-import httpx
-from fastapi import APIRouter, Query, HTTPException
-from unicodedata import normalize as u_normalize
 
-router = APIRouter()
-KINOPOISK_API_KEY = os.getenv("KINOPOISK_API_KEY")
+import orjson
+from fastapi import APIRouter, Depends, Query
 
+from . import catalog, kp_client, ratelimit
+from .auth import require_admin
+from .cache import MemoryBackend, TTLCache
+from .profiling import ProfiledRoute
+from .responses import RawJSONResponse
+from .singleflight import SingleFlight
+from .textnorm import norm as _norm
 
-def _norm(s: Optional[str]) -> str:
-    if not s:
-        return ""
-    return u_normalize("NFKC", s).strip().lower()
+router = APIRouter(route_class=ProfiledRoute)
+log = logging.getLogger(__name__)
+
+# Кэш ответов /movie/search (общий для search и description)
+KP_CACHE_SIZE = int(os.getenv("KP_CACHE_SIZE", "2048"))
+KP_CACHE_TTL = float(os.getenv("KP_CACHE_TTL", "21600"))          # 6 ч
+KP_CACHE_STALE_TTL = float(os.getenv("KP_CACHE_STALE_TTL", "86400"))  # ещё сутки отдаём и обновляем в фоне
+KP_CACHE_NEGATIVE_TTL = float(os.getenv("KP_CACHE_NEGATIVE_TTL", "300"))
+
+# непустой "docs": [...] — без разбора всего тела
+_HAS_DOCS = re.compile(rb'"docs"\s*:\s*\[\s*[^\]\s]')
+
+
+def _is_empty_search(raw: bytes) -> bool:
+    return not _HAS_DOCS.search(raw or b"")
+
+
+# В кэше — сырые байты ответа апстрима: /kinopoisk/search отдаёт их как есть
+search_cache = TTLCache(
+    MemoryBackend(KP_CACHE_SIZE),
+    ttl=KP_CACHE_TTL,
+    stale_ttl=KP_CACHE_STALE_TTL,
+    negative_ttl=KP_CACHE_NEGATIVE_TTL,
+    is_negative=_is_empty_search,
+)
+
+# Одновременные одинаковые запросы к апстриму склеиваются в один
+search_flight = SingleFlight()
+
+# фоновые записи в каталог (держим ссылки, иначе задачу может собрать GC)
+_background: set[asyncio.Task] = set()
+
+
+def _search_params(query: str, type: Optional[str], year: Optional[int], limit: int) -> dict:
+    params: dict = {"query": query, "limit": limit}
+    if type:
+        params["type"] = type
+    if year:
+        params["year"] = year
+    return params
+
+
+def _cache_key(query: str, type: Optional[str], year: Optional[int], limit: int) -> str:
+    # строка, а не tuple — чтобы ключ переживал переезд на внешний backend
+    return f"{_norm(query)}|{type or ''}|{year or ''}|{limit}"
+
+
+async def _search_payload(
+    query: str,
+    type: Optional[str],
+    year: Optional[int],
+    limit: int,
+    priority: str = ratelimit.INTERACTIVE,
+) -> bytes:
+    """Тело ответа /movie/search через кэш: одинаковые запросы не тратят квоту апстрима.
+    Промах кэша (и фоновое обновление) идёт через single-flight по тому же ключу.
+    Тело не разбирается: каталог пополняется в фоне.
+    """
+    params = _search_params(query, type, year, limit)
+    key = _cache_key(query, type, year, limit)
+
+    async def fetch() -> bytes:
+        r = await kp_client.search(params, priority)
+        raw = r.content
+        if not _is_empty_search(raw):
+            task = asyncio.create_task(_save_to_catalog(raw))
+            _background.add(task)
+            task.add_done_callback(_background.discard)
+        return raw
+
+    async def load() -> bytes:
+        return await search_flight.do(key, fetch)
+
+    return await search_cache.get_or_load(key, load)
+
+
+def _parse(raw: bytes) -> dict:
+    try:
+        payload = orjson.loads(raw)
+    except orjson.JSONDecodeError:
+        return {}
+    return payload if isinstance(payload, dict) else {}
+
+
+async def _save_to_catalog(raw: bytes) -> None:
+    """Каждый увиденный документ — в локальный каталог; сбой БД прокси не ломает."""
+    docs = _parse(raw).get("docs") or []
+    if not docs:
+        return
+    try:
+        await catalog.upsert_docs(docs, _norm)
+    except Exception:
+        log.warning("catalog upsert failed", exc_info=True)
+
+
+async def drain() -> None:
+    """Дождаться фоновых записей в каталог (остановка приложения / конец скрипта)."""
+    if _background:
+        await asyncio.gather(*_background, return_exceptions=True)
+
+
+async def _describe_from_catalog(
+    query: str, type: Optional[str], year: Optional[int], limit: int,
+) -> Optional[dict]:
+    """Ответ description из каталога, если там есть свежее точное совпадение названия.
+    Порядок релевантности апстрима каталог не знает, поэтому отвечает, только когда
+    лучший кандидат однозначен — как у апстрима: точное название, затем type/year.
+    Несколько равных совпадений (ремейки, тёзки) решает апстрим."""
+    qn = _norm(query)
+    try:
+        rows = await catalog.find_by_title(qn, type, year, limit)
+    except Exception:
+        log.warning("catalog lookup failed", exc_info=True)
+        return None
+    if not rows:
+        return None
+    # основное название важнее альтернативных (find_by_title их так и сортирует)
+    top = [r for r in rows if r["name"] and _norm(r["name"]) == qn] or rows
+    if len(top) > 1:
+        return None
+
+    best = top[0]
+    return {
+        "match": {
+            "id": best["kp_id"],
+            "name": best["name"] or best["alternative_name"] or best["en_name"],
+            "type": best["type"],
+            "year": best["year"],
+            "rating": float(best["rating_kp"]) if best["rating_kp"] is not None else None,
+            "poster": best["poster_url"],
+        },
+        "description": best["description"],
+        "candidates": [
+            {
+                "id": r["kp_id"],
+                "name": r["name"] or r["alternative_name"] or r["en_name"],
+                "type": r["type"],
+                "year": r["year"],
+            } for r in rows[:5]
+        ],
+    }
 
 
 @router.get("/kinopoisk/search")
@@ -27,30 +171,11 @@ async def kinopoisk_search(
     - Ключ хранится на сервере и не светится на фронте.
     - Передаём параметры в query string через `params` (без ручной конкатенации).
     - Асинхронный httpx не блокирует event loop.
+    - Клиент общий (kp_client): keep-alive пул и HTTP/2, без TLS-рукопожатия на каждый запрос.
+    - Ответы кэшируются по нормализованному запросу (+ type/year/limit).
+    - Тело апстрима уходит клиенту байтами, без разбора и повторной сериализации.
     """
-    if not KINOPOISK_API_KEY:
-        raise HTTPException(status_code=500, detail="Kinopoisk API key not configured")
-
-    params: dict = {"query": query, "limit": limit}
-    if type:
-        params["type"] = type
-    if year:
-        params["year"] = year
-
-    headers = {"X-API-KEY": KINOPOISK_API_KEY}
-
-    try:
-        async with httpx.AsyncClient(timeout=httpx.Timeout(10.0)) as client:
-            r = await client.get("https://api.kinopoisk.dev/v1.4/movie/search", params=params, headers=headers)
-    except httpx.TimeoutException:
-        raise HTTPException(status_code=504, detail="Kinopoisk request timed out")
-    except httpx.HTTPError:
-        raise HTTPException(status_code=502, detail="Kinopoisk connection error")
-
-    if r.status_code != 200:
-        raise HTTPException(status_code=r.status_code, detail="Kinopoisk API error")
-
-    return r.json()
+    return RawJSONResponse(await _search_payload(query, type, year, limit))
 
 
 @router.get("/kinopoisk/description")
@@ -67,29 +192,24 @@ async def kinopoisk_description(
     3) Если точного нет — берём первый из отфильтрованных.
     Возвращаем компактный JSON с match/description и коротким списком candidates.
     """
-    if not KINOPOISK_API_KEY:
-        raise HTTPException(status_code=500, detail="Kinopoisk API key not configured")
+    return await fetch_description(query, type, year, limit)
 
-    params: dict = {"query": query, "limit": limit}
-    if type:
-        params["type"] = type
-    if year:
-        params["year"] = year
 
-    headers = {"X-API-KEY": KINOPOISK_API_KEY}
-
-    try:
-        async with httpx.AsyncClient(timeout=httpx.Timeout(10.0)) as client:
-            r = await client.get("https://api.kinopoisk.dev/v1.4/movie/search", params=params, headers=headers)
-    except httpx.TimeoutException:
-        raise HTTPException(status_code=504, detail="Kinopoisk request timed out")
-    except httpx.HTTPError:
-        raise HTTPException(status_code=502, detail="Kinopoisk connection error")
-
-    if r.status_code != 200:
-        raise HTTPException(status_code=r.status_code, detail="Kinopoisk API error")
+async def fetch_description(
+    query: str,
+    type: Optional[str] = None,
+    year: Optional[int] = None,
+    limit: int = 10,
+    priority: str = ratelimit.INTERACTIVE,
+) -> dict:
+    """Логика /kinopoisk/description без привязки к роуту (её же зовёт fill_years.py).
+    Сначала локальный каталог titles, в апстрим — только при промахе или устаревшей записи.
+    """
+    cached = await _describe_from_catalog(query, type, year, limit)
+    if cached is not None:
+        return cached
 
-    payload = r.json() or {}
+    payload = _parse(await _search_payload(query, type, year, limit, priority))
     docs = payload.get("docs") or []
 
     if not docs:
@@ -139,3 +259,19 @@ async def kinopoisk_description(
             } for d in filtered[:5]
         ],
     }
+
+
+@router.get("/kinopoisk/stats", dependencies=[Depends(require_admin)])
+async def kinopoisk_stats():
+    """Счётчики кэша, склеивания запросов и лимитера прокси Кинопоиска."""
+    return {
+        "cache": search_cache.stats(),
+        "singleflight": search_flight.stats(),
+        "ratelimit": await ratelimit.limiter.stats(),
+    }
+
+
+@router.get("/kinopoisk/quota", dependencies=[Depends(require_admin)])
+async def kinopoisk_quota():
+    """Сколько запросов к Кинопоиску осталось на сегодня (общий счётчик всех воркеров)."""
+    return await ratelimit.limiter.quota()
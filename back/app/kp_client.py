@@ -0,0 +1,103 @@
+import os
+import time
+from typing import Optional
+
+import httpx
+from fastapi import HTTPException
+
+from . import metrics, profiling, ratelimit
+
+# Настройки апстрима Кинопоиска (всё из .env)
+KINOPOISK_API_KEY = os.getenv("KINOPOISK_API_KEY")
+KINOPOISK_BASE_URL = os.getenv("KINOPOISK_BASE_URL", "https://api.kinopoisk.dev")
+
+KP_MAX_CONNECTIONS = int(os.getenv("KP_MAX_CONNECTIONS", "20"))
+KP_MAX_KEEPALIVE = int(os.getenv("KP_MAX_KEEPALIVE", "10"))
+KP_KEEPALIVE_EXPIRY = float(os.getenv("KP_KEEPALIVE_EXPIRY", "30"))
+KP_CONNECT_TIMEOUT = float(os.getenv("KP_CONNECT_TIMEOUT", "3"))
+KP_READ_TIMEOUT = float(os.getenv("KP_READ_TIMEOUT", "10"))
+KP_POOL_TIMEOUT = float(os.getenv("KP_POOL_TIMEOUT", "5"))
+KP_HTTP2 = os.getenv("KP_HTTP2", "1") == "1"
+
+SEARCH_PATH = "/v1.4/movie/search"
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def _build_client() -> httpx.AsyncClient:
+    """Один клиент на процесс: keep-alive пул + HTTP/2 к api.kinopoisk.dev."""
+    return httpx.AsyncClient(
+        base_url=KINOPOISK_BASE_URL,
+        http2=KP_HTTP2,
+        limits=httpx.Limits(
+            max_connections=KP_MAX_CONNECTIONS,
+            max_keepalive_connections=KP_MAX_KEEPALIVE,
+            keepalive_expiry=KP_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(
+            connect=KP_CONNECT_TIMEOUT,
+            read=KP_READ_TIMEOUT,
+            write=KP_READ_TIMEOUT,
+            pool=KP_POOL_TIMEOUT,
+        ),
+        headers={"X-API-KEY": KINOPOISK_API_KEY or ""},
+    )
+
+
+async def start() -> None:
+    """Поднимаем клиента при старте приложения (lifespan)."""
+    global _client
+    if _client is None:
+        _client = _build_client()
+
+
+async def stop() -> None:
+    """Закрываем пул соединений при остановке приложения."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """Общий клиент. Скрипты без lifespan получают его лениво."""
+    global _client
+    if _client is None:
+        _client = _build_client()
+    return _client
+
+
+async def search(params: dict, priority: str = ratelimit.INTERACTIVE) -> httpx.Response:
+    """GET /movie/search с маппингом сетевых ошибок в HTTP-ответы прокси.
+    Перед запросом берём разрешение у лимитера ключа (иначе 429 без похода в апстрим)."""
+    if not KINOPOISK_API_KEY:
+        raise HTTPException(status_code=500, detail="Kinopoisk API key not configured")
+
+    await ratelimit.limiter.acquire(priority)
+
+    started = time.perf_counter()
+    try:
+        with profiling.phase("upstream"):
+            r = await get_client().get(SEARCH_PATH, params=params)
+    except httpx.TimeoutException:
+        metrics.observe_upstream("kinopoisk", "search", time.perf_counter() - started, "timeout")
+        raise HTTPException(status_code=504, detail="Kinopoisk request timed out")
+    except httpx.HTTPError:
+        metrics.observe_upstream("kinopoisk", "search", time.perf_counter() - started, "connection")
+        raise HTTPException(status_code=502, detail="Kinopoisk connection error")
+    metrics.observe_upstream(
+        "kinopoisk", "search", time.perf_counter() - started,
+        None if r.status_code == 200 else f"status_{r.status_code}",
+    )
+
+    if r.status_code == 429:
+        raise HTTPException(status_code=429, detail="Kinopoisk rate limit, try again later",
+                            headers={"Retry-After": r.headers.get("Retry-After", "1")})
+    if r.status_code == 403 and "лимит" in r.text.lower():
+        # дневной лимит кончился раньше нашего счётчика (ключ используют где-то ещё)
+        await ratelimit.limiter.mark_exhausted()
+        quota = await ratelimit.limiter.quota()
+        raise ratelimit.QuotaExhausted(quota["resets_in"], "Kinopoisk daily quota exhausted")
+    if r.status_code != 200:
+        raise HTTPException(status_code=r.status_code, detail="Kinopoisk API error")
+    return r
@@ -0,0 +1,49 @@
+"""Сводка по списку прямо в строке lists: item_count, watched_count,
+last_modified, top_genres (миграция 0006).
+
+GET /lists и /shared_lists отдают её тем же запросом — без COUNT(*) по items
+и без N+1 запросов /items с клиента. Счётчики меняются дельтами в той же
+транзакции, что и элементы, и тем же UPDATE бампается lists.version.
+top_genres пересчитывается по индексу item_genres только когда жанры списка
+поменялись. Расхождения чинит scripts/reconcile_list_stats.py.
+"""
+from typing import Optional
+
+from . import queries
+
+
+class Changes:
+    """Изменения по спискам за одну транзакцию: list_id -> [элементы, просмотренные]."""
+
+    __slots__ = ("counts", "regenre")
+
+    def __init__(self):
+        self.counts: dict[int, list[int]] = {}
+        self.regenre: set[int] = set()
+
+    def add(self, list_id: int, items: int = 0, watched: int = 0, genres: bool = False) -> None:
+        counts = self.counts.setdefault(list_id, [0, 0])
+        counts[0] += items
+        counts[1] += watched
+        if genres:
+            self.regenre.add(list_id)
+
+
+async def apply(db, changes: Changes) -> dict[int, int]:
+    """Вызывать внутри транзакции изменения — вместо versions.bump_lists.
+    Возвращает новые lists.version (id событий app.events)."""
+    new_versions = {}
+    for list_id in sorted(changes.counts):  # один порядок блокировок во всех транзакциях
+        items, watched = changes.counts[list_id]
+        result = await queries.run(db, "list_stats.apply", (items, watched, list_id))
+        if result.rowcount:
+            new_versions[list_id] = result.lastrowid
+    for list_id in sorted(changes.regenre):
+        await queries.run(db, "list_stats.top_genres", (list_id, list_id))
+    return new_versions
+
+
+async def touch(db, list_id: int, items: int = 0, watched: int = 0, genres: bool = False) -> Optional[int]:
+    changes = Changes()
+    changes.add(list_id, items, watched, genres)
+    return (await apply(db, changes)).get(list_id)
@@ -0,0 +1,144 @@
+"""Буферизованная запись событий фронтенда в таблицу logs.
+
+/logs только кладёт событие в ограниченную очередь и сразу отвечает.
+Фоновая задача забирает события пачками (по размеру или по времени) и пишет
+одним многострочным INSERT — аналитика не конкурирует с пользовательскими
+запросами за соединения пула. Если очередь полна, событие отбрасывается и
+учитывается в счётчике dropped.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Optional
+
+from .db import get_conn
+
+log = logging.getLogger(__name__)
+
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_FLUSH_SIZE = int(os.getenv("LOG_FLUSH_SIZE", "500"))
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "1.0"))
+
+Row = tuple[str, str, int]
+
+
+class LogSink:
+    def __init__(self, maxsize: int, flush_size: int, flush_interval: float):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.queue: "asyncio.Queue[Row]" = asyncio.Queue(maxsize)
+        self._task: Optional[asyncio.Task] = None
+        self._flushing: Optional[asyncio.Future] = None
+        self._batch: list[Row] = []  # собираемая пачка — её тоже дописываем при остановке
+        self._closing = False
+        self.enqueued = 0
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+        self.flushes = 0
+        self.max_depth = 0
+        self.flush_total = 0.0
+        self.flush_max = 0.0
+
+    def submit(self, event: str, payload: str, user_id: int) -> bool:
+        """Положить событие в очередь; False — очередь полна, событие отброшено."""
+        if self._closing:
+            self.dropped += 1
+            return False
+        try:
+            self.queue.put_nowait((event, payload, user_id))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+        self.enqueued += 1
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+        return True
+
+    def start(self) -> None:
+        if self._task is None:
+            self._closing = False
+            self._task = asyncio.create_task(self._run(), name="logsink")
+
+    async def stop(self) -> None:
+        """Дописать всё, что уже в очереди, и остановиться."""
+        self._closing = True
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._flushing is not None:
+            await self._flushing  # пачку, которую уже пишем, дожидаемся
+            self._flushing = None
+        batch, self._batch = self._batch, []
+        await self._flush(batch)
+        while not self.queue.empty():
+            await self._flush(self._drain([]))
+
+    def _drain(self, batch: list[Row]) -> list[Row]:
+        while len(batch) < self.flush_size and not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            # ждём первое событие, затем добираем пачку до размера или конца окна
+            self._batch = batch = [await self.queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.flush_size:
+                self._drain(batch)
+                timeout = deadline - time.monotonic()
+                if len(batch) >= self.flush_size or timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            # отмена при остановке не должна обрывать запись на середине
+            self._batch = []
+            self._flushing = asyncio.ensure_future(self._flush(batch))
+            await asyncio.shield(self._flushing)
+            self._flushing = None
+
+    async def _flush(self, batch: list[Row]) -> None:
+        if not batch:
+            return
+        started = time.perf_counter()
+        try:
+            async with get_conn() as conn:
+                cur = await conn.cursor()
+                await cur.execute(
+                    "INSERT INTO logs (event, data, user_id) VALUES "
+                    + ",".join(["(%s,%s,%s)"] * len(batch)),
+                    [v for row in batch for v in row],
+                )
+                await conn.commit()
+            self.written += len(batch)
+        except Exception:
+            # аналитика не стоит повторов: пачку теряем, но считаем
+            self.failed += len(batch)
+            log.warning("log sink flush of %d events failed", len(batch), exc_info=True)
+        elapsed = time.perf_counter() - started
+        self.flushes += 1
+        self.flush_total += elapsed
+        self.flush_max = max(self.flush_max, elapsed)
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.queue.qsize(),
+            "queue_max_depth": self.max_depth,
+            "queue_size": self.queue.maxsize,
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "written": self.written,
+            "failed": self.failed,
+            "flushes": self.flushes,
+            "flush_avg_ms": round(self.flush_total / self.flushes * 1000, 2) if self.flushes else 0.0,
+            "flush_max_ms": round(self.flush_max * 1000, 2),
+        }
+
+
+sink = LogSink(LOG_QUEUE_SIZE, LOG_FLUSH_SIZE, LOG_FLUSH_INTERVAL)
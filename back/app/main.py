@@ -1,21 +1,53 @@
-from fastapi import FastAPI, Depends, HTTPException, Request
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from typing import Optional
 import json
+import os
+
+from . import acl, compression, covers, db, events, hashing, kp_client, logsink, metrics, profiling, queries, transfer, versions
 
 from .db import get_conn
-from .auth import get_user_id
-from .schemas import ListCreate, ShareIn, RenameListIn
+from .auth import check_ticket, get_user_id, require_admin
+from .schemas import ListCreate, ProfilingIn, ShareIn, RenameListIn
+from .responses import ORJSONResponse
 
+from app import kinopoisk
 from app.kinopoisk import router as kinopoisk_router  # импорт роутера
 from .items import router as items_router
 from .auth import router as auth_router
 
-app = FastAPI(title="ToWatchList API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # пул БД, общий httpx-клиент к Кинопоиску и пул хэширования живут столько же, сколько приложение
+    await db.init_pool()
+    await kp_client.start()
+    hashing.start()
+    logsink.sink.start()
+    await covers.start()
+    try:
+        yield
+    finally:
+        # сначала дописываем буфер логов — пока пул БД ещё жив
+        await logsink.sink.stop()
+        await kinopoisk.drain()
+        await covers.stop()
+        await hashing.stop()
+        await kp_client.stop()
+        await db.close_pool()
+
+
+# orjson по умолчанию для всех ответов (app.responses)
+app = FastAPI(title="ToWatchList API", lifespan=lifespan, default_response_class=ORJSONResponse)
+# маршруты самого app тоже отмечают конец эндпоинта (фаза serialize в Server-Timing)
+app.router.route_class = profiling.ProfiledRoute
 
 app.include_router(kinopoisk_router)
 app.include_router(items_router)
 app.include_router(auth_router)
+app.include_router(covers.router)
+app.include_router(transfer.router)
 
 # CORS при необходимости
 origins = [
@@ -32,104 +64,214 @@ app.add_middleware(
     allow_methods=["*"], 
     allow_headers=["*"],
 )
+# brotli/gzip по Accept-Encoding, от COMPRESS_MIN_SIZE байт
+app.add_middleware(compression.CompressionMiddleware)
+# Server-Timing при включённом профилировании (POST /admin/profiling)
+app.add_middleware(profiling.ProfilingMiddleware)
+# снаружи всех: время и статус каждого запроса по маршруту (GET /metrics)
+app.add_middleware(metrics.MetricsMiddleware)
+
+# --------- STATS ----------
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Метрики процесса в формате Prometheus."""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+# --------- ADMIN ----------
+@app.get("/admin/profiling", dependencies=[Depends(require_admin)])
+async def get_profiling():
+    return profiling.state.as_dict()
+
+
+@app.post("/admin/profiling", dependencies=[Depends(require_admin)])
+async def set_profiling(body: ProfilingIn):
+    """Включить/выключить профилирование во всех воркерах без перезапуска."""
+    return await profiling.configure(body.enabled, body.slow_ms)
+
+
+@app.get("/db/stats", dependencies=[Depends(require_admin)])
+async def db_stats():
+    """Загрузка пула соединений и время ожидания свободного соединения."""
+    return db.pool_stats.as_dict()
+
+@app.get("/acl/stats", dependencies=[Depends(require_admin)])
+async def acl_stats():
+    """Попадания в кэш прав доступа к спискам."""
+    return acl.stats()
 
 # --------- USERS ----------
 @app.get("/user")
-def get_user_by_username(username: str):
-    with get_conn() as conn:
-        cur = conn.cursor(dictionary=True)
-        cur.execute("SELECT * FROM users WHERE username=%s", (username,))
-        u = cur.fetchone()
+async def get_user_by_username(username: str):
+    async with get_conn() as conn:
+        u = await queries.fetch_one(conn, "users.by_username", (username,))
         if not u:
             raise HTTPException(status_code=404, detail="User not found")
         return u
 
 # --------- LISTS ----------
 @app.get("/lists")
-def list_lists(user_id: int = Depends(get_user_id)):
+async def list_lists(request: Request, response: Response, user_id: int = Depends(get_user_id)):
     if not user_id:
         raise HTTPException(status_code=401, detail="Unauthorized")
-    with get_conn() as conn:
-        cur = conn.cursor(dictionary=True)
-        cur.execute("SELECT * FROM lists WHERE user_id=%s", (user_id,))
-        return cur.fetchall()
+    async with get_conn() as conn:
+        # ETag по версиям набора списков и самих списков (в ответе их сводка) — без основного запроса
+        etag = versions.make_etag("lists", user_id, *await versions.user_lists_version(conn, user_id))
+        if (not_modified := versions.not_modified(request, etag)) is not None:
+            return not_modified
+        rows = await queries.fetch_all(conn, "lists.by_user", (user_id,))
+    versions.set_validators(response, etag)
+    return rows
 
 @app.post("/lists", status_code=201)
-def create_list(body: ListCreate, user_id: int = Depends(get_user_id)):
+async def create_list(body: ListCreate, user_id: int = Depends(get_user_id)):
     if not user_id:
         raise HTTPException(status_code=401, detail="Unauthorized")
-    with get_conn() as conn:
-        cur = conn.cursor()
-        cur.execute("INSERT INTO lists (user_id, name) VALUES (%s, %s)", (user_id, body.name))
-        conn.commit()
+    async with get_conn() as conn:
+        await conn.start_transaction()
+        list_id = (await queries.run(conn, "lists.insert", (user_id, body.name))).lastrowid
+        await versions.bump_users(conn, [user_id])
+        await conn.commit()
+    # вдруг кто-то уже спрашивал этот id и в кэше лежит «нет доступа»
+    await acl.invalidate_list(list_id)
     return {"message": "List created"}
 
 @app.patch("/rename_list")
-def rename_list(body: RenameListIn, user_id: int = Depends(get_user_id)):
-    with get_conn() as conn:
-        cur = conn.cursor(dictionary=True)
-        cur.execute("SELECT id FROM lists WHERE id=%s AND user_id=%s", (body.list_id, user_id))
-        if not cur.fetchone():
+async def rename_list(body: RenameListIn, user_id: int = Depends(get_user_id)):
+    async with get_conn() as conn:
+        if await acl.get_permission(conn, user_id, body.list_id) != acl.OWNER:
             raise HTTPException(status_code=403, detail="List not found or access denied")
-        cur.execute("UPDATE lists SET name=%s WHERE id=%s", (body.new_name, body.list_id))
-        conn.commit()
+        await conn.start_transaction()
+        version = (await queries.run(conn, "lists.rename", (body.new_name, body.list_id))).lastrowid
+        await versions.bump_list_members(conn, body.list_id)
+        await conn.commit()
+    await events.publish(body.list_id, version, "version", {"name": body.new_name})
     return {"message": "List renamed successfully"}
 
 @app.delete("/delete_list")
-def delete_list(body: dict, user_id: int = Depends(get_user_id)):
+async def delete_list(body: dict, user_id: int = Depends(get_user_id)):
     list_id = body.get("list_id")
-    with get_conn() as conn:
-        cur = conn.cursor(dictionary=True)
-        cur.execute("SELECT id FROM lists WHERE id=%s AND user_id=%s", (list_id, user_id))
-        if not cur.fetchone():
+    async with get_conn() as conn:
+        if await acl.get_permission(conn, user_id, list_id) != acl.OWNER:
             raise HTTPException(status_code=403, detail="List not found or access denied")
-        cur.execute("DELETE FROM lists WHERE id=%s", (list_id,))
-        conn.commit()
+        await conn.start_transaction()
+        # пока строки shared_lists на месте — знаем, чьи /shared_lists поменялись
+        await versions.bump_list_members(conn, list_id)
+        await queries.run(conn, "item_genres.delete_list", (list_id,))
+        await queries.run(conn, "item_title_tokens.delete_list", (list_id,))
+        await queries.run(conn, "lists.delete", (list_id,))
+        await conn.commit()
+    await acl.invalidate_list(list_id)
+    await events.publish(list_id, None, "list_deleted", {})
     return {"message": "List deleted successfully"}
 
+@app.get("/lists/{list_id}/events")
+async def list_events(
+    list_id: int,
+    request: Request,
+    user_id: Optional[int] = Depends(get_user_id),
+    ticket: Optional[str] = Query(None, description="Билет POST /auth/ticket: EventSource не шлёт Authorization"),
+    last_event_id: Optional[str] = Header(None),
+    since: Optional[str] = Query(None, description="Last-Event-ID при новом EventSource (с новым билетом)"),
+):
+    """SSE-поток изменений списка: added / patched / deleted / version / imported (см. app.events).
+    Last-Event-ID — последняя увиденная версия: пропущенное повторяется из буфера."""
+    if not user_id and ticket:
+        user_id = check_ticket(ticket, list_id, "events")
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    try:
+        last_event_id = last_event_id or since
+        last_version = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_version = None
+    # подписка раньше чтения версии: ничего между ними не потеряется
+    try:
+        sub = events.hub.subscribe(list_id, user_id)
+    except events.TooManyStreams:
+        raise HTTPException(status_code=429, detail=f"Too many event streams (max {events.SSE_MAX_PER_USER})")
+    try:
+        # соединение БД — только на проверку, поток его не держит
+        async with get_conn() as conn:
+            if not await acl.get_permission(conn, user_id, list_id):
+                raise HTTPException(status_code=403, detail="Access denied")
+            version = await versions.list_version(conn, list_id)
+        if version is None:
+            raise HTTPException(status_code=403, detail="Access denied")
+    except BaseException:
+        events.hub.unsubscribe(sub)
+        raise
+    return StreamingResponse(
+        events.stream(sub, version, last_version, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 # --------- SHARING ----------
 @app.post("/share", status_code=201)
-def share_list(body: ShareIn, user_id: int = Depends(get_user_id)):
-    with get_conn() as conn:
-        cur = conn.cursor(dictionary=True)
-        cur.execute("SELECT id FROM users WHERE username=%s", (body.username,))
-        share_to = cur.fetchone()
+async def share_list(body: ShareIn, user_id: int = Depends(get_user_id)):
+    async with get_conn() as conn:
+        share_to = await queries.fetch_one(conn, "users.id_by_username", (body.username,))
         if not share_to:
             raise HTTPException(status_code=404, detail="User not found")
-        cur.execute("SELECT id FROM lists WHERE id=%s AND user_id=%s", (body.list_id, user_id))
-        if not cur.fetchone():
+        if await acl.get_permission(conn, user_id, body.list_id) != acl.OWNER:
             raise HTTPException(status_code=403, detail="Access denied")
-        cur.execute("""
-            INSERT INTO shared_lists (list_id, owner_id, shared_with_id) VALUES (%s,%s,%s)
-        """, (body.list_id, user_id, share_to["id"]))
-        conn.commit()
+        await conn.start_transaction()
+        await queries.run(conn, "shared_lists.insert", (body.list_id, user_id, share_to["id"]))
+        await versions.bump_users(conn, [share_to["id"]])
+        await conn.commit()
+    await acl.invalidate_list(body.list_id)
     return {"message": "List shared successfully"}
 
 @app.get("/shared_lists")
-def get_shared_lists(user_id: int = Depends(get_user_id)):
-    with get_conn() as conn:
-        cur = conn.cursor(dictionary=True)
-        cur.execute("""
-            SELECT lists.id, lists.name, u.username AS owner
-            FROM shared_lists s
-            JOIN lists ON s.list_id = lists.id
-            JOIN users u ON s.owner_id = u.id
-            WHERE s.shared_with_id=%s
-        """, (user_id,))
-        return cur.fetchall()
+async def get_shared_lists(request: Request, response: Response, user_id: int = Depends(get_user_id)):
+    async with get_conn() as conn:
+        etag = versions.make_etag("shared", user_id, *await versions.user_lists_version(conn, user_id, shared=True))
+        if (not_modified := versions.not_modified(request, etag)) is not None:
+            return not_modified
+        rows = await queries.fetch_all(conn, "shared_lists.for_user", (user_id,))
+    versions.set_validators(response, etag)
+    return rows
 
 # --------- LOGS (опционально) ----------
-@app.post("/logs")
+# События только ставятся в очередь app.logsink; в БД их пишет фоновая задача пачками
+
+LOG_BATCH_MAX = int(os.getenv("LOG_BATCH_MAX", "500"))
+
+
+def _log_row(data) -> tuple[str, str]:
+    if not isinstance(data, dict):
+        data = {}
+    return str(data.get("event", "unknown")), json.dumps(data.get("data", {}), ensure_ascii=False)
+
+
+@app.post("/logs", status_code=202)
 async def log_event(request: Request, user_id: Optional[int] = Depends(get_user_id)):
     data = {}
     try:
         data = (await request.json()) if hasattr(request, "json") else {}
     except Exception:
         pass
-    event = data.get("event", "unknown")
-    payload = json.dumps(data.get("data", {}), ensure_ascii=False)
-    with get_conn() as conn:
-        cur = conn.cursor()
-        cur.execute("INSERT INTO logs (event, data, user_id) VALUES (%s,%s,%s)", (event, payload, user_id or 0))
-        conn.commit()
-    return {"message": "Log entry saved"}
\ No newline at end of file
+    event, payload = _log_row(data)
+    accepted = logsink.sink.submit(event, payload, user_id or 0)
+    return {"message": "Log entry queued" if accepted else "Log entry dropped"}
+
+
+@app.post("/logs/batch", status_code=202)
+async def log_events(request: Request, user_id: Optional[int] = Depends(get_user_id)):
+    try:
+        batch = await request.json()
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid JSON")
+    if not isinstance(batch, list):
+        raise HTTPException(status_code=400, detail="Expected an array of events")
+    if len(batch) > LOG_BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"Batch too large (max {LOG_BATCH_MAX})")
+    accepted = sum(logsink.sink.submit(*_log_row(e), user_id or 0) for e in batch)
+    return {"accepted": accepted, "dropped": len(batch) - accepted}
+
+
+@app.get("/logs/stats", dependencies=[Depends(require_admin)])
+async def logs_stats():
+    """Очередь логов: глубина, отброшенные события, время записи пачек."""
+    return logsink.sink.stats()
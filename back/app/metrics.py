@@ -0,0 +1,167 @@
+"""Метрики в текстовом формате Prometheus (GET /metrics).
+
+Без внешних зависимостей: счётчики, gauge и гистограммы — словари по кортежу
+меток, observe() — bisect по границам бакетов. Этого достаточно, чтобы держать
+метрики включёнными всегда. Значения — на процесс; при нескольких воркерах
+каждый отдаёт свои (Prometheus суммирует по instance/pid).
+"""
+import time
+from bisect import bisect_left
+from typing import Iterable, Optional
+
+# Границы по умолчанию, сек: от быстрых SQL до медленного апстрима
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry: list["_Metric"] = []
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        _registry.append(self)
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        head = f"# HELP {self.name} {self.documentation}\n# TYPE {self.name} {self.kind}\n"
+        return head + "".join(line + "\n" for line in self.samples())
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self):
+        for labels, v in sorted(self.values.items()):
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_fmt(v)}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, *labels, value: float) -> None:
+        self.values[labels] = value
+
+    def dec(self, *labels, amount: float = 1) -> None:
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [счётчики по бакетам (+Inf последний), сумма]
+        self.values: dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels) -> None:
+        entry = self.values.get(labels)
+        if entry is None:
+            entry = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    def samples(self):
+        for labels, (counts, total) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts):
+                cumulative += count
+                le = f'le="{_fmt(bound)}"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {_fmt(total)}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}"
+
+
+def render() -> str:
+    return "".join(m.render() for m in _registry)
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# ---------- метрики приложения ----------
+
+HTTP_REQUESTS = Counter("twl_http_requests_total", "HTTP requests by route and status.", ("method", "route", "status"))
+HTTP_SECONDS = Histogram("twl_http_request_duration_seconds", "HTTP request latency by route.", ("method", "route"))
+
+DB_POOL_SIZE = Gauge("twl_db_pool_size", "Configured DB pool size.")
+DB_POOL_IN_USE = Gauge("twl_db_pool_in_use", "DB connections currently checked out.")
+DB_POOL_WAIT_SECONDS = Histogram("twl_db_pool_wait_seconds", "Time spent waiting for a pooled DB connection.")
+DB_POOL_TIMEOUTS = Counter("twl_db_pool_timeouts_total", "DB pool checkouts that timed out (503).")
+SQL_SECONDS = Histogram("twl_sql_duration_seconds", "SQL statement latency by query name.", ("query",))
+SQL_ERRORS = Counter("twl_sql_errors_total", "Failed SQL statements by query name.", ("query",))
+
+UPSTREAM_SECONDS = Histogram(
+    "twl_upstream_request_duration_seconds", "Upstream call latency.", ("upstream", "endpoint"),
+)
+UPSTREAM_ERRORS = Counter("twl_upstream_errors_total", "Failed upstream calls by kind.", ("upstream", "endpoint", "kind"))
+
+
+class MetricsMiddleware:
+    """ASGI-middleware: время и статус каждого HTTP-запроса по шаблону маршрута.
+    Метка route — путь из роутера (/items/batch), а не сырой URL: число рядов
+    ограничено числом маршрутов; всё несматченное — «unmatched»."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        started = time.perf_counter()
+        stream_started = None
+
+        async def send_wrapper(message):
+            nonlocal status, stream_started
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if dict(message.get("headers", ())).get(b"content-type", b"").startswith(b"text/event-stream"):
+                    # SSE живёт минутами: в латентность идёт время до начала потока
+                    stream_started = time.perf_counter()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            HTTP_SECONDS.observe((stream_started or time.perf_counter()) - started, method, path)
+            HTTP_REQUESTS.inc(method, path, str(status))
+
+
+def observe_upstream(upstream: str, endpoint: str, seconds: float, error: Optional[str] = None) -> None:
+    UPSTREAM_SECONDS.observe(seconds, upstream, endpoint)
+    if error:
+        UPSTREAM_ERRORS.inc(upstream, endpoint, error)
@@ -0,0 +1,245 @@
+"""Профилирование запросов: Server-Timing и журнал медленных SQL.
+
+Включается на лету (POST /admin/profiling, рассылается всем воркерам через
+app.bus) или PROFILING=1 при старте. Пока выключено, накладные расходы —
+одна проверка флага в middleware и contextvar.get() в курсоре.
+
+Во включённом режиме на каждый запрос заводится RequestProfile (contextvar):
+- db — все statement'ы через курсоры get_conn (число и суммарное время);
+- acl — проверки прав app.acl (включая их SQL);
+- upstream — вызовы Кинопоиска;
+- serialize — от возврата из эндпоинта до начала ответа (валидация + JSON).
+Они уходят в заголовок Server-Timing. Statement'ы дольше PROFILING_SLOW_MS
+пишутся JSON-строкой в логгер twl.slow_sql: имя, SQL, «форма» параметров
+(типы и длины, без значений) и EXPLAIN, снятый на отдельном соединении.
+"""
+import asyncio
+import functools
+import json
+import logging
+import os
+import re
+import time
+from contextlib import nullcontext
+from contextvars import ContextVar
+from typing import Any, Optional
+
+from fastapi.routing import APIRoute
+
+from . import bus
+
+CHANNEL = "profiling"
+PHASES = ("db", "acl", "upstream", "serialize")
+
+slow_log = logging.getLogger("twl.slow_sql")
+
+# Сколько EXPLAIN медленных SQL может выполняться одновременно (остальные — без плана)
+PROFILING_MAX_EXPLAINS = int(os.getenv("PROFILING_MAX_EXPLAINS", "2"))
+_explain_tasks: set[asyncio.Task] = set()
+
+
+class ProfilingState:
+    def __init__(self):
+        self.enabled = os.getenv("PROFILING", "0") == "1"
+        self.slow_ms = float(os.getenv("PROFILING_SLOW_MS", "200"))
+
+    def as_dict(self) -> dict:
+        return {"enabled": self.enabled, "slow_ms": self.slow_ms}
+
+
+state = ProfilingState()
+
+
+class RequestProfile:
+    __slots__ = ("scope", "phases", "statements", "endpoint_done")
+
+    def __init__(self, scope: dict):
+        self.scope = scope
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.statements = 0
+        self.endpoint_done: Optional[float] = None
+
+    @property
+    def route(self) -> str:
+        # шаблон маршрута появляется в scope после роутинга
+        return getattr(self.scope.get("route"), "path", None) or self.scope.get("path", "")
+
+    def add(self, phase: str, seconds: float) -> None:
+        self.phases[phase] += seconds
+
+    def server_timing(self, total: float) -> str:
+        parts = []
+        for name in PHASES:
+            desc = f';desc="{self.statements} queries"' if name == "db" else ""
+            parts.append(f"{name};dur={self.phases[name] * 1000:.2f}{desc}")
+        parts.append(f"total;dur={total * 1000:.2f}")
+        return ", ".join(parts)
+
+
+_current: ContextVar[Optional[RequestProfile]] = ContextVar("twl_profile", default=None)
+
+
+def current() -> Optional[RequestProfile]:
+    return _current.get()
+
+
+class _Phase:
+    __slots__ = ("profile", "name", "started")
+
+    def __init__(self, profile: RequestProfile, name: str):
+        self.profile = profile
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.profile.add(self.name, time.perf_counter() - self.started)
+
+
+_NULL = nullcontext()
+
+
+def phase(name: str):
+    """`with profiling.phase("acl"):` — время участка кода; без профиля — no-op."""
+    profile = _current.get()
+    return _NULL if profile is None else _Phase(profile, name)
+
+
+# ---------- SQL ----------
+
+def _shape(value: Any) -> Any:
+    """Тип и размер параметра без самого значения (в логе не должно быть данных)."""
+    if isinstance(value, (list, tuple)):
+        return [_shape(v) for v in value[:20]] + (["..."] if len(value) > 20 else [])
+    if isinstance(value, dict):
+        return {k: _shape(v) for k, v in value.items()}
+    if isinstance(value, (str, bytes)):
+        return f"{type(value).__name__}({len(value)})"
+    return type(value).__name__
+
+
+def _one_line(sql: str) -> str:
+    return re.sub(r"\s+", " ", sql).strip()
+
+
+def record_sql(name: str, operation: str, params: Any, seconds: float, many: bool = False) -> None:
+    """Зовётся курсором get_conn после каждого statement'а."""
+    profile = _current.get()
+    if profile is None:
+        return
+    profile.statements += 1
+    profile.add("db", seconds)
+    if seconds * 1000 >= state.slow_ms:
+        entry = {
+            "query": name,
+            "ms": round(seconds * 1000, 2),
+            "route": profile.route,
+            "sql": _one_line(operation),
+            "params": {"rows": len(params), "shape": _shape(params[0]) if params else None} if many else _shape(params),
+        }
+        can_explain = not many and operation.lstrip()[:6].upper() in ("SELECT", "UPDATE", "DELETE")
+        if can_explain and _explain_slot_free():
+            task = asyncio.get_running_loop().create_task(_log_with_explain(entry, operation, params))
+            _explain_tasks.add(task)  # сильная ссылка: иначе задачу может собрать GC
+            task.add_done_callback(_explain_tasks.discard)
+        else:
+            if can_explain:
+                entry["explain_skipped"] = "busy"
+            slow_log.warning(json.dumps(entry, ensure_ascii=False, default=str))
+
+
+def _explain_slot_free() -> bool:
+    """EXPLAIN берёт отдельное соединение: не больше PROFILING_MAX_EXPLAINS сразу
+    и никогда — из пула, в котором уже ждут запросы (медленные SQL чаще всего
+    как раз под нагрузкой)."""
+    from .db import DB_POOL_SIZE, pool_stats
+
+    return len(_explain_tasks) < PROFILING_MAX_EXPLAINS and pool_stats.in_use < DB_POOL_SIZE
+
+
+async def _log_with_explain(entry: dict, operation: str, params: Any) -> None:
+    from .db import get_conn  # db сам импортирует этот модуль
+
+    # EXPLAIN — на своём соединении и вне профиля запроса
+    _current.set(None)
+    try:
+        async with get_conn() as conn:
+            cur = await conn.cursor(dictionary=True)
+            await cur.execute("EXPLAIN " + operation, params)
+            entry["explain"] = await cur.fetchall()
+    except Exception as e:
+        entry["explain_error"] = repr(e)
+    slow_log.warning(json.dumps(entry, ensure_ascii=False, default=str))
+
+
+# ---------- маршруты и middleware ----------
+
+def _mark_endpoint_done(endpoint):
+    if not asyncio.iscoroutinefunction(endpoint):
+        return endpoint
+
+    @functools.wraps(endpoint)
+    async def wrapper(*args, **kwargs):
+        try:
+            return await endpoint(*args, **kwargs)
+        finally:
+            profile = _current.get()
+            if profile is not None:
+                profile.endpoint_done = time.perf_counter()
+
+    return wrapper
+
+
+class ProfiledRoute(APIRoute):
+    """Маршрут, отмечающий момент возврата из эндпоинта (начало фазы serialize)."""
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, _mark_endpoint_done(endpoint), **kwargs)
+
+
+class ProfilingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not state.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(scope)
+        token = _current.set(profile)
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                now = time.perf_counter()
+                if profile.endpoint_done is not None:
+                    profile.add("serialize", now - profile.endpoint_done)
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", profile.server_timing(now - started).encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+
+
+# ---------- переключение на лету ----------
+
+async def configure(enabled: Optional[bool] = None, slow_ms: Optional[float] = None) -> dict:
+    """Включить/выключить во всех воркерах."""
+    message = {"enabled": state.enabled if enabled is None else enabled,
+               "slow_ms": state.slow_ms if slow_ms is None else slow_ms}
+    await bus.publish(CHANNEL, message)
+    return state.as_dict()
+
+
+def _on_configure(message: dict) -> None:
+    state.enabled = bool(message["enabled"])
+    state.slow_ms = float(message["slow_ms"])
+
+
+bus.subscribe(CHANNEL, _on_configure)
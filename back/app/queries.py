@@ -0,0 +1,503 @@
+"""Реестр SQL-выражений: все горячие запросы по именам.
+
+Выражение с prepared=True готовится на сервере один раз на соединение пула
+(COM_STMT_PREPARE) и дальше выполняется бинарным протоколом по id — без
+разбора SQL на каждом запросе. Подготовленные id живут на соединении
+коннектора (pool_reset_session=False их не сбрасывает); если соединение
+переподключилось или сервер забыл выражение — готовим заново.
+
+Запросы с переменным числом плейсхолдеров (IN по пачке id, многострочные
+INSERT, executemany) остаются текстовыми шаблонами ({ids}, {rows}, {fields}),
+но тоже идут через реестр: имя попадает в метрики и журнал медленных SQL
+вместо разобранного «select:items».
+
+Все варианты страницы GET /items (колонка сортировки x направление x фильтр
+по жанрам x вид пагинации) собираются при импорте: ни одного f-string на запрос.
+"""
+import time
+import weakref
+from functools import lru_cache
+from typing import Any, AsyncIterator, Optional, Sequence
+
+from mysql.connector import errors
+
+from . import metrics
+from .db import record_statement
+
+ER_UNKNOWN_STMT_HANDLER = 1243
+
+
+class Statement:
+    __slots__ = ("name", "sql", "prepared")
+
+    def __init__(self, name: str, sql: str, prepared: bool = True):
+        self.name = name
+        # в одну строку — так же выглядит в журнале медленных SQL
+        self.sql = " ".join(sql.split())
+        self.prepared = prepared
+
+
+STATEMENTS: dict[str, Statement] = {}
+
+
+def register(name: str, sql: str, prepared: bool = True) -> Statement:
+    if name in STATEMENTS:
+        raise ValueError(f"statement {name!r} already registered")
+    stmt = STATEMENTS[name] = Statement(name, sql, prepared)
+    return stmt
+
+
+class Result:
+    """Строки кортежами + имена колонок; словари — только по запросу."""
+
+    __slots__ = ("columns", "rows", "rowcount", "lastrowid")
+
+    def __init__(self, columns: Sequence[str] = (), rows: Optional[list] = None, rowcount: int = 0,
+                 lastrowid: Optional[int] = None):
+        self.columns = tuple(columns)
+        self.rows = rows or []
+        self.rowcount = rowcount
+        self.lastrowid = lastrowid
+
+    def dicts(self) -> list[dict]:
+        names = self.columns
+        return [dict(zip(names, row)) for row in self.rows]
+
+    def first(self) -> Optional[dict]:
+        return dict(zip(self.columns, self.rows[0])) if self.rows else None
+
+    def scalar(self) -> Any:
+        return self.rows[0][0] if self.rows else None
+
+
+# ---------- выполнение ----------
+
+class _Prepared:
+    __slots__ = ("connection_id", "handles")
+
+    def __init__(self, connection_id):
+        self.connection_id = connection_id
+        self.handles: dict[str, dict] = {}
+
+
+# соединение коннектора -> подготовленные на нём выражения
+_prepared: "weakref.WeakKeyDictionary[Any, _Prepared]" = weakref.WeakKeyDictionary()
+
+
+def _raw(db):
+    """TimedConnection / TimedCursor из app.db -> соединение коннектора."""
+    return db.raw_connection
+
+
+async def _handle(cnx, stmt: Statement) -> dict:
+    state = _prepared.get(cnx)
+    if state is None or state.connection_id != cnx.connection_id:
+        # новое или переподключённое соединение: старые id недействительны
+        state = _prepared[cnx] = _Prepared(cnx.connection_id)
+    handle = state.handles.get(stmt.name)
+    if handle is None:
+        handle = await cnx.cmd_stmt_prepare(stmt.sql.replace("%s", "?").encode("utf-8"))
+        state.handles[stmt.name] = handle
+    return handle
+
+
+def _forget(cnx, stmt: Statement) -> None:
+    state = _prepared.get(cnx)
+    if state is not None:
+        state.handles.pop(stmt.name, None)
+
+
+async def _run_prepared(cnx, stmt: Statement, params: Sequence) -> Result:
+    for attempt in (0, 1):
+        handle = await _handle(cnx, stmt)
+        try:
+            res = await cnx.cmd_stmt_execute(handle["statement_id"], data=params, parameters=handle["parameters"])
+            break
+        except errors.Error as e:
+            if attempt or e.errno != ER_UNKNOWN_STMT_HANDLER:
+                raise
+            _forget(cnx, stmt)  # сервер выражение не знает — готовим ещё раз
+    if isinstance(res, dict):  # OK-пакет: INSERT/UPDATE/DELETE
+        return Result(rowcount=res.get("affected_rows", 0), lastrowid=res.get("insert_id") or None)
+    _, columns, _ = res
+    cnx.unread_result = True
+    rows, _ = await cnx.get_rows(binary=True, columns=columns)
+    return Result([c[0] for c in columns], rows, len(rows))
+
+
+async def _run_text(cnx, stmt: Statement, params: Sequence, many: bool) -> Result:
+    cur = await cnx.cursor()
+    try:
+        if many:
+            await cur.executemany(stmt.sql, params)
+        else:
+            await cur.execute(stmt.sql, params)
+        rows = await cur.fetchall() if cur.with_rows else []
+        return Result(cur.column_names if cur.with_rows else (), rows, cur.rowcount, cur.lastrowid or None)
+    finally:
+        await cur.close()
+
+
+@lru_cache(maxsize=4096)
+def _expand(name: str, parts: tuple) -> Statement:
+    return Statement(name, STATEMENTS[name].sql.format(**dict(parts)), prepared=False)
+
+
+def _statement(name: str, parts: dict) -> Statement:
+    return _expand(name, tuple(sorted(parts.items()))) if parts else STATEMENTS[name]
+
+
+async def run(db, name: str, params: Sequence = (), **parts: str) -> Result:
+    """Выполнить выражение из реестра на соединении `db` (или соединении курсора).
+    `parts` заполняют шаблон текстового выражения: ids=placeholders(n) и т.п."""
+    stmt = _statement(name, parts)
+    cnx = _raw(db)
+    started = time.perf_counter()
+    try:
+        if stmt.prepared:
+            return await _run_prepared(cnx, stmt, tuple(params))
+        return await _run_text(cnx, stmt, params, many=False)
+    except Exception:
+        metrics.SQL_ERRORS.inc(name)
+        raise
+    finally:
+        record_statement(name, stmt.sql, params, time.perf_counter() - started)
+
+
+async def run_many(db, name: str, seq_params: Sequence[Sequence], **parts: str) -> Result:
+    """executemany текстовым протоколом: многострочный INSERT коннектор склеивает в один запрос."""
+    stmt = _statement(name, parts)
+    if not seq_params:
+        return Result()
+    started = time.perf_counter()
+    try:
+        return await _run_text(_raw(db), stmt, seq_params, many=True)
+    except Exception:
+        metrics.SQL_ERRORS.inc(name)
+        raise
+    finally:
+        record_statement(name, stmt.sql, seq_params, time.perf_counter() - started, many=True)
+
+
+async def stream(db, name: str, params: Sequence = (), size: int = 1000, **parts: str) -> AsyncIterator[list[tuple]]:
+    """Строки пачками по `size` с небуферизованного курсора: в памяти одна пачка,
+    а не весь результат. Соединение занято, пока результат не дочитан; брошенное
+    на середине чтение закрывает соединение (пул переподключит его при выдаче) —
+    дешевле, чем впустую дочитывать остаток."""
+    stmt = _statement(name, parts)
+    cnx = _raw(db)
+    cur = await cnx.cursor(buffered=False)
+    try:
+        started = time.perf_counter()
+        try:
+            await cur.execute(stmt.sql, params)
+        except Exception:
+            metrics.SQL_ERRORS.inc(name)
+            raise
+        finally:
+            # время до первых строк: дальше чтение идёт со скоростью потребителя
+            record_statement(name, stmt.sql, params, time.perf_counter() - started)
+        while rows := await cur.fetchmany(size):
+            yield rows
+    finally:
+        if cnx.unread_result:
+            await cnx.disconnect()
+        else:
+            await cur.close()
+
+
+async def fetch_all(db, name: str, params: Sequence = ()) -> list[dict]:
+    return (await run(db, name, params)).dicts()
+
+
+async def fetch_one(db, name: str, params: Sequence = ()) -> Optional[dict]:
+    return (await run(db, name, params)).first()
+
+
+@lru_cache(maxsize=1024)
+def placeholders(n: int) -> str:
+    return ",".join(["%s"] * n)
+
+
+@lru_cache(maxsize=1024)
+def value_rows(row: str, n: int) -> str:
+    """«(%s,%s),(%s,%s),...» для многострочного INSERT."""
+    return ",".join([row] * n)
+
+
+# ---------- пользователи и авторизация ----------
+
+register("users.by_username", "SELECT * FROM users WHERE username=%s")
+register("users.id_by_username", "SELECT id FROM users WHERE username=%s")
+register("users.credentials", "SELECT id, password FROM users WHERE username=%s")
+register("users.insert", "INSERT INTO users (username, password) VALUES (%s, %s)")
+register("users.rehash", "UPDATE users SET password=%s WHERE id=%s AND password=%s")
+register("auth.revoke", "INSERT IGNORE INTO revoked_tokens (digest, expires_at) VALUES (%s, FROM_UNIXTIME(%s))")
+register("auth.is_revoked", "SELECT 1 FROM revoked_tokens WHERE digest=%s")
+# уборка заодно с каждым logout: истёкшие токены отвергает сам jwt.decode
+register("auth.purge_revoked", "DELETE FROM revoked_tokens WHERE expires_at < NOW() LIMIT 1000")
+
+# ---------- права (app.acl) ----------
+
+register("acl.permission", """
+    SELECT 'owner' AS perm FROM lists WHERE id=%s AND user_id=%s
+    UNION ALL
+    SELECT 'shared' FROM shared_lists WHERE list_id=%s AND shared_with_id=%s
+    ORDER BY perm
+    LIMIT 1
+""")
+register("acl.item_list", "SELECT list_id FROM items WHERE id=%s")
+
+# ---------- версии для ETag (app.versions) ----------
+
+register("versions.list", "SELECT version FROM lists WHERE id=%s")
+# /lists и /shared_lists показывают сводку списков: в ETag — ещё и сумма их lists.version
+# (версии только растут, так что сумма меняется при любом изменении любого из списков)
+register("versions.user_lists", """
+    SELECT COALESCE((SELECT version FROM user_versions WHERE user_id=%s), 0), COALESCE(SUM(version), 0)
+    FROM lists WHERE user_id=%s
+""")
+register("versions.shared_lists", """
+    SELECT COALESCE((SELECT version FROM user_versions WHERE user_id=%s), 0), COALESCE(SUM(l.version), 0)
+    FROM shared_lists s JOIN lists l ON l.id = s.list_id
+    WHERE s.shared_with_id=%s
+""")
+register("versions.bump_list", "UPDATE lists SET version=version+1 WHERE id=%s")
+register("versions.bump_lists", "UPDATE lists SET version=version+1 WHERE id IN ({ids})", prepared=False)
+register("versions.bump_user", """
+    INSERT INTO user_versions (user_id, version) VALUES (%s,1) ON DUPLICATE KEY UPDATE version=version+1
+""")
+register("versions.bump_users", """
+    INSERT INTO user_versions (user_id, version) VALUES {rows} ON DUPLICATE KEY UPDATE version=version+1
+""", prepared=False)
+register("versions.list_members", """
+    SELECT user_id FROM lists WHERE id=%s
+    UNION
+    SELECT shared_with_id FROM shared_lists WHERE list_id=%s
+""")
+
+# ---------- списки и шаринг ----------
+
+register("lists.by_user", "SELECT * FROM lists WHERE user_id=%s")
+register("lists.insert", "INSERT INTO lists (user_id, name) VALUES (%s, %s)")
+register("lists.rename", """
+    UPDATE lists SET name=%s, version=LAST_INSERT_ID(version+1), last_modified=CURRENT_TIMESTAMP WHERE id=%s
+""")
+register("lists.delete", "DELETE FROM lists WHERE id=%s")
+register("shared_lists.insert", "INSERT INTO shared_lists (list_id, owner_id, shared_with_id) VALUES (%s,%s,%s)")
+register("shared_lists.for_user", """
+    SELECT lists.id, lists.name, u.username AS owner,
+           lists.item_count, lists.watched_count, lists.last_modified, lists.top_genres
+    FROM shared_lists s
+    JOIN lists ON s.list_id = lists.id
+    JOIN users u ON s.owner_id = u.id
+    WHERE s.shared_with_id=%s
+""")
+
+# ---------- сводка по спискам (app.list_stats) ----------
+
+# Сколько самых частых жанров держать в lists.top_genres
+LIST_TOP_GENRES = 3
+
+# заодно бампает lists.version: ETag /items и /lists — тем же UPDATE.
+# LAST_INSERT_ID(expr) возвращает новую версию в OK-пакете (insert_id) — без SELECT
+register("list_stats.apply", """
+    UPDATE lists
+    SET item_count=item_count+%s, watched_count=watched_count+%s,
+        last_modified=CURRENT_TIMESTAMP, version=LAST_INSERT_ID(version+1)
+    WHERE id=%s
+""")
+# по индексу item_genres (list_id, genre, item_id); пустой список -> NULL
+register("list_stats.top_genres", f"""
+    UPDATE lists SET top_genres=(
+        SELECT GROUP_CONCAT(genre ORDER BY n DESC, genre SEPARATOR ', ')
+        FROM (SELECT genre, COUNT(*) AS n FROM item_genres WHERE list_id=%s
+              GROUP BY genre ORDER BY n DESC, genre LIMIT {LIST_TOP_GENRES}) AS top
+    )
+    WHERE id=%s
+""")
+
+# ---------- элементы ----------
+
+register("items.insert", "INSERT INTO items (list_id, title, type, cover_url, genre) VALUES (%s,%s,%s,%s,%s)")
+# RETURNING id (MariaDB): id строк в порядке VALUES — подряд они идут не при любом innodb_autoinc_lock_mode
+register("items.insert_batch",
+         "INSERT INTO items (list_id, title, type, cover_url, genre) VALUES {rows} RETURNING id",
+         prepared=False)
+# импорт: все колонки, которые есть в файле выгрузки (app.transfer)
+register("items.import_batch",
+         "INSERT INTO items (list_id, title, type, cover_url, genre, year, rating, watched, description) "
+         "VALUES {rows} RETURNING id",
+         prepared=False)
+# набор полей PATCH переменный — текстом, SET собирает items._patch_fields
+register("items.update", "UPDATE items SET {fields} WHERE id=%s AND list_id=%s", prepared=False)
+# RETURNING (MariaDB) — чтобы поправить watched_count без отдельного SELECT
+register("items.delete", "DELETE FROM items WHERE id=%s AND list_id=%s RETURNING watched")
+register("items.delete_batch", "DELETE FROM items WHERE id IN ({ids})", prepared=False)
+register("items.lock_batch", "SELECT id, list_id, watched FROM items WHERE id IN ({ids}) FOR UPDATE",
+         prepared=False)
+# старое watched перед PATCH: дельта для lists.watched_count
+register("items.lock_watched", "SELECT watched FROM items WHERE id=%s AND list_id=%s FOR UPDATE")
+register("item_genres.insert", "INSERT IGNORE INTO item_genres (item_id, list_id, genre) VALUES (%s,%s,%s)",
+         prepared=False)
+register("item_genres.delete_item", "DELETE FROM item_genres WHERE item_id=%s")
+register("item_genres.delete_items", "DELETE FROM item_genres WHERE item_id IN ({ids})", prepared=False)
+register("item_genres.delete_list", "DELETE FROM item_genres WHERE list_id=%s")
+# уникальные жанры прямо из индекса item_genres (list_id, genre, ...)
+register("item_genres.for_list", "SELECT DISTINCT genre FROM item_genres WHERE list_id=%s ORDER BY genre")
+
+register("item_title_tokens.insert", "INSERT IGNORE INTO item_title_tokens (list_id, token, item_id) VALUES (%s,%s,%s)",
+         prepared=False)
+register("item_title_tokens.delete_item", "DELETE FROM item_title_tokens WHERE item_id=%s")
+register("item_title_tokens.delete_items", "DELETE FROM item_title_tokens WHERE item_id IN ({ids})", prepared=False)
+register("item_title_tokens.delete_list", "DELETE FROM item_title_tokens WHERE list_id=%s")
+
+# ---------- страница GET /items ----------
+
+# Белый список колонок сортировки (ключ=имя из API → значение=SQL-выражение)
+SORT_WHITELIST: dict[str, str] = {
+    "created_at": "i.id",
+    "title":      "i.title",
+    "year":       "i.year",
+    "rating":     "i.rating",
+    "genre":      "i.genre"
+}
+
+# Сколько жанров можно передать в один фильтр: столько слотов IN у выражения,
+# лишние заполняются NULL (NULL в IN ничего не находит)
+MAX_GENRE_FILTERS = 10
+
+GENRE_FILTERS = ("none", "any", "all")
+# offset — старые клиенты; after — keyset после (значение, id); after_null — после (NULL, id)
+PAGE_MODES = ("offset", "after", "after_null")
+
+
+def _genre_sql(mode: str) -> str:
+    """Точное совпадение жанра через индекс (list_id, genre, item_id)."""
+    if mode == "none":
+        return ""
+    sub = f"SELECT g.item_id FROM item_genres g WHERE g.list_id=%s AND g.genre IN ({placeholders(MAX_GENRE_FILTERS)})"
+    if mode == "all":
+        sub += " GROUP BY g.item_id HAVING COUNT(*)=%s"
+    return f" AND i.id IN ({sub})"
+
+
+def _keyset_sql(column: str, ascending: bool, mode: str) -> str:
+    """WHERE для строк строго после (value, last_id) в порядке сортировки.
+    NULL в MariaDB идут первыми при ASC и последними при DESC — учитываем это явно.
+    Параметры: after — (value, value, id), для i.id — (id); after_null — (id)."""
+    op = ">" if ascending else "<"
+    if mode == "offset":
+        return ""
+    if column == "i.id":
+        return f" AND i.id {op} %s"
+    if mode == "after_null":
+        if ascending:
+            return f" AND (({column} IS NULL AND i.id > %s) OR {column} IS NOT NULL)"
+        return f" AND ({column} IS NULL AND i.id < %s)"
+    cond = f"({column} {op} %s OR ({column} = %s AND i.id {op} %s)"
+    if not ascending:
+        cond += f" OR {column} IS NULL"
+    return f" AND {cond})"
+
+
+def page_statement(sort_by: str, ascending: bool, genre_filter: str, page_mode: str) -> str:
+    """Имя готового варианта страницы."""
+    if SORT_WHITELIST[sort_by] == "i.id" and page_mode == "after_null":
+        page_mode = "after"  # у id не бывает NULL
+    return f"items.page.{sort_by}.{'asc' if ascending else 'desc'}.{genre_filter}.{page_mode}"
+
+
+def _build_pages() -> None:
+    for sort_by, column in SORT_WHITELIST.items():
+        for ascending in (True, False):
+            direction = "ASC" if ascending else "DESC"
+            # стабильная сортировка добавочно по id (если сортируем не по нему же)
+            order = f"i.id {direction}" if column == "i.id" else f"{column} {direction}, i.id {direction}"
+            for genre_filter in GENRE_FILTERS:
+                for page_mode in PAGE_MODES:
+                    name = page_statement(sort_by, ascending, genre_filter, page_mode)
+                    if name in STATEMENTS:
+                        continue
+                    # limit+1: лишняя строка честно говорит, есть ли ещё
+                    limit = "LIMIT %s OFFSET %s" if page_mode == "offset" else "LIMIT %s"
+                    register(name, f"""
+                        SELECT i.* FROM items i
+                        WHERE i.list_id=%s{_genre_sql(genre_filter)}{_keyset_sql(column, ascending, page_mode)}
+                        ORDER BY {order}
+                        {limit}
+                    """)
+
+
+_build_pages()
+
+
+# ---------- поиск по названиям GET /items/search ----------
+
+# Сколько слов запроса учитывается (остальные отбрасываются): на каждое — свой
+# вариант выражения, как у страниц
+MAX_SEARCH_TERMS = 5
+
+
+def search_statement(n_terms: int, after: bool) -> str:
+    return f"items.search.{n_terms}.{'after' if after else 'first'}"
+
+
+def _build_search() -> None:
+    """Каждое слово — диапазон по (list_id, token) в доступных списках: точное
+    совпадение или префикс. Элемент должен найтись по всем словам; score =
+    число слов + число точных совпадений. Keyset по (score, id), оба по убыванию.
+    Параметры: (user_id, user_id), по слову (слово, «слово%»), [score, score, id], limit."""
+    for n in range(1, MAX_SEARCH_TERMS + 1):
+        hits = " UNION ALL ".join(["""
+            SELECT tk.item_id, MAX(tk.token=%s) AS exact
+            FROM access a JOIN item_title_tokens tk ON tk.list_id=a.id AND tk.token LIKE %s
+            GROUP BY tk.item_id
+        """] * n)
+        for after in (False, True):
+            keyset = "WHERE m.score < %s OR (m.score = %s AND i.id < %s)" if after else ""
+            register(search_statement(n, after), f"""
+                WITH access AS (
+                    SELECT id FROM lists WHERE user_id=%s
+                    UNION
+                    SELECT list_id FROM shared_lists WHERE shared_with_id=%s
+                )
+                SELECT i.id, i.list_id, l.name AS list_name, i.title, i.type, i.cover_url,
+                       i.genre, i.year, i.rating, i.watched, m.score
+                FROM (
+                    SELECT hit.item_id, CAST(COUNT(*) + SUM(hit.exact) AS UNSIGNED) AS score
+                    FROM ({hits}) AS hit
+                    GROUP BY hit.item_id
+                    HAVING COUNT(*) = {n}
+                ) AS m
+                JOIN items i ON i.id = m.item_id
+                JOIN lists l ON l.id = i.list_id
+                {keyset}
+                ORDER BY m.score DESC, i.id DESC
+                LIMIT %s
+            """)
+
+
+_build_search()
+
+
+# ---------- обложки GET /covers ----------
+
+register("covers.item_url", "SELECT cover_url FROM items WHERE id=%s")
+register("covers.title_url", "SELECT poster_url, poster_preview_url FROM titles WHERE kp_id=%s")
+
+
+# ---------- выгрузка и загрузка списка (app.transfer) ----------
+
+register("transfer.export", """
+    SELECT id, title, type, year, rating, genre, cover_url, watched, description
+    FROM items WHERE list_id=%s ORDER BY id
+""", prepared=False)
+# ключи дедупликации импорта: нормализуются в Python (app.textnorm), а не collation'ом
+register("transfer.keys", "SELECT title, type FROM items WHERE list_id=%s", prepared=False)
+# обогащение из каталога: лучшие по рейтингу — первыми
+register("transfer.titles_by_names", """
+    SELECT name_norm, type, year, rating_kp, poster_url, genres, description
+    FROM titles WHERE name_norm IN ({ids})
+    ORDER BY rating_kp IS NULL, rating_kp DESC, kp_id
+""", prepared=False)
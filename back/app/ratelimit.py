@@ -0,0 +1,178 @@
+"""Лимиты ключа kinopoisk.dev: запросов в секунду и запросов в сутки.
+
+Состояние (token bucket + счётчик за сутки) лежит в небольшом JSON-файле под
+fcntl-блокировкой, поэтому его делят все uvicorn-воркеры и скрипты на хосте.
+Интерактивные запросы (/kinopoisk/search, /description) идут вперёд пакетных
+(fill_years.py): ждущий интерактивный отмечает в том же файле, до какого
+момента ему нужен токен, и пакетные в любом процессе до тех пор не берут
+токены. Последние KP_INTERACTIVE_RESERVE запросов суток пакетным не
+достаются вовсе. Если бюджета нет, в апстрим не ходим: 429 + Retry-After.
+"""
+import asyncio
+import fcntl
+import json
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from fastapi import HTTPException
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+
+KP_RATE_PER_SEC = float(os.getenv("KP_RATE_PER_SEC", "5"))
+KP_RATE_BURST = float(os.getenv("KP_RATE_BURST", str(KP_RATE_PER_SEC)))
+KP_DAILY_QUOTA = int(os.getenv("KP_DAILY_QUOTA", "200"))
+# Сколько запросов суток оставить только интерактивным
+KP_INTERACTIVE_RESERVE = int(os.getenv("KP_INTERACTIVE_RESERVE", str(KP_DAILY_QUOTA // 5)))
+# Сколько интерактивный запрос готов ждать токен, прежде чем получить 429
+KP_RATE_MAX_WAIT = float(os.getenv("KP_RATE_MAX_WAIT", "2"))
+# Сутки квоты считаются по UTC+N (kinopoisk.dev — по Москве)
+KP_QUOTA_UTC_OFFSET = float(os.getenv("KP_QUOTA_UTC_OFFSET", "3"))
+KP_RATELIMIT_FILE = os.getenv(
+    "KP_RATELIMIT_FILE", os.path.join(tempfile.gettempdir(), "twl_kp_ratelimit.json")
+)
+
+
+class QuotaExhausted(HTTPException):
+    def __init__(self, retry_after: float, detail: str):
+        super().__init__(
+            status_code=429,
+            detail=detail,
+            headers={"Retry-After": str(max(1, int(retry_after + 0.999)))},
+        )
+
+
+class RateLimiter:
+    def __init__(self, path: str, rate: float, burst: float, daily_quota: int, reserve: int):
+        self.path = path
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self.daily_quota = daily_quota
+        self.reserve = min(reserve, daily_quota)
+        self._tz = timezone(timedelta(hours=KP_QUOTA_UTC_OFFSET))
+        self.granted = {INTERACTIVE: 0, BATCH: 0}
+        self.waited = 0
+        self.rejected = 0
+
+    # ---------- общее состояние в файле ----------
+
+    def _today(self) -> str:
+        return datetime.now(self._tz).date().isoformat()
+
+    def _seconds_to_reset(self) -> float:
+        now = datetime.now(self._tz)
+        midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time(), self._tz)
+        return (midnight - now).total_seconds()
+
+    def _update(self, fn):
+        """fn(state) под эксклюзивной блокировкой файла; изменения сохраняются.
+        flock ждёт другие процессы — из event loop вызывается через _locked."""
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            raw = os.read(fd, 4096)
+            try:
+                state = json.loads(raw) if raw else {}
+            except ValueError:
+                state = {}
+            now, today = time.time(), self._today()
+            if state.get("day") != today:
+                state.update(day=today, used=0)
+            # пополняем bucket за прошедшее время
+            elapsed = max(0.0, now - state.get("ts", now))
+            state["tokens"] = min(self.burst, state.get("tokens", self.burst) + elapsed * self.rate)
+            state["ts"] = now
+            result = fn(state)
+            data = json.dumps(state).encode()
+            os.lseek(fd, 0, os.SEEK_SET)
+            os.ftruncate(fd, 0)
+            os.write(fd, data)
+            return result
+        finally:
+            os.close(fd)  # закрытие снимает flock
+
+    async def _locked(self, fn):
+        return await asyncio.to_thread(self._update, fn)
+
+    async def _try_take(self, priority: str) -> float:
+        """0 — запрос разрешён; >0 — через сколько секунд будет токен."""
+        limit = self.daily_quota - (self.reserve if priority == BATCH else 0)
+
+        def take(state):
+            if state["used"] >= limit:
+                return None
+            now = state["ts"]
+            # пакетные уступают, пока какой-нибудь процесс ждёт токен для интерактивного
+            if priority == BATCH and now < state.get("interactive_until", 0):
+                return state["interactive_until"] - now + 1 / self.rate
+            if state["tokens"] >= 1:
+                state["tokens"] -= 1
+                state["used"] += 1
+                return 0.0
+            wait = (1 - state["tokens"]) / self.rate
+            if priority == INTERACTIVE:
+                # спрос виден всем процессам: до повторной попытки и ещё один интервал
+                state["interactive_until"] = max(state.get("interactive_until", 0), now + wait + 1 / self.rate)
+            return wait
+
+        wait = await self._locked(take)
+        if wait is None:
+            self.rejected += 1
+            lane = "" if priority == INTERACTIVE else " for batch requests"
+            raise QuotaExhausted(self._seconds_to_reset(), f"Kinopoisk daily quota exhausted{lane}")
+        return wait
+
+    # ---------- API ----------
+
+    async def acquire(self, priority: str = INTERACTIVE, max_wait: Optional[float] = None) -> None:
+        """Дождаться права на один запрос к апстриму или получить 429.
+        Интерактивные ждут не дольше KP_RATE_MAX_WAIT, пакетные — сколько нужно
+        (но суточная квота всё равно обрывает их сразу)."""
+        if max_wait is None:
+            max_wait = KP_RATE_MAX_WAIT if priority == INTERACTIVE else float("inf")
+        deadline = time.monotonic() + max_wait
+        waited = False
+        while True:
+            wait = await self._try_take(priority)
+            if wait == 0:
+                self.granted[priority] += 1
+                self.waited += waited
+                return
+            if time.monotonic() + wait > deadline:
+                self.rejected += 1
+                raise QuotaExhausted(wait, "Kinopoisk rate limit, try again later")
+            waited = True
+            await asyncio.sleep(wait)
+
+    async def mark_exhausted(self) -> None:
+        """Апстрим сам сказал, что квота кончилась (например, другой клиент с тем же ключом)."""
+        def exhaust(state):
+            state["used"] = max(state["used"], self.daily_quota)
+        await self._locked(exhaust)
+
+    async def quota(self) -> dict:
+        state = await self._locked(lambda s: dict(s))
+        used = state["used"]
+        return {
+            "daily_quota": self.daily_quota,
+            "used": used,
+            "remaining": max(0, self.daily_quota - used),
+            "batch_remaining": max(0, self.daily_quota - self.reserve - used),
+            "resets_in": int(self._seconds_to_reset()),
+            "tokens": round(state["tokens"], 2),
+            "rate_per_sec": self.rate,
+        }
+
+    async def stats(self) -> dict:
+        return {
+            **await self.quota(),
+            "granted": dict(self.granted),
+            "waited": self.waited,
+            "rejected": self.rejected,
+        }
+
+
+limiter = RateLimiter(KP_RATELIMIT_FILE, KP_RATE_PER_SEC, KP_RATE_BURST, KP_DAILY_QUOTA, KP_INTERACTIVE_RESERVE)
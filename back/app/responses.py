@@ -0,0 +1,41 @@
+"""JSON-ответы через orjson — класс ответа по умолчанию для всего приложения.
+
+Эндпоинт, который возвращает dict/list, всё ещё проходит jsonable_encoder
+FastAPI (дорого на больших страницах). Горячие эндпоинты (GET /items)
+возвращают ORJSONResponse сами — тогда сериализация одна, в orjson.
+"""
+from datetime import timedelta
+from decimal import Decimal
+from typing import Any
+
+import orjson
+from fastapi import Response
+
+
+def _default(value: Any) -> Any:
+    # то, что orjson не знает, но приходит из mysql-connector
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode("utf-8", "replace")
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class ORJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class RawJSONResponse(Response):
+    """Уже сериализованный JSON (тело апстрима) — отдаём байты как есть."""
+    media_type = "application/json"
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional, List
+from typing import Literal, Optional, List
 
 class RegisterIn(BaseModel):
     """Данные, передаваемые при регистрации нового пользователя.
@@ -42,6 +42,14 @@ class ItemPatch(BaseModel):
     type: Optional[str] = None
     cover_url: Optional[str] = None
     watched: Optional[bool] = None
+    genre: Optional[str] = None
+
+class TicketIn(BaseModel):
+    """Запрос короткоживущего билета для ссылки без заголовка Authorization.
+    Используется в эндпоинте POST /auth/ticket.
+    """
+    list_id: int
+    scope: Literal["events", "export"]
 
 class ShareIn(BaseModel):
     """Данные для расшаривания списка другому пользователю.
@@ -56,3 +64,28 @@ class RenameListIn(BaseModel):
     """
     list_id: int
     new_name: str
+
+class ItemBatchCreate(BaseModel):
+    """Пакетное добавление элементов (можно в разные списки).
+    Используется в эндпоинте POST /items/batch.
+    """
+    items: List[ItemCreate]
+
+class ItemBatchPatch(BaseModel):
+    """Пакетное обновление элементов: у каждого свой набор полей.
+    Используется в эндпоинте PATCH /items/batch.
+    """
+    items: List[ItemPatch]
+
+class ItemBatchDelete(BaseModel):
+    """Пакетное удаление элементов по id.
+    Используется в эндпоинте DELETE /items/batch.
+    """
+    ids: List[int]
+
+class ProfilingIn(BaseModel):
+    """Переключение профилирования на лету.
+    Используется в эндпоинте POST /admin/profiling.
+    """
+    enabled: Optional[bool] = None
+    slow_ms: Optional[float] = Field(None, ge=0)
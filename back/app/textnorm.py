@@ -0,0 +1,24 @@
+"""Нормализация названий — одна для каталога Кинопоиска и поиска по элементам.
+
+NFKC + lower: составные и полноширинные символы и регистр кириллицы и
+латиницы сводятся одинаково. Слова — буквенно-цифровые куски без «_»,
+поэтому в LIKE-шаблон по слову не попадают ни %, ни _.
+"""
+import re
+from typing import Optional
+from unicodedata import normalize as u_normalize
+
+TOKEN_MAX_LEN = 64
+
+_WORD = re.compile(r"[^\W_]+")
+
+
+def norm(s: Optional[str]) -> str:
+    if not s:
+        return ""
+    return u_normalize("NFKC", s).strip().lower()
+
+
+def tokens(s: Optional[str]) -> list[str]:
+    """«Тёмный рыцарь: Возрождение» -> ["тёмный", "рыцарь", "возрождение"] (без повторов)."""
+    return list(dict.fromkeys(w[:TOKEN_MAX_LEN] for w in _WORD.findall(norm(s))))
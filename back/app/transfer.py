@@ -0,0 +1,415 @@
+"""Выгрузка и загрузка списка целиком: NDJSON или CSV.
+
+GET /lists/{id}/export отдаёт элементы потоком с небуферизованного курсора
+(queries.stream): память — одна пачка строк, а не весь список, и первые байты
+уходят сразу. Выгрузка держит соединение из пула, пока клиент читает, поэтому
+одновременных выгрузок не больше EXPORT_MAX_CONCURRENT (сверх — 429), а
+клиент, не принимающий данные EXPORT_SEND_TIMEOUT секунд, отключается. POST /lists/{id}/import читает тело по мере прихода и пишет
+многострочными INSERT по IMPORT_CHUNK строк — каждая пачка своей транзакцией
+вместе с item_genres, item_title_tokens и сводкой lists (list_stats), так что
+длинная загрузка не держит блокировки и соединение из пула.
+
+Повторы отбрасываются по нормализованной паре (название, тип) — и с уже
+лежащими в списке, и внутри файла. С ?enrich=1 пустые год, рейтинг, жанр,
+обложка и описание заполняются из локального каталога titles (без Кинопоиска).
+"""
+import asyncio
+import codecs
+import csv
+import io
+import logging
+import os
+from decimal import Decimal, InvalidOperation
+from typing import AsyncIterator, Literal, Optional
+
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from starlette.requests import ClientDisconnect
+from mysql.connector import Error as MySQLError
+
+from . import acl, events, list_stats, queries, textnorm
+from .auth import check_ticket, get_user_id
+from .db import DB_POOL_SIZE, get_conn
+from .items import split_genres
+from .profiling import ProfiledRoute
+from .responses import dumps
+
+log = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/lists", tags=["lists"], route_class=ProfiledRoute)
+
+# Строк на пачку: и чтения выгрузки, и INSERT импорта
+EXPORT_FETCH = int(os.getenv("EXPORT_FETCH", "1000"))
+IMPORT_CHUNK = int(os.getenv("IMPORT_CHUNK", "1000"))
+# выгрузок сразу на воркер: каждая занимает соединение пула, пока клиент читает
+EXPORT_MAX_CONCURRENT = int(os.getenv("EXPORT_MAX_CONCURRENT", str(max(1, DB_POOL_SIZE // 4))))
+# сколько ждать, пока клиент примет очередную пачку
+EXPORT_SEND_TIMEOUT = float(os.getenv("EXPORT_SEND_TIMEOUT", "30"))
+IMPORT_MAX_BYTES = int(os.getenv("IMPORT_MAX_BYTES", str(64 * 1024 * 1024)))
+IMPORT_MAX_ROWS = int(os.getenv("IMPORT_MAX_ROWS", "200000"))
+# одна строка NDJSON / одна запись CSV (с переводами строк в кавычках)
+IMPORT_MAX_RECORD = int(os.getenv("IMPORT_MAX_RECORD", str(64 * 1024)))
+# сколько ошибок по строкам вернуть в ответе (считаются все)
+IMPORT_MAX_ERRORS = 20
+
+# пределы колонок items: строка за пределами валит INSERT всей пачки,
+# поэтому проверяем заранее и считаем её ошибкой строки
+TEXT_MAX_LEN = {"title": 255, "type": 32, "genre": 255, "cover_url": 512}
+DESCRIPTION_MAX_BYTES = 65535  # TEXT
+YEAR_RANGE = (1870, 2100)
+RATING_RANGE = (Decimal(0), Decimal(10))
+
+FIELDS = ("id", "title", "type", "year", "rating", "genre", "cover_url", "watched", "description")
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+# поля, которые ?enrich берёт из titles: поле элемента -> колонка каталога
+ENRICH_FIELDS = {"year": "year", "rating": "rating_kp", "genre": "genres",
+                 "cover_url": "poster_url", "description": "description"}
+
+
+def _user(user_id: Optional[int], ticket: Optional[str], list_id: int) -> int:
+    if not user_id and ticket:
+        user_id = check_ticket(ticket, list_id, "export")
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    return user_id
+
+
+# ---------- выгрузка ----------
+
+_exports_running = 0
+
+
+class _ExportResponse(StreamingResponse):
+    """StreamingResponse, у которого каждый send ограничен EXPORT_SEND_TIMEOUT.
+    Что бы ни случилось — таймаут, обрыв, ошибка, — генератор закрывается сразу
+    (соединение возвращается в пул) и слот выгрузки освобождается."""
+
+    async def __call__(self, scope, receive, send) -> None:
+        global _exports_running
+
+        async def timed_send(message) -> None:
+            await asyncio.wait_for(send(message), EXPORT_SEND_TIMEOUT)
+
+        try:
+            await super().__call__(scope, receive, timed_send)
+        except (asyncio.TimeoutError, ClientDisconnect):
+            # таймаут send — OSError, Starlette отдаёт его как ClientDisconnect
+            log.info("export stopped: client gone or took more than %ss to read", EXPORT_SEND_TIMEOUT)
+        finally:
+            await self.body_iterator.aclose()
+            _exports_running -= 1
+
+def _csv_chunk(rows: list) -> bytes:
+    out = io.StringIO()
+    csv.writer(out).writerows(rows)
+    return out.getvalue().encode()
+
+
+async def _export(list_id: int, fmt: str) -> AsyncIterator[bytes]:
+    # соединение берёт сам поток: оно занято, пока клиент читает, и ни секундой дольше
+    async with get_conn() as conn:
+        if fmt == "csv":
+            # BOM — чтобы Excel открыл UTF-8 без мастера импорта
+            yield b"\xef\xbb\xbf" + _csv_chunk([FIELDS])
+        async for rows in queries.stream(conn, "transfer.export", (list_id,), size=EXPORT_FETCH):
+            if fmt == "csv":
+                yield _csv_chunk(rows)
+            else:
+                yield b"".join(dumps(dict(zip(FIELDS, row))) + b"\n" for row in rows)
+
+
+@router.get("/{list_id}/export")
+async def export_list(
+    list_id: int,
+    format: Literal["ndjson", "csv"] = Query("ndjson"),
+    user_id: Optional[int] = Depends(get_user_id),
+    ticket: Optional[str] = Query(None, description="Билет POST /auth/ticket для скачивания обычной ссылкой"),
+):
+    """Все элементы списка одним потоком (владелец и те, кому список расшарен)."""
+    global _exports_running
+    user_id = _user(user_id, ticket, list_id)
+    async with get_conn() as conn:
+        if not await acl.get_permission(conn, user_id, list_id):
+            raise HTTPException(status_code=403, detail="Access denied")
+    if _exports_running >= EXPORT_MAX_CONCURRENT:
+        raise HTTPException(status_code=429, detail="Too many exports in progress, try again later",
+                            headers={"Retry-After": "5"})
+    _exports_running += 1  # освобождает _ExportResponse
+    return _ExportResponse(
+        _export(list_id, format),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="list-{list_id}.{format}"'},
+    )
+
+
+# ---------- разбор тела импорта ----------
+
+class ImportStopped(Exception):
+    def __init__(self, status_code: int, message: str):
+        self.status_code = status_code
+        self.message = message
+
+
+async def _lines(body: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Строки тела по мере прихода; UTF-8 декодируется по кускам (символ может
+    разрезаться между чанками), BOM в начале отбрасывается."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    tail, total = "", 0
+    async for chunk in body:
+        total += len(chunk)
+        if total > IMPORT_MAX_BYTES:
+            raise ImportStopped(413, f"Body too large (max {IMPORT_MAX_BYTES} bytes)")
+        try:
+            text = tail + decoder.decode(chunk)
+        except UnicodeDecodeError:
+            raise ImportStopped(400, "Body is not valid UTF-8")
+        *lines, tail = text.split("\n")
+        if len(tail) > IMPORT_MAX_RECORD:
+            raise ImportStopped(400, f"Line too long (max {IMPORT_MAX_RECORD} characters)")
+        for line in lines:
+            yield line
+    try:
+        tail += decoder.decode(b"", final=True)
+    except UnicodeDecodeError:
+        raise ImportStopped(400, "Body is not valid UTF-8")
+    if tail:
+        yield tail
+
+
+async def _ndjson_records(lines: AsyncIterator[str]) -> AsyncIterator[tuple[int, object]]:
+    line_no = 0
+    async for line in lines:
+        line_no += 1
+        if line.strip():
+            try:
+                yield line_no, orjson.loads(line)
+            except orjson.JSONDecodeError:
+                yield line_no, None
+
+
+async def _csv_records(lines: AsyncIterator[str]) -> AsyncIterator[tuple[int, object]]:
+    """Запись CSV может занимать несколько строк (перевод строки в кавычках):
+    копим строки, пока кавычек чётное число, и только тогда отдаём csv.reader."""
+    header: Optional[list[str]] = None
+    pending: list[str] = []
+    size = quotes = line_no = start = 0
+    async for line in lines:
+        line_no += 1
+        if not pending:
+            start = line_no
+        pending.append(line)
+        size += len(line)
+        quotes += line.count('"')
+        if quotes % 2:
+            if size > IMPORT_MAX_RECORD:
+                raise ImportStopped(400, f"CSV record at line {start} is too long or has an unclosed quote")
+            continue
+        record = "\n".join(pending)
+        pending, size, quotes = [], 0, 0
+        if not record.strip():
+            continue
+        try:
+            values = next(csv.reader([record]))
+        except csv.Error:
+            yield start, None
+            continue
+        if header is None:
+            header = [h.strip().lower() for h in values]
+            if "title" not in header:
+                raise ImportStopped(400, "CSV header must contain a 'title' column")
+            continue
+        yield start, dict(zip(header, values))
+    if pending:
+        yield start, None  # незакрытая кавычка в конце файла
+
+
+def _text(value) -> Optional[str]:
+    if value is None:
+        return None
+    return str(value).strip() or None
+
+
+def _number(value, kind):
+    if value is None or value == "":
+        return None
+    if isinstance(value, bool):
+        raise ValueError
+    return kind(str(value).strip().replace(",", "."))
+
+
+def _item(data) -> tuple[Optional[dict], Optional[str]]:
+    """Запись файла -> строка items (или причина, почему её нет)."""
+    if not isinstance(data, dict):
+        return None, "malformed record"
+    item = {field: _text(data.get(field)) for field in (*TEXT_MAX_LEN, "description")}
+    if not item["title"]:
+        return None, "title is required"
+    for field, max_len in TEXT_MAX_LEN.items():
+        if item[field] and len(item[field]) > max_len:
+            return None, f"{field} longer than {max_len}"
+    if item["description"] and len(item["description"].encode()) > DESCRIPTION_MAX_BYTES:
+        return None, f"description longer than {DESCRIPTION_MAX_BYTES} bytes"
+    try:
+        year = _number(data.get("year"), int)
+    except ValueError:
+        return None, "year must be an integer"
+    if year is not None and not YEAR_RANGE[0] <= year <= YEAR_RANGE[1]:
+        return None, f"year must be between {YEAR_RANGE[0]} and {YEAR_RANGE[1]}"
+    try:
+        rating = _number(data.get("rating"), Decimal)
+    except (ValueError, InvalidOperation):
+        return None, "rating must be a number"
+    # Decimal принимает NaN и Infinity: с ними и сравнение с диапазоном не работает
+    if rating is not None and not (rating.is_finite() and RATING_RANGE[0] <= rating <= RATING_RANGE[1]):
+        return None, f"rating must be between {RATING_RANGE[0]} and {RATING_RANGE[1]}"
+    watched = data.get("watched")
+    if isinstance(watched, str):
+        watched = watched.strip().lower() in ("1", "true", "yes", "y", "да")
+    item.update(
+        type=item["type"] or "movie",
+        cover_url=item["cover_url"] or "",
+        year=year,
+        rating=rating,
+        watched=1 if watched else 0,
+    )
+    return item, None
+
+
+def _key(title: Optional[str], type: Optional[str]) -> tuple[str, str]:
+    return textnorm.norm(title), textnorm.norm(type)
+
+
+# ---------- запись пачками ----------
+
+class ImportReport:
+    __slots__ = ("imported", "duplicates", "invalid", "enriched", "errors")
+
+    def __init__(self):
+        self.imported = self.duplicates = self.invalid = self.enriched = 0
+        self.errors: list[dict] = []
+
+    def error(self, line: int, message: str) -> None:
+        self.invalid += 1
+        if len(self.errors) < IMPORT_MAX_ERRORS:
+            self.errors.append({"line": line, "error": message})
+
+    def as_dict(self) -> dict:
+        return {"imported": self.imported, "duplicates": self.duplicates, "invalid": self.invalid,
+                "enriched": self.enriched, "errors": self.errors}
+
+
+async def _existing_keys(list_id: int) -> set[tuple[str, str]]:
+    keys = set()
+    async with get_conn() as conn:
+        async for rows in queries.stream(conn, "transfer.keys", (list_id,), size=EXPORT_FETCH):
+            keys.update(_key(title, type) for title, type in rows)
+    return keys
+
+
+async def _enrich(conn, items: list[dict]) -> int:
+    """Пустые поля — из каталога titles: сначала тайтл того же типа, потом любой."""
+    wanted = [it for it in items if any(it[f] in (None, "") for f in ENRICH_FIELDS)]
+    names = list(dict.fromkeys(textnorm.norm(it["title"])[:255] for it in wanted))
+    if not names:
+        return 0
+    found = await queries.run(conn, "transfer.titles_by_names", names, ids=queries.placeholders(len(names)))
+    best: dict[tuple, dict] = {}
+    for row in found.dicts():  # первая строка — с лучшим рейтингом
+        best.setdefault((row["name_norm"], row["type"]), row)
+        best.setdefault((row["name_norm"], None), row)
+    enriched = 0
+    for it in wanted:
+        name = textnorm.norm(it["title"])[:255]
+        row = best.get((name, it["type"])) or best.get((name, None))
+        if row is None:
+            continue
+        filled = False
+        for field, column in ENRICH_FIELDS.items():
+            if it[field] in (None, "") and row[column] not in (None, ""):
+                it[field] = row[column]
+                filled = True
+        enriched += filled
+    return enriched
+
+
+async def _write_chunk(list_id: int, items: list[dict], enrich: bool, report: ImportReport) -> None:
+    async with get_conn() as conn:
+        if enrich:
+            report.enriched += await _enrich(conn, items)
+        await conn.start_transaction()
+        # один INSERT на пачку, id новых строк — из RETURNING
+        inserted = await queries.run(
+            conn, "items.import_batch",
+            [v for it in items for v in (list_id, it["title"], it["type"], it["cover_url"], it["genre"],
+                                         it["year"], it["rating"], it["watched"], it["description"])],
+            rows=queries.value_rows("(%s,%s,%s,%s,%s,%s,%s,%s,%s)", len(items)),
+        )
+        genre_rows, token_rows = [], []
+        for it, (item_id,) in zip(items, inserted.rows):
+            genre_rows.extend((item_id, list_id, g) for g in split_genres(it["genre"]))
+            token_rows.extend((list_id, w, item_id) for w in textnorm.tokens(it["title"]))
+        await queries.run_many(conn, "item_genres.insert", genre_rows)
+        await queries.run_many(conn, "item_title_tokens.insert", token_rows)
+        version = await list_stats.touch(
+            conn, list_id, items=len(items), watched=sum(it["watched"] for it in items), genres=bool(genre_rows),
+        )
+        await conn.commit()
+    report.imported += len(items)
+    # диффом тысячу строк не шлём: клиенты перечитывают список
+    await events.publish(list_id, version, "imported", {"count": len(items)})
+
+
+@router.post("/{list_id}/import")
+async def import_list(
+    list_id: int,
+    request: Request,
+    format: Literal["ndjson", "csv"] = Query("ndjson"),
+    enrich: bool = Query(False, description="Заполнить пустые поля из каталога titles"),
+    user_id: Optional[int] = Depends(get_user_id),
+):
+    """Тело — файл выгрузки (NDJSON: объект на строку; CSV: заголовок с колонкой title).
+    Пачки коммитятся по мере чтения: при ошибке посреди файла уже записанное остаётся,
+    сколько — в ответе об ошибке."""
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    length = request.headers.get("content-length")
+    if length and length.isdigit() and int(length) > IMPORT_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"Body too large (max {IMPORT_MAX_BYTES} bytes)")
+    async with get_conn() as conn:
+        if await acl.get_permission(conn, user_id, list_id) != acl.OWNER:
+            raise HTTPException(status_code=403, detail="Access denied")
+
+    seen = await _existing_keys(list_id)
+    report = ImportReport()
+    parse = _csv_records if format == "csv" else _ndjson_records
+    chunk: list[dict] = []
+    rows = 0
+    try:
+        async for line, data in parse(_lines(request.stream())):
+            rows += 1
+            if rows > IMPORT_MAX_ROWS:
+                raise ImportStopped(413, f"Too many rows (max {IMPORT_MAX_ROWS})")
+            item, error = _item(data)
+            if error:
+                report.error(line, error)
+                continue
+            key = _key(item["title"], item["type"])
+            if key in seen:
+                report.duplicates += 1
+                continue
+            seen.add(key)
+            chunk.append(item)
+            if len(chunk) >= IMPORT_CHUNK:
+                await _write_chunk(list_id, chunk, enrich, report)
+                chunk = []
+        if chunk:
+            await _write_chunk(list_id, chunk, enrich, report)
+    except ImportStopped as e:
+        raise HTTPException(status_code=e.status_code, detail={"message": e.message, **report.as_dict()})
+    except MySQLError:
+        # пачки до этой уже закоммичены — клиенту нужен отчёт, а не голый 500
+        log.exception("import into list %s failed", list_id)
+        raise HTTPException(status_code=500, detail={"message": "Database error", **report.as_dict()})
+    return report.as_dict()
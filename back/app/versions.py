@@ -0,0 +1,80 @@
+"""Счётчики версий для условных GET (ETag / If-None-Match -> 304).
+
+lists.version растёт при любом изменении элементов списка или самого списка,
+user_versions.version — при изменении набора списков пользователя (свои и
+расшаренные ему). Бамп делается в той же транзакции, что и изменение, поэтому
+версия не может «отстать» от данных. Проверка ETag стоит один запрос по
+первичному ключу вместо основного запроса и сериализации. ETag /lists берёт
+оба счётчика: сводка по спискам (app.list_stats) меняется с lists.version.
+"""
+import hashlib
+from typing import Iterable, Optional
+
+from fastapi import Request, Response
+
+from . import queries
+
+# Браузер хранит ответ, но каждый раз спрашивает сервер (If-None-Match)
+CACHE_CONTROL = "private, no-cache"
+
+
+async def list_version(db, list_id: int) -> Optional[int]:
+    return (await queries.run(db, "versions.list", (list_id,))).scalar()
+
+
+async def user_lists_version(db, user_id: int, shared: bool = False) -> tuple[int, int]:
+    """(версия набора списков пользователя, сумма версий самих списков) — для ETag
+    /lists (shared=False) и /shared_lists (shared=True): в ответе сводка по спискам."""
+    name = "versions.shared_lists" if shared else "versions.user_lists"
+    row = (await queries.run(db, name, (user_id, user_id))).rows[0]
+    return int(row[0]), int(row[1])
+
+
+async def bump_lists(db, list_ids: Iterable[int]) -> None:
+    ids = sorted(set(list_ids))  # один порядок блокировок во всех транзакциях
+    if len(ids) == 1:
+        await queries.run(db, "versions.bump_list", ids)
+    elif ids:
+        await queries.run(db, "versions.bump_lists", ids, ids=queries.placeholders(len(ids)))
+
+
+async def bump_users(db, user_ids: Iterable[int]) -> None:
+    ids = sorted(set(user_ids))
+    if len(ids) == 1:
+        await queries.run(db, "versions.bump_user", ids)
+    elif ids:
+        await queries.run(db, "versions.bump_users", ids, rows=queries.value_rows("(%s,1)", len(ids)))
+
+
+async def bump_list_members(db, list_id: int) -> None:
+    """Список переименован/удалён: поменялись /lists владельца и /shared_lists тех, кому он расшарен."""
+    members = await queries.run(db, "versions.list_members", (list_id, list_id))
+    await bump_users(db, [row[0] for row in members.rows])
+
+
+def make_etag(*parts) -> str:
+    raw = "-".join(str(p) for p in parts)
+    if len(raw) > 64:
+        raw = raw[:24] + "-" + hashlib.sha1(raw.encode()).hexdigest()[:16]
+    return f'"{raw}"'
+
+
+def query_fingerprint(request: Request) -> str:
+    """Параметры запроса входят в ETag: другая страница/сортировка — другой ответ."""
+    items = sorted(request.query_params.multi_items())
+    return hashlib.sha1(repr(items).encode()).hexdigest()[:12]
+
+
+def not_modified(request: Request, etag: str) -> Optional[Response]:
+    """304, если клиент прислал тот же ETag; иначе None."""
+    header = request.headers.get("if-none-match")
+    if header:
+        tags = {t.strip().removeprefix("W/") for t in header.split(",")}
+        if etag in tags or "*" in tags:
+            return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+    return None
+
+
+def set_validators(response: Response, etag: str) -> None:
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
@@ -0,0 +1,60 @@
+# back/scripts/backfill_item_genres.py
+"""Заполняет item_genres по существующим items.genre (после миграции 0003).
+
+Идемпотентен: строки пишутся через INSERT IGNORE, можно перезапускать.
+lists.top_genres после него пересчитывает scripts/reconcile_list_stats.py.
+
+    python scripts/backfill_item_genres.py [--batch 1000] [--rebuild]
+"""
+from __future__ import annotations
+import sys
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from app.items import split_genres  # noqa: E402
+from migrate import get_connection  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill item_genres from items.genre.")
+    parser.add_argument("--batch", type=int, default=1000, help="Сколько items читать за раз")
+    parser.add_argument("--rebuild", action="store_true", help="Сначала очистить item_genres")
+    args = parser.parse_args()
+
+    with get_connection() as conn, conn.cursor() as cur:
+        if args.rebuild:
+            cur.execute("TRUNCATE TABLE item_genres")
+
+        last_id, items_done, rows_done = 0, 0, 0
+        while True:
+            # keyset по id: без OFFSET и без загрузки всей таблицы
+            cur.execute("""
+                SELECT id, list_id, genre FROM items
+                WHERE id > %s AND genre IS NOT NULL AND genre <> ''
+                ORDER BY id LIMIT %s
+            """, (last_id, args.batch))
+            items = cur.fetchall()
+            if not items:
+                break
+
+            rows = [(item_id, list_id, g) for item_id, list_id, genre in items for g in split_genres(genre)]
+            if rows:
+                cur.executemany(
+                    "INSERT IGNORE INTO item_genres (item_id, list_id, genre) VALUES (%s,%s,%s)",
+                    rows,
+                )
+            last_id = items[-1][0]
+            items_done += len(items)
+            rows_done += len(rows)
+            print(f"[..] items={items_done} genres={rows_done} last_id={last_id}")
+
+        # ETag GET /items/genres держится на lists.version
+        if rows_done or args.rebuild:
+            cur.execute("UPDATE lists SET version=version+1")
+
+    print(f"Готово: items={items_done}, genres={rows_done}")
+
+
+if __name__ == "__main__":
+    main()
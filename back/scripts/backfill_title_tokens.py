@@ -0,0 +1,52 @@
+# back/scripts/backfill_title_tokens.py
+"""Заполняет item_title_tokens по существующим items.title (после миграции 0007).
+
+Идемпотентен: строки пишутся через INSERT IGNORE, можно перезапускать.
+
+    python scripts/backfill_title_tokens.py [--batch 1000] [--rebuild]
+"""
+from __future__ import annotations
+import sys
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from app.textnorm import tokens  # noqa: E402
+from migrate import get_connection  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill item_title_tokens from items.title.")
+    parser.add_argument("--batch", type=int, default=1000, help="Сколько items читать за раз")
+    parser.add_argument("--rebuild", action="store_true", help="Сначала очистить item_title_tokens")
+    args = parser.parse_args()
+
+    with get_connection() as conn, conn.cursor() as cur:
+        if args.rebuild:
+            cur.execute("TRUNCATE TABLE item_title_tokens")
+
+        last_id, items_done, rows_done = 0, 0, 0
+        while True:
+            # keyset по id: без OFFSET и без загрузки всей таблицы
+            cur.execute("SELECT id, list_id, title FROM items WHERE id > %s ORDER BY id LIMIT %s",
+                        (last_id, args.batch))
+            items = cur.fetchall()
+            if not items:
+                break
+
+            rows = [(list_id, w, item_id) for item_id, list_id, title in items for w in tokens(title)]
+            if rows:
+                cur.executemany(
+                    "INSERT IGNORE INTO item_title_tokens (list_id, token, item_id) VALUES (%s,%s,%s)",
+                    rows,
+                )
+            last_id = items[-1][0]
+            items_done += len(items)
+            rows_done += len(rows)
+            print(f"[..] items={items_done} tokens={rows_done} last_id={last_id}")
+
+    print(f"Готово: items={items_done}, tokens={rows_done}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+# back/scripts/bench_auth.py
+"""Микробенчмарк зависимости get_user_id: с кэшем проверенных токенов и без.
+
+    python scripts/bench_auth.py [-n 20000]
+
+БД не нужна: проверяется только JWT.
+"""
+from __future__ import annotations
+import sys
+import time
+import asyncio
+import argparse
+from pathlib import Path
+
+from fastapi.security import HTTPAuthorizationCredentials
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from app import auth  # noqa: E402
+
+
+async def run(n: int, cached: bool) -> float:
+    token = auth.create_token(42)
+    creds = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+    auth.token_cache.clear()
+    await auth.get_user_id(creds)  # прогрев
+
+    started = time.perf_counter()
+    for _ in range(n):
+        if not cached:
+            auth.token_cache.clear()
+        await auth.get_user_id(creds)
+    return (time.perf_counter() - started) / n
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark auth dependency overhead.")
+    parser.add_argument("-n", type=int, default=20000, help="Итераций на режим")
+    args = parser.parse_args()
+
+    uncached = await run(args.n, cached=False)
+    cached = await run(args.n, cached=True)
+    print(f"uncached: {uncached * 1e6:8.2f} µs/request (jwt.decode)")
+    print(f"cached:   {cached * 1e6:8.2f} µs/request (sha256 + dict lookup)")
+    print(f"speedup:  {uncached / cached:8.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
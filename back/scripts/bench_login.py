@@ -0,0 +1,83 @@
+# back/scripts/bench_login.py
+"""Пропускная способность проверки паролей при входе.
+
+    python scripts/bench_login.py [-n 64] [-c 32] [--rounds 10]
+
+Сравнивает проверку bcrypt в пуле потоков (как было) и в пуле процессов
+app.hashing. Параллельно крутится «пинг» event loop'а — по его задержке
+видно, держит ли хэширование остальные запросы. БД не нужна.
+"""
+from __future__ import annotations
+import os
+import sys
+import time
+import asyncio
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+async def ping(stop: asyncio.Event, lags: list[float]):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(0.005)
+        lags.append(time.perf_counter() - started - 0.005)
+
+
+async def run(name: str, verify, n: int, concurrency: int, stored: str):
+    from fastapi import HTTPException
+
+    sem = asyncio.Semaphore(concurrency)
+    rejected = 0
+
+    async def one():
+        nonlocal rejected
+        async with sem:
+            try:
+                assert await verify("secret", stored)
+            except HTTPException:
+                rejected += 1
+
+    stop, lags = asyncio.Event(), []
+    pinger = asyncio.create_task(ping(stop, lags))
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(n)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await pinger
+
+    lags.sort()
+    p99 = lags[int(len(lags) * 0.99)] if lags else 0.0
+    print(f"{name:8} {n / elapsed:8.1f} logins/s   loop lag p99 {p99 * 1000:7.1f} ms   rejected {rejected}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark password verification throughput.")
+    parser.add_argument("-n", type=int, default=64, help="Сколько входов")
+    parser.add_argument("-c", type=int, default=32, help="Одновременных входов")
+    parser.add_argument("--rounds", type=int, default=10, help="BCRYPT_ROUNDS для бенчмарка")
+    args = parser.parse_args()
+
+    # до импорта: процессы пула читают то же окружение
+    os.environ["BCRYPT_ROUNDS"] = str(args.rounds)
+    from starlette.concurrency import run_in_threadpool
+    from app import hashing
+
+    stored = hashing._hash("secret")
+
+    async def threadpool_verify(password, stored_hash):
+        return await run_in_threadpool(hashing._verify, password, stored_hash)
+
+    hashing.start()
+    await hashing.verify_password("secret", stored)  # прогрев: процессы поднимаются лениво
+    try:
+        print(f"bcrypt rounds={args.rounds}, workers={hashing.HASH_WORKERS}, n={args.n}, c={args.c}")
+        await run("thread", threadpool_verify, args.n, args.c, stored)
+        await run("process", hashing.verify_password, args.n, args.c, stored)
+    finally:
+        await hashing.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
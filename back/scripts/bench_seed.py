@@ -0,0 +1,150 @@
+# back/scripts/bench_seed.py
+"""Наполнение БД синтетическими данными для bench_suite.py.
+
+    python scripts/bench_seed.py [--users 50] [--lists 3] [--items 500]
+                                 [--shares 2] [--seed 42] [--reset]
+
+Все пользователи называются bench_<N> с паролем BENCH_PASSWORD, поэтому их
+данные легко найти и удалить (--reset). Схема должна быть уже создана
+(основные таблицы + scripts/migrate.py). Один и тот же --seed даёт одни и те
+же данные — прогоны можно сравнивать.
+"""
+from __future__ import annotations
+import sys
+import time
+import random
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from migrate import get_connection  # noqa: E402
+from app.hashing import pwd_ctx  # noqa: E402
+from app.items import split_genres  # noqa: E402
+from app.textnorm import tokens  # noqa: E402
+
+USER_PREFIX = "bench_"
+BENCH_PASSWORD = "bench-password"
+CHUNK = 1000
+
+GENRES = [
+    "драма", "комедия", "триллер", "боевик", "фантастика", "ужасы", "мелодрама",
+    "криминал", "детектив", "приключения", "фэнтези", "аниме", "мультфильм",
+    "документальный", "биография", "военный", "история", "семейный",
+]
+TYPES = ["movie", "tv-series", "cartoon", "anime"]
+WORDS = [
+    "тёмный", "последний", "город", "ночь", "рыцарь", "море", "дорога", "дом",
+    "звезда", "тайна", "война", "любовь", "остров", "зима", "сон", "огонь",
+    "the", "dark", "lost", "river", "king", "shadow", "storm", "garden",
+]
+
+
+def chunks(rows: list, size: int = CHUNK):
+    for i in range(0, len(rows), size):
+        yield rows[i:i + size]
+
+
+def insert_many(cur, sql_head: str, row_sql: str, rows: list) -> None:
+    """Многострочные INSERT кусками по CHUNK строк."""
+    for part in chunks(rows):
+        cur.execute(sql_head + ",".join([row_sql] * len(part)), [v for row in part for v in row])
+
+
+def reset(cur) -> None:
+    cur.execute(f"SELECT id FROM users WHERE username LIKE '{USER_PREFIX}%'")
+    user_ids = [r[0] for r in cur.fetchall()]
+    if not user_ids:
+        return
+    users = ",".join(map(str, user_ids))
+    cur.execute(f"SELECT id FROM lists WHERE user_id IN ({users})")
+    list_ids = [r[0] for r in cur.fetchall()]
+    if list_ids:
+        lists = ",".join(map(str, list_ids))
+        cur.execute(f"DELETE FROM item_genres WHERE list_id IN ({lists})")
+        cur.execute(f"DELETE FROM item_title_tokens WHERE list_id IN ({lists})")
+        cur.execute(f"DELETE FROM items WHERE list_id IN ({lists})")
+        cur.execute(f"DELETE FROM shared_lists WHERE list_id IN ({lists})")
+        cur.execute(f"DELETE FROM lists WHERE id IN ({lists})")
+    cur.execute(f"DELETE FROM shared_lists WHERE shared_with_id IN ({users})")
+    cur.execute(f"DELETE FROM users WHERE id IN ({users})")
+    print(f"удалено: {len(user_ids)} пользователей, {len(list_ids)} списков")
+
+
+def title(rnd: random.Random) -> str:
+    return " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(1, 4))).capitalize()
+
+
+def seed(cur, users: int, lists: int, items: int, shares: int, rnd: random.Random) -> None:
+    # один хэш на всех: bcrypt на каждого пользователя сделал бы сидинг минутами
+    password_hash = pwd_ctx.hash(BENCH_PASSWORD)
+    insert_many(cur, "INSERT INTO users (username, password) VALUES ", "(%s,%s)",
+                [(f"{USER_PREFIX}{n}", password_hash) for n in range(users)])
+    cur.execute(f"SELECT id FROM users WHERE username LIKE '{USER_PREFIX}%' ORDER BY id")
+    user_ids = [r[0] for r in cur.fetchall()]
+
+    insert_many(cur, "INSERT INTO lists (user_id, name) VALUES ", "(%s,%s)",
+                [(uid, f"Список {k + 1}") for uid in user_ids for k in range(lists)])
+    cur.execute(f"SELECT id, user_id FROM lists WHERE user_id IN ({','.join(map(str, user_ids))}) ORDER BY id")
+    list_rows = cur.fetchall()
+
+    item_rows = []
+    for list_id, _ in list_rows:
+        for _ in range(items):
+            genre = ", ".join(rnd.sample(GENRES, rnd.randint(1, 3)))
+            item_rows.append((
+                list_id, title(rnd), rnd.choice(TYPES), "", genre,
+                rnd.choice([None, *range(1960, 2026)]),
+                rnd.choice([None, round(rnd.uniform(3, 9.5), 1)]),
+                rnd.random() < 0.3,
+            ))
+    insert_many(cur, "INSERT INTO items (list_id, title, type, cover_url, genre, year, rating, watched) VALUES ",
+                "(%s,%s,%s,%s,%s,%s,%s,%s)", item_rows)
+
+    lists_sql = ",".join(str(r[0]) for r in list_rows)
+    cur.execute(f"SELECT id, list_id, genre, title FROM items WHERE list_id IN ({lists_sql})")
+    created = cur.fetchall()
+    genre_rows = [(item_id, list_id, g) for item_id, list_id, genre, _ in created for g in split_genres(genre)]
+    insert_many(cur, "INSERT IGNORE INTO item_genres (item_id, list_id, genre) VALUES ", "(%s,%s,%s)", genre_rows)
+    token_rows = [(list_id, w, item_id) for item_id, list_id, _, name in created for w in tokens(name)]
+    insert_many(cur, "INSERT IGNORE INTO item_title_tokens (list_id, token, item_id) VALUES ", "(%s,%s,%s)",
+                token_rows)
+    # сводка lists (0006) — как её вёл бы API; top_genres для бенчей не нужен
+    cur.execute(f"""
+        UPDATE lists l JOIN (
+            SELECT list_id, COUNT(*) AS n, SUM(watched) AS w FROM items
+            WHERE list_id IN ({lists_sql}) GROUP BY list_id
+        ) c ON c.list_id = l.id
+        SET l.item_count=c.n, l.watched_count=c.w, l.last_modified=CURRENT_TIMESTAMP
+    """)
+
+    share_rows = []
+    for list_id, owner_id in list_rows:
+        for other in rnd.sample(user_ids, min(shares, len(user_ids))):
+            if other != owner_id:
+                share_rows.append((list_id, owner_id, other))
+    insert_many(cur, "INSERT INTO shared_lists (list_id, owner_id, shared_with_id) VALUES ", "(%s,%s,%s)", share_rows)
+
+    print(f"создано: {len(user_ids)} пользователей, {len(list_rows)} списков, "
+          f"{len(item_rows)} элементов, {len(genre_rows)} жанров, {len(share_rows)} шар")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed the database with benchmark data.")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--lists", type=int, default=3, help="Списков на пользователя")
+    parser.add_argument("--items", type=int, default=500, help="Элементов в списке")
+    parser.add_argument("--shares", type=int, default=2, help="Скольким пользователям расшарен каждый список")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--reset", action="store_true", help="Только удалить данные bench_*")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    with get_connection() as conn, conn.cursor() as cur:
+        reset(cur)
+        if not args.reset:
+            seed(cur, args.users, args.lists, args.items, args.shares, random.Random(args.seed))
+    print(f"Готово за {time.perf_counter() - started:.1f} с.")
+
+
+if __name__ == "__main__":
+    main()
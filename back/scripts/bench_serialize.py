@@ -0,0 +1,162 @@
+# back/scripts/bench_serialize.py
+"""CPU на один ответ: сериализация и сжатие (до/после app.responses и app.compression).
+
+    python scripts/bench_serialize.py [-n 2000] [--rows 50,200] [--json out.json]
+
+Прогоняет ASGI-запросы напрямую (без сети и БД) через маленькие приложения:
+- items/dict+json — как было: эндпоинт отдаёт dict, FastAPI гонит его через
+  jsonable_encoder и стандартный JSONResponse;
+- items/orjson    — как сейчас в GET /items: ORJSONResponse из эндпоинта;
+- kp/parse+dump   — как было в /kinopoisk/search: r.json() и обратно в JSON;
+- kp/raw          — байты апстрима как есть (RawJSONResponse);
+- */gzip, */br    — тот же ответ через CompressionMiddleware.
+Меряется time.process_time() — CPU процесса, а не стеночное время.
+"""
+from __future__ import annotations
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+from decimal import Decimal
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from fastapi import FastAPI  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+
+from app import compression  # noqa: E402
+from app.responses import ORJSONResponse, RawJSONResponse  # noqa: E402
+
+TYPES = ["film", "series", "cartoon", "anime"]
+GENRES = ["драма", "комедия", "криминал", "фантастика", "триллер", "мелодрама"]
+
+
+def make_rows(n: int) -> list[dict]:
+    rnd = random.Random(n)
+    return [{
+        "id": 100000 + k,
+        "list_id": 42,
+        "title": f"Фильм номер {k} — {rnd.choice(GENRES)}",
+        "type": rnd.choice(TYPES),
+        "cover_url": f"https://st.kp.yandex.net/images/film_big/{rnd.randint(1, 10**6)}.jpg",
+        "genre": ", ".join(rnd.sample(GENRES, 2)),
+        "year": rnd.randint(1960, 2025),
+        "rating": Decimal(f"{rnd.uniform(4, 9.5):.1f}"),
+        "watched": rnd.randint(0, 1),
+        "description": "Описание " * rnd.randint(5, 40),
+    } for k in range(n)]
+
+
+def make_kp_body(n: int) -> bytes:
+    docs = [{
+        "id": 1000000 + k,
+        "name": f"Фильм {k}",
+        "alternativeName": f"Film {k}",
+        "enName": None,
+        "type": TYPES[k % len(TYPES)],
+        "year": 1990 + k,
+        "rating": {"kp": 7.1, "imdb": 7.3},
+        "poster": {"url": f"https://image.openmoviedb.com/{k}.jpg", "previewUrl": None},
+        "genres": [{"name": g} for g in GENRES[:3]],
+        "description": "Длинное описание сюжета. " * 10,
+    } for k in range(n)]
+    return json.dumps({"docs": docs, "total": n, "limit": n, "page": 1, "pages": 1}, ensure_ascii=False).encode()
+
+
+def build_apps(rows: list[dict], kp_body: bytes) -> dict[str, FastAPI]:
+    def page(items):
+        return {"items": items, "list_id": 42, "sort_by": "created_at", "order": "desc",
+                "limit": len(items), "offset": 0, "has_more": True, "next_cursor": "x", "prev_cursor": None}
+
+    old = FastAPI(default_response_class=JSONResponse)
+
+    @old.get("/items")
+    async def items_old():
+        return page(rows)
+
+    @old.get("/kp")
+    async def kp_old():
+        return json.loads(kp_body)
+
+    new = FastAPI(default_response_class=ORJSONResponse)
+
+    @new.get("/items")
+    async def items_new():
+        return ORJSONResponse(page(rows))
+
+    @new.get("/kp")
+    async def kp_new():
+        return RawJSONResponse(kp_body)
+
+    return {"old": old, "new": new, "new+compress": compression.CompressionMiddleware(new)}
+
+
+async def call(app, path: str, accept_encoding: str = "") -> int:
+    headers = [(b"accept-encoding", accept_encoding.encode())] if accept_encoding else []
+    scope = {"type": "http", "method": "GET", "path": path, "raw_path": path.encode(), "query_string": b"",
+             "headers": headers, "http_version": "1.1", "scheme": "http", "server": ("bench", 80),
+             "client": ("bench", 1), "root_path": ""}
+    size = 0
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal size
+        if message["type"] == "http.response.body":
+            size += len(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return size
+
+
+async def measure(app, path: str, n: int, accept_encoding: str = "") -> tuple[float, int]:
+    for _ in range(20):  # прогрев
+        size = await call(app, path, accept_encoding)
+    started = time.process_time()
+    for _ in range(n):
+        await call(app, path, accept_encoding)
+    return (time.process_time() - started) / n, size
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark CPU per response for serialization and compression.")
+    parser.add_argument("-n", type=int, default=2000, help="Запросов на сценарий")
+    parser.add_argument("--rows", default="50,200", help="Размеры страницы items через запятую")
+    parser.add_argument("--kp-docs", type=int, default=10, help="Документов в ответе Кинопоиска")
+    parser.add_argument("--json", help="Сохранить результаты в файл")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'scenario':28} {'µs CPU/resp':>12} {'bytes':>9}")
+    for n_rows in (int(x) for x in args.rows.split(",")):
+        apps = build_apps(make_rows(n_rows), make_kp_body(args.kp_docs))
+        scenarios = [
+            (f"items[{n_rows}]/dict+json", apps["old"], "/items", ""),
+            (f"items[{n_rows}]/orjson", apps["new"], "/items", ""),
+            (f"items[{n_rows}]/orjson+gzip", apps["new+compress"], "/items", "gzip"),
+            (f"items[{n_rows}]/orjson+br", apps["new+compress"], "/items", "br, gzip"),
+        ]
+        if n_rows == int(args.rows.split(",")[0]):
+            scenarios += [
+                (f"kp[{args.kp_docs}]/parse+dump", apps["old"], "/kp", ""),
+                (f"kp[{args.kp_docs}]/raw", apps["new"], "/kp", ""),
+                (f"kp[{args.kp_docs}]/raw+br", apps["new+compress"], "/kp", "br"),
+            ]
+        for name, app, path, enc in scenarios:
+            if enc.startswith("br") and compression.brotli is None:
+                print(f"{name:28} {'(brotli не установлен)':>22}")
+                continue
+            cpu, size = await measure(app, path, args.n, enc)
+            results.append({"scenario": name, "cpu_us": round(cpu * 1e6, 1), "bytes": size})
+            print(f"{name:28} {cpu * 1e6:12.1f} {size:9}")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, ensure_ascii=False, indent=2))
+        print(f"-> {args.json}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
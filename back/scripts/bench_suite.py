@@ -0,0 +1,325 @@
+# back/scripts/bench_suite.py
+"""Нагрузочный прогон настоящего FastAPI-приложения по сценариям.
+
+    python scripts/bench_seed.py                       # один раз: данные bench_*
+    python scripts/bench_suite.py [--scenarios browse,deep_pages,genres,search,item_search,login,bulk_add]
+                                  [--ops 200] [--concurrency 20] [--kp-latency 0.15]
+                                  [--kp-error-rate 0.0] [--out results.json] [--compare prev.json]
+
+Приложение вызывается в процессе через httpx.ASGITransport (с lifespan), поэтому
+измеряется код бекенда + БД, без сетевого стека uvicorn. Кинопоиск подменяется
+scripts/fake_kinopoisk.py на локальном порту.
+
+По каждому сценарию: запросов в секунду, p50/p95/p99 задержки, коды ответов и
+запросов к БД на HTTP-запрос (дельта SHOW GLOBAL STATUS 'Questions' — точна,
+только если в БД больше никто не ходит). Результат сохраняется в JSON;
+--compare печатает разницу с прошлым прогоном.
+"""
+from __future__ import annotations
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import subprocess
+import tempfile
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Awaitable, Callable, Optional
+
+BACK = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACK))
+
+SCENARIOS = ("browse", "deep_pages", "genres", "search", "item_search", "login", "bulk_add")
+SORTS = ("created_at", "title", "year", "rating", "genre")
+
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, max(0, round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+
+@dataclass
+class Result:
+    name: str
+    latencies: list[float] = field(default_factory=list)
+    statuses: Counter = field(default_factory=Counter)
+    elapsed: float = 0.0
+    db_questions: Optional[int] = None
+
+    def summary(self) -> dict:
+        lat = sorted(self.latencies)
+        n = len(lat)
+        return {
+            "requests": n,
+            "elapsed_s": round(self.elapsed, 3),
+            "rps": round(n / self.elapsed, 1) if self.elapsed else 0.0,
+            "p50_ms": round(percentile(lat, 50) * 1000, 2),
+            "p95_ms": round(percentile(lat, 95) * 1000, 2),
+            "p99_ms": round(percentile(lat, 99) * 1000, 2),
+            "mean_ms": round(sum(lat) / n * 1000, 2) if n else 0.0,
+            "statuses": {str(k): v for k, v in sorted(self.statuses.items(), key=lambda kv: str(kv[0]))},
+            # 5xx и исключения на стороне клиента (ключ — имя исключения)
+            "errors": sum(v for k, v in self.statuses.items() if not isinstance(k, int) or k >= 500),
+            "db_queries_per_request": round(self.db_questions / n, 2) if self.db_questions is not None and n else None,
+        }
+
+
+class Bench:
+    """HTTP-клиент к приложению + данные bench_* из БД."""
+
+    def __init__(self, client, fixtures: dict, args):
+        self.client = client
+        self.fx = fixtures
+        self.args = args
+        self.rnd = random.Random(args.seed)
+        self.result: Optional[Result] = None
+
+    async def call(self, method: str, url: str, token: Optional[str] = None, **kwargs):
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        started = time.perf_counter()
+        r = await self.client.request(method, url, headers=headers, **kwargs)
+        self.result.latencies.append(time.perf_counter() - started)
+        self.result.statuses[r.status_code] += 1
+        return r
+
+    def user(self) -> dict:
+        return self.rnd.choice(self.fx["users"])
+
+    def owned_list(self, user: dict) -> int:
+        return self.rnd.choice(user["lists"])
+
+    # ---------- сценарии: одна «операция» = один или несколько запросов ----------
+
+    async def browse(self, i: int):
+        u = self.user()
+        await self.call("GET", "/lists", u["token"])
+        await self.call("GET", "/shared_lists", u["token"])
+        list_id = self.owned_list(u)
+        await self.call("GET", "/items", u["token"], params={"list_id": list_id, "limit": 50})
+        await self.call("GET", "/items/genres", u["token"], params={"list_id": list_id})
+
+    async def deep_pages(self, i: int):
+        u = self.user()
+        params = {
+            "list_id": self.owned_list(u),
+            "limit": 50,
+            "sort_by": self.rnd.choice(SORTS),
+            "order": self.rnd.choice(("asc", "desc")),
+        }
+        for _ in range(self.args.pages):
+            r = await self.call("GET", "/items", u["token"], params=params)
+            cursor = r.json().get("next_cursor") if r.status_code == 200 else None
+            if not cursor:
+                break
+            params["cursor"] = cursor
+
+    async def genres(self, i: int):
+        u = self.user()
+        list_id = self.owned_list(u)
+        genres = self.fx["genres"].get(list_id) or ["драма"]
+        picked = self.rnd.sample(genres, min(len(genres), self.rnd.randint(1, 3)))
+        await self.call("GET", "/items", u["token"], params={
+            "list_id": list_id, "limit": 50, "genres": picked,
+            "genre_mode": self.rnd.choice(("any", "all")),
+        })
+
+    async def search(self, i: int):
+        # ограниченный набор запросов: первые — промахи, дальше работает кэш
+        query = f"bench title {self.rnd.randrange(self.args.search_distinct)}"
+        await self.call("GET", "/kinopoisk/search", params={"query": query, "limit": 10})
+
+    async def item_search(self, i: int):
+        # GET /items/search по своим и расшаренным спискам: одно-два слова из словаря
+        # bench_seed, последнее иногда только началом; плюс следующая страница
+        from bench_seed import WORDS
+        words = self.rnd.sample(WORDS, self.rnd.randint(1, 2))
+        if self.rnd.random() < 0.5:
+            words[-1] = words[-1][:self.rnd.randint(2, 4)]
+        u = self.user()
+        params = {"q": " ".join(words), "limit": 20}
+        r = await self.call("GET", "/items/search", u["token"], params=params)
+        cursor = r.json().get("next_cursor") if r.status_code == 200 else None
+        if cursor:
+            await self.call("GET", "/items/search", u["token"], params={**params, "cursor": cursor})
+
+    async def login(self, i: int):
+        from bench_seed import BENCH_PASSWORD
+        u = self.user()
+        await self.call("POST", "/auth/login", json={"username": u["username"], "password": BENCH_PASSWORD})
+
+    async def bulk_add(self, i: int):
+        u = self.user()
+        list_id = self.owned_list(u)
+        items = [
+            {"list_id": list_id, "title": f"bench add {i}-{k}", "type": "movie", "genre": "драма, комедия"}
+            for k in range(self.args.batch_size)
+        ]
+        r = await self.call("POST", "/items/batch", u["token"], json={"items": items})
+        if r.status_code == 200:
+            ids = [x["id"] for x in r.json()["results"] if x["status"] == "created"]
+            # уборка вне замера
+            await self.client.request("DELETE", "/items/batch", json={"ids": ids},
+                                      headers={"Authorization": f"Bearer {u['token']}"})
+
+
+async def run_scenario(bench: Bench, name: str, op: Callable[[int], Awaitable[None]], ops: int, concurrency: int) -> Result:
+    bench.result = result = Result(name)
+    counter = iter(range(ops))
+
+    async def worker():
+        for i in counter:
+            try:
+                await op(i)
+            except Exception as e:  # сбой клиента — тоже результат
+                result.statuses[type(e).__name__] += 1
+
+    before = db_questions()
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    result.elapsed = time.perf_counter() - started
+    after = db_questions()
+    if before is not None and after is not None:
+        result.db_questions = after - before - 1  # сам SHOW STATUS тоже считается
+    return result
+
+
+def db_questions() -> Optional[int]:
+    from migrate import get_connection
+    try:
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute("SHOW GLOBAL STATUS LIKE 'Questions'")
+            return int(cur.fetchone()[1])
+    except Exception:
+        return None
+
+
+def load_fixtures(limit_users: int) -> dict:
+    from migrate import get_connection
+    from bench_seed import USER_PREFIX
+    from app import auth
+
+    with get_connection() as conn, conn.cursor() as cur:
+        cur.execute(
+            f"SELECT id, username FROM users WHERE username LIKE '{USER_PREFIX}%' ORDER BY id LIMIT %s",
+            (limit_users,),
+        )
+        users = [{"id": uid, "username": name, "lists": []} for uid, name in cur.fetchall()]
+        if not users:
+            raise SystemExit("Нет пользователей bench_* — сначала scripts/bench_seed.py")
+        by_id = {u["id"]: u for u in users}
+        cur.execute(f"SELECT id, user_id FROM lists WHERE user_id IN ({','.join(map(str, by_id))})")
+        for list_id, user_id in cur.fetchall():
+            by_id[user_id]["lists"].append(list_id)
+        list_ids = [lid for u in users for lid in u["lists"]]
+        genres: dict[int, list[str]] = {}
+        if list_ids:
+            cur.execute(f"SELECT DISTINCT list_id, genre FROM item_genres WHERE list_id IN ({','.join(map(str, list_ids))})")
+            for list_id, genre in cur.fetchall():
+                genres.setdefault(list_id, []).append(genre)
+
+    users = [u for u in users if u["lists"]]
+    for u in users:
+        u["token"] = auth.create_token(u["id"])
+    return {"users": users, "genres": genres}
+
+
+def git_rev() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BACK, text=True).strip()
+    except Exception:
+        return None
+
+
+def compare(current: dict, previous_path: Path) -> None:
+    previous = json.loads(previous_path.read_text())
+    print(f"\nСравнение с {previous_path} ({previous.get('git_rev')} -> {current.get('git_rev')}):")
+    for name, cur in current["scenarios"].items():
+        prev = previous.get("scenarios", {}).get(name)
+        if not prev:
+            continue
+        parts = []
+        for key in ("rps", "p50_ms", "p95_ms", "p99_ms", "db_queries_per_request"):
+            a, b = prev.get(key), cur.get(key)
+            if a and b is not None:
+                parts.append(f"{key} {a} -> {b} ({(b - a) / a * 100:+.1f}%)")
+        print(f"  {name:10} " + ", ".join(parts))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="End-to-end benchmark of the API against a seeded DB.")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"Через запятую: {', '.join(SCENARIOS)}")
+    parser.add_argument("--ops", type=int, default=200, help="Операций на сценарий")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--users", type=int, default=50, help="Сколько пользователей bench_* задействовать")
+    parser.add_argument("--pages", type=int, default=10, help="Глубина листания в deep_pages")
+    parser.add_argument("--batch-size", type=int, default=50, help="Элементов в одном bulk_add")
+    parser.add_argument("--search-distinct", type=int, default=30, help="Разных запросов в search")
+    parser.add_argument("--kp-port", type=int, default=8765)
+    parser.add_argument("--kp-latency", type=float, default=0.15)
+    parser.add_argument("--kp-jitter", type=float, default=0.05)
+    parser.add_argument("--kp-error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", type=Path, default=None, help="Куда сохранить JSON (по умолчанию bench_results/<время>.json)")
+    parser.add_argument("--compare", type=Path, default=None, help="JSON прошлого прогона для сравнения")
+    args = parser.parse_args()
+
+    names = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(names) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"неизвестные сценарии: {', '.join(sorted(unknown))}")
+
+    # до импорта app: Кинопоиск — локальная подмена, лимиты ключа не мешают замеру
+    os.environ.setdefault("KINOPOISK_API_KEY", "bench")
+    os.environ["KINOPOISK_BASE_URL"] = f"http://127.0.0.1:{args.kp_port}"
+    os.environ.setdefault("KP_HTTP2", "0")
+    os.environ.setdefault("KP_DAILY_QUOTA", "1000000000")
+    os.environ.setdefault("KP_RATE_PER_SEC", "1000000")
+    os.environ.setdefault("KP_RATELIMIT_FILE", os.path.join(tempfile.mkdtemp(), "kp_ratelimit.json"))
+
+    import httpx
+    from fake_kinopoisk import serve
+    from app.main import app
+
+    kp_server = await serve(args.kp_port, latency=args.kp_latency, jitter=args.kp_jitter, error_rate=args.kp_error_rate)
+    fixtures = load_fixtures(args.users)
+    report = {
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "git_rev": git_rev(),
+        "args": {k: str(v) if isinstance(v, Path) else v for k, v in vars(args).items()},
+        "fixtures": {"users": len(fixtures["users"]), "lists": sum(len(u["lists"]) for u in fixtures["users"])},
+        "scenarios": {},
+    }
+
+    try:
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+                bench = Bench(client, fixtures, args)
+                for name in names:
+                    result = await run_scenario(bench, name, getattr(bench, name), args.ops, args.concurrency)
+                    s = result.summary()
+                    report["scenarios"][name] = s
+                    print(f"{name:10} {s['requests']:6} req {s['rps']:8.1f} rps  "
+                          f"p50 {s['p50_ms']:7.1f}  p95 {s['p95_ms']:7.1f}  p99 {s['p99_ms']:7.1f} ms  "
+                          f"db/req {s['db_queries_per_request']}  {s['statuses']}")
+    finally:
+        kp_server.should_exit = True
+        await kp_server.task
+
+    out = args.out or BACK / "bench_results" / f"{datetime.now():%Y%m%d-%H%M%S}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, ensure_ascii=False, indent=2))
+    print(f"Результаты: {out}")
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,194 @@
+# back/scripts/bench_transfer.py
+"""Импорт и выгрузка большого списка: POST /lists/{id}/import и GET /lists/{id}/export.
+
+    python scripts/bench_seed.py                       # один раз: пользователи bench_*
+    python scripts/bench_transfer.py [--rows 100000] [--formats ndjson,csv]
+                                     [--enrich] [--base-url http://127.0.0.1:8000]
+                                     [--out results.json]
+
+На каждый формат создаётся новый список пользователя bench_*, в него
+загружается --rows строк (тело генерируется на лету, 10% строк — повторы),
+затем список выгружается тем же форматом и для сравнения читается старым
+способом — страницами GET /items?limit=200&offset=... В конце список удаляется.
+
+Без --base-url приложение вызывается в процессе через httpx.ASGITransport:
+он собирает тело ответа целиком, поэтому память сервера (max RSS) честно
+видна только на живом uvicorn — запустите его отдельно и передайте --base-url.
+"""
+from __future__ import annotations
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import resource
+from datetime import datetime
+from pathlib import Path
+
+BACK = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACK))
+
+FORMATS = ("ndjson", "csv")
+PAGE = 200
+
+
+def max_rss_mb() -> float:
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def make_rows(n: int, seed: int) -> list[dict]:
+    from bench_seed import GENRES, TYPES, WORDS
+    rnd = random.Random(seed)
+    rows = []
+    for i in range(n):
+        if rows and rnd.random() < 0.1:
+            rows.append(dict(rnd.choice(rows)))  # повтор: импорт должен его отбросить
+            continue
+        rows.append({
+            "title": f"{' '.join(rnd.sample(WORDS, 3)).capitalize()} {i}",
+            "type": rnd.choice(TYPES),
+            "year": rnd.randint(1950, 2025),
+            "rating": round(rnd.uniform(3, 9.5), 1),
+            "genre": ", ".join(rnd.sample(GENRES, rnd.randint(1, 3))),
+            "watched": rnd.random() < 0.3,
+        })
+    return rows
+
+
+async def body(rows: list[dict], fmt: str, chunk_rows: int = 1000):
+    """Тело запроса кусками — как его отдаёт браузер или curl --data-binary."""
+    import csv
+    import io
+    if fmt == "csv":
+        out = io.StringIO()
+        writer = csv.DictWriter(out, fieldnames=list(rows[0]))
+        writer.writeheader()
+        for i in range(0, len(rows), chunk_rows):
+            writer.writerows(rows[i:i + chunk_rows])
+            yield out.getvalue().encode()
+            out.seek(0)
+            out.truncate()
+    else:
+        for i in range(0, len(rows), chunk_rows):
+            yield "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in rows[i:i + chunk_rows]).encode()
+
+
+async def create_list(client, headers: dict, name: str) -> int:
+    r = await client.post("/lists", json={"name": name}, headers=headers)
+    r.raise_for_status()
+    r = await client.get("/lists", headers=headers)
+    return max(l["id"] for l in r.json() if l["name"] == name)
+
+
+async def run_format(client, headers: dict, fmt: str, rows: list[dict], enrich: bool) -> dict:
+    list_id = await create_list(client, headers, f"bench transfer {fmt} {datetime.now():%H%M%S}")
+    result: dict = {"list_id": list_id}
+    try:
+        started = time.perf_counter()
+        r = await client.post(f"/lists/{list_id}/import", params={"format": fmt, "enrich": enrich},
+                              content=body(rows, fmt), headers=headers)
+        elapsed = time.perf_counter() - started
+        r.raise_for_status()
+        report = r.json()
+        result["import"] = {
+            "elapsed_s": round(elapsed, 3),
+            "rows_per_s": round(len(rows) / elapsed, 1),
+            **{k: v for k, v in report.items() if k != "errors"},
+        }
+
+        started = time.perf_counter()
+        first_byte, size, lines = None, 0, 0
+        async with client.stream("GET", f"/lists/{list_id}/export", params={"format": fmt}, headers=headers) as r:
+            r.raise_for_status()
+            async for chunk in r.aiter_bytes():
+                if first_byte is None:
+                    first_byte = time.perf_counter() - started
+                size += len(chunk)
+                lines += chunk.count(b"\n")
+        elapsed = time.perf_counter() - started
+        result["export"] = {
+            "elapsed_s": round(elapsed, 3),
+            "first_byte_ms": round((first_byte or 0) * 1000, 2),
+            "bytes": size,
+            "lines": lines,
+            "rows_per_s": round(report["imported"] / elapsed, 1) if elapsed else None,
+        }
+
+        # как раньше: весь список страницами /items с OFFSET
+        started = time.perf_counter()
+        pages, fetched = 0, 0
+        while True:
+            r = await client.get("/items", params={"list_id": list_id, "limit": PAGE, "offset": fetched},
+                                 headers=headers)
+            r.raise_for_status()
+            got = len(r.json()["items"])
+            pages += 1
+            fetched += got
+            if got < PAGE:
+                break
+        elapsed = time.perf_counter() - started
+        result["offset_pages"] = {"elapsed_s": round(elapsed, 3), "pages": pages, "rows": fetched}
+    finally:
+        await client.request("DELETE", "/delete_list", json={"list_id": list_id}, headers=headers)
+    result["client_max_rss_mb"] = max_rss_mb()
+    return result
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark list import/export against a seeded DB.")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--formats", default=",".join(FORMATS), help=f"Через запятую: {', '.join(FORMATS)}")
+    parser.add_argument("--enrich", action="store_true", help="Импорт с ?enrich=1 (поиск по titles)")
+    parser.add_argument("--base-url", default=None, help="Живой сервер вместо приложения в процессе")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", type=Path, default=None, help="Куда сохранить JSON (по умолчанию bench_results/<время>.json)")
+    args = parser.parse_args()
+
+    formats = [f.strip() for f in args.formats.split(",") if f.strip()]
+    unknown = set(formats) - set(FORMATS)
+    if unknown:
+        parser.error(f"неизвестные форматы: {', '.join(sorted(unknown))}")
+    os.environ.setdefault("IMPORT_MAX_ROWS", str(max(args.rows, 200_000)))
+
+    import httpx
+    from bench_suite import git_rev, load_fixtures
+
+    user = load_fixtures(1)["users"][0]
+    headers = {"Authorization": f"Bearer {user['token']}"}
+    rows = make_rows(args.rows, args.seed)
+    report = {
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "git_rev": git_rev(),
+        "args": {k: str(v) if isinstance(v, Path) else v for k, v in vars(args).items()},
+        "formats": {},
+    }
+
+    async def run(client):
+        for fmt in formats:
+            s = report["formats"][fmt] = await run_format(client, headers, fmt, rows, args.enrich)
+            print(f"{fmt:7} import {s['import']['elapsed_s']:8.2f} s ({s['import']['rows_per_s']:9.1f} rows/s, "
+                  f"{s['import']['imported']} new, {s['import']['duplicates']} dup)  "
+                  f"export {s['export']['elapsed_s']:7.2f} s (first byte {s['export']['first_byte_ms']} ms, "
+                  f"{s['export']['bytes'] / 1e6:.1f} MB)  "
+                  f"offset pages {s['offset_pages']['elapsed_s']:7.2f} s ({s['offset_pages']['pages']} req)")
+
+    if args.base_url:
+        async with httpx.AsyncClient(base_url=args.base_url, timeout=600) as client:
+            await run(client)
+    else:
+        from app.main import app
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as client:
+                await run(client)
+
+    out = args.out or BACK / "bench_results" / f"transfer-{datetime.now():%Y%m%d-%H%M%S}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, ensure_ascii=False, indent=2))
+    print(f"Результаты: {out}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
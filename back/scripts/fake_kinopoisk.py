@@ -0,0 +1,90 @@
+# back/scripts/fake_kinopoisk.py
+"""Локальная подмена api.kinopoisk.dev для бенчмарков.
+
+    python scripts/fake_kinopoisk.py [--port 8765] [--latency 0.15] [--jitter 0.05] [--error-rate 0.02]
+
+Отвечает на GET /v1.4/movie/search детерминированными документами (по хэшу
+запроса) с заданной задержкой и долей ошибок 500. Бекенд направляется сюда
+через KINOPOISK_BASE_URL=http://127.0.0.1:8765. GET /stats — сколько запросов пришло.
+"""
+from __future__ import annotations
+import asyncio
+import argparse
+import hashlib
+import random
+
+import uvicorn
+from fastapi import FastAPI, Header, HTTPException, Query
+
+TYPES = ["movie", "tv-series", "cartoon", "anime"]
+
+
+def make_app(latency: float = 0.15, jitter: float = 0.05, error_rate: float = 0.0) -> FastAPI:
+    app = FastAPI(title="fake kinopoisk")
+    app.state.requests = 0
+    app.state.errors = 0
+
+    @app.get("/v1.4/movie/search")
+    async def search(
+        query: str = Query(...),
+        page: int = 1,
+        limit: int = 10,
+        x_api_key: str = Header(""),
+    ):
+        app.state.requests += 1
+        if not x_api_key:
+            raise HTTPException(status_code=401, detail="no api key")
+        await asyncio.sleep(max(0.0, random.gauss(latency, jitter)))
+        if random.random() < error_rate:
+            app.state.errors += 1
+            raise HTTPException(status_code=500, detail="injected error")
+
+        h = int(hashlib.sha256(query.encode()).hexdigest(), 16)
+        docs = []
+        for k in range(min(limit, 1 + h % 7)):
+            seed = h >> (k * 8)
+            docs.append({
+                "id": 1000000 + seed % 9000000,
+                # первый документ — точное совпадение названия
+                "name": query if k == 0 else f"{query} {k + 1}",
+                "alternativeName": None,
+                "enName": None,
+                "type": TYPES[seed % len(TYPES)],
+                "year": 1960 + seed % 65,
+                "rating": {"kp": round(5 + (seed % 45) / 10, 1)},
+                "poster": {"url": None, "previewUrl": None},
+                "genres": [{"name": "драма"}],
+                "description": f"Описание «{query}» #{k + 1}",
+            })
+        return {"docs": docs, "total": len(docs), "limit": limit, "page": page, "pages": 1}
+
+    @app.get("/stats")
+    async def stats():
+        return {"requests": app.state.requests, "errors": app.state.errors}
+
+    return app
+
+
+async def serve(port: int, **kwargs) -> uvicorn.Server:
+    """Запустить в текущем event loop (для bench_suite.py).
+    Остановка: server.should_exit = True; await server.task."""
+    server = uvicorn.Server(uvicorn.Config(make_app(**kwargs), host="127.0.0.1", port=port, log_level="warning"))
+    server.task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake api.kinopoisk.dev for benchmarks.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.15, help="Средняя задержка ответа, сек")
+    parser.add_argument("--jitter", type=float, default=0.05, help="Разброс задержки (σ), сек")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Доля ответов 500")
+    args = parser.parse_args()
+    app = make_app(args.latency, args.jitter, args.error_rate)
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
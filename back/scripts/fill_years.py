@@ -1,32 +1,46 @@
 # back/scripts/fill_years.py
+"""Дозаполнение year / rating / description у items через Кинопоиск.
+
+    python scripts/fill_years.py [--fields year,rating,description] [--all]
+                                 [--workers 5] [--batch 200] [--limit N]
+                                 [--checkpoint PATH | --restart] [--dry-run] [-v]
+
+Конвейер: чтение строк потоковым (небуферизованным) курсором -> ограниченная
+очередь -> N параллельных резолверов (каталог titles, при промахе — апстрим)
+-> писатель, который копит обновления и пишет их executemany пачками.
+
+После каждой записанной пачки в checkpoint-файл сохраняется «водяной знак» —
+наибольший id, до которого все строки обработаны. Прерванный запуск
+продолжается с него; --restart начинает заново.
+"""
 from __future__ import annotations
 import os
+import sys
+import json
+import time
 import asyncio
-import httpx
 import argparse
-from typing import Optional, List, Dict, Any, Tuple
-from contextlib import asynccontextmanager
-import mysql.connector
-from mysql.connector import Error as MySQLError
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Optional, Dict, Any, Tuple
 
 from pathlib import Path
 
+from mysql.connector import aio as mysql_aio
+
 # Загружаем .env из корня back/
 env_path = Path(__file__).resolve().parent.parent / ".env"
 
+# Скрипт ходит в БД и Кинопоиск тем же кодом, что и бекенд (app.db, app.kp_client)
+sys.path.insert(0, str(env_path.parent))
+from app import db as app_db, kinopoisk, kp_client, ratelimit  # noqa: E402
+from app.kinopoisk import fetch_description  # noqa: E402
 
-# --- настройка из .env бекенда ---
-DB_HOST = os.getenv("MYSQL_HOST", "127.0.0.1")
-DB_PORT = int(os.getenv("MYSQL_PORT", "3306"))
-DB_USER = os.getenv("MYSQL_USER", "to_watch_list")
-DB_PASSWORD = os.getenv("MYSQL_PASSWORD", "")
-DB_NAME = os.getenv("MYSQL_DATABASE", "to_watch_list")
-
-BACKEND_BASE = "http://127.0.0.1:8000"
-KINODECR_PATH = "/kinopoisk/description"  # наша ручка
 
 CONCURRENCY = int(os.getenv("FILL_YEARS_CONCURRENCY", "5"))
-TIMEOUT = float(os.getenv("FILL_YEARS_TIMEOUT", "100.0"))
+DEFAULT_CHECKPOINT = env_path.parent / ".fill_years.checkpoint.json"
+
+FIELDS = ("year", "rating", "description")
 
 TYPE_MAP = {
     "фильм": "movie",
@@ -41,12 +55,8 @@ TYPE_MAP = {
     "tv-show": "tv-show",
 }
 
-def get_connection():
-    return mysql.connector.connect(
-        host=DB_HOST, port=DB_PORT, user=DB_USER,
-        password=DB_PASSWORD, database=DB_NAME,
-        autocommit=False,
-    )
+_DONE = object()  # маркер конца потока в очередях
+
 
 def normalize_type(t: Optional[str]) -> Optional[str]:
     if not t:
@@ -54,104 +64,253 @@ def normalize_type(t: Optional[str]) -> Optional[str]:
     t = t.strip().lower()
     return TYPE_MAP.get(t, t)
 
-def fetch_items(only_missing: bool, limit: Optional[int]) -> List[Dict[str, Any]]:
-    sql = "SELECT id, title, type, year FROM items"
-    cond = []
+
+# ---------- checkpoint ----------
+
+def load_checkpoint(path: Path, fields: Tuple[str, ...], only_missing: bool) -> int:
+    try:
+        data = json.loads(path.read_text())
+    except (OSError, ValueError):
+        return 0
+    if data.get("fields") != list(fields) or data.get("only_missing") != only_missing:
+        print(f"checkpoint {path} от другого набора параметров — начинаем сначала")
+        return 0
+    return int(data.get("last_id") or 0)
+
+
+def save_checkpoint(path: Path, fields: Tuple[str, ...], only_missing: bool, last_id: int) -> None:
+    # через временный файл: прерывание посреди записи не портит checkpoint
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps({"fields": list(fields), "only_missing": only_missing, "last_id": last_id}))
+    os.replace(tmp, path)
+
+
+@dataclass
+class Progress:
+    """Счётчики и «водяной знак» для checkpoint."""
+    read: int = 0
+    resolved: int = 0
+    skipped: int = 0
+    failed: int = 0
+    written: int = 0
+    # квота на сегодня кончилась: дальше строки только вычитываем, не трогая checkpoint
+    quota_exhausted: bool = False
+    started: float = field(default_factory=time.monotonic)
+    watermark: int = 0
+    # id в порядке чтения -> обработан ли (записан в БД или пропущен)
+    _order: deque = field(default_factory=deque)
+    _done: set = field(default_factory=set)
+
+    def seen(self, item_id: int) -> None:
+        self.read += 1
+        self._order.append(item_id)
+
+    def finish(self, item_id: int) -> None:
+        self._done.add(item_id)
+        while self._order and self._order[0] in self._done:
+            self._done.discard(self._order[0])
+            self.watermark = self._order.popleft()
+
+    def report(self, queue_depth: int) -> str:
+        elapsed = time.monotonic() - self.started
+        rate = self.read / elapsed if elapsed else 0.0
+        return (
+            f"[{elapsed:7.1f}s] read={self.read} resolved={self.resolved} written={self.written} "
+            f"skipped={self.skipped} failed={self.failed} queue={queue_depth} "
+            f"{rate:.1f} items/s, checkpoint id={self.watermark}"
+        )
+
+
+# ---------- стадии конвейера ----------
+
+def select_sql(fields: Tuple[str, ...], only_missing: bool, after_id: int, limit: Optional[int]) -> Tuple[str, list]:
+    sql = "SELECT id, title, type, year FROM items WHERE id > %s"
+    params: list = [after_id]
     if only_missing:
-        cond.append("year IS NULL")
-    if cond:
-        sql += " WHERE " + " AND ".join(cond)
+        sql += " AND (" + " OR ".join(f"{f} IS NULL" for f in fields) + ")"
     sql += " ORDER BY id ASC"
     if limit:
-        sql += f" LIMIT {int(limit)}"
-    with get_connection() as conn, conn.cursor(dictionary=True) as cur:
-        cur.execute(sql)
-        return list(cur.fetchall())
-
-def update_years(updates: List[Tuple[int, int]]):
-    if not updates:
-        return
-    with get_connection() as conn, conn.cursor() as cur:
-        cur.executemany("UPDATE items SET year=%s WHERE id=%s", [(y, i) for (i, y) in updates])
-        conn.commit()
-
-@asynccontextmanager
-async def http_client():
-    async with httpx.AsyncClient(timeout=httpx.Timeout(TIMEOUT)) as client:
-        yield client
-
-async def resolve_year(client: httpx.AsyncClient, title: str, type_: Optional[str], year_hint: Optional[int]) -> Optional[int]:
-    """Дёргаем наш бекенд /kinopoisk/description; он уже делает фильтрацию/подбор."""
-    params = {
-        "query": title,
-    }
-    if type_:
-        params["type"] = normalize_type(type_)
-    if year_hint:
-        params["year"] = int(year_hint)
-
-    r = await client.get(f"http://127.0.0.1:8000/kinopoisk/description", params=params)
-    print(r.status_code, r.text)
-    if r.status_code != 200:
-        # можно залогировать r.text
-        return None
-    data = r.json() or {}
+        sql += " LIMIT %s"
+        params.append(int(limit))
+    return sql, params
+
+
+async def reader(sql: str, params: list, queue: asyncio.Queue, progress: Progress, workers: int):
+    """Потоковое чтение: строки идут в очередь по мере прихода, а не fetchall().
+    Отдельное соединение мимо пула: SET SESSION ниже не должен вернуться в пул
+    вместе с соединением (pool_reset_session=False его не сбрасывает)."""
+    conn = await mysql_aio.connect(**app_db.DB_CFG)
+    try:
+        cur = await conn.cursor(dictionary=True, buffered=False)
+        # пока резолверы заняты, сервер ждёт, когда мы дочитаем результат
+        await cur.execute("SET SESSION net_write_timeout=3600")
+        await cur.execute(sql, params)
+        while (row := await cur.fetchone()) is not None:
+            progress.seen(row["id"])
+            await queue.put(row)
+    finally:
+        await conn.close()
+    for _ in range(workers):
+        await queue.put(_DONE)
+
+
+async def resolve(item: Dict[str, Any], fields: Tuple[str, ...]) -> Dict[str, Any]:
+    """Та же логика, что у /kinopoisk/description: фильтрация/подбор лучшего кандидата."""
+    # если год не заполняем, известный год помогает выбрать правильный тайтл
+    year_hint = item.get("year") if "year" not in fields else None
+    data = await fetch_description(
+        item.get("title") or "",
+        type=normalize_type(item.get("type")),
+        year=int(year_hint) if year_hint else None,
+        # пакетный приоритет: уступаем пользователям и не трогаем их резерв квоты
+        priority=ratelimit.BATCH,
+    )
     match = data.get("match") or {}
+    values: Dict[str, Any] = {}
     y = match.get("year")
-    # слегка страхуемся: если вернулся год, но в выдаче есть candidates с тем же названием — нормально.
-    return int(y) if isinstance(y, int) else None
-
-async def worker(items: List[Dict[str, Any]], sem: asyncio.Semaphore, results: List[Tuple[int, int]], dry_run: bool):
-    async with http_client() as client:
-        for it in items:
-            async with sem:
-                title = it.get("title") or ""
-                type_ = it.get("type")
-                year_hint = it.get("year")  # для непустых можно валидировать/исправлять
-                try:
-                    new_year = await resolve_year(client, title, type_, year_hint=None)
-                except Exception:
-                    new_year = None
-                if new_year is not None and new_year > 1887 and new_year < 2101:
-                    if not dry_run:
-                        results.append((it["id"], new_year))
-                    print(f"[OK] id={it['id']} «{title}» -> {new_year}")
-                else:
-                    print(f"[SKIP] id={it['id']} «{title}» -> not found")
+    if "year" in fields and isinstance(y, int) and 1887 < y < 2101:
+        values["year"] = y
+    if "rating" in fields and isinstance(match.get("rating"), (int, float)) and match["rating"] > 0:
+        values["rating"] = round(float(match["rating"]), 3)
+    if "description" in fields and data.get("description"):
+        values["description"] = data["description"]
+    return values
+
+
+async def resolver(queue: asyncio.Queue, out: asyncio.Queue, progress: Progress,
+                   fields: Tuple[str, ...], verbose: bool):
+    while (item := await queue.get()) is not _DONE:
+        if progress.quota_exhausted:
+            continue
+        title = item.get("title") or ""
+        try:
+            values = await resolve(item, fields)
+        except ratelimit.QuotaExhausted as e:
+            if not progress.quota_exhausted:
+                progress.quota_exhausted = True
+                print(f"Квота Кинопоиска исчерпана ({e.detail}); продолжим с id={item['id']} при следующем запуске")
+            continue
+        except Exception as e:
+            progress.failed += 1
+            progress.finish(item["id"])
+            print(f"[FAIL] id={item['id']} «{title}»: {e!r}")
+            continue
+        if not values:
+            progress.skipped += 1
+            progress.finish(item["id"])
+            if verbose:
+                print(f"[SKIP] id={item['id']} «{title}» -> not found")
+            continue
+        progress.resolved += 1
+        if verbose:
+            print(f"[OK] id={item['id']} «{title}» -> {', '.join(f'{k}={str(v)[:40]}' for k, v in values.items())}")
+        await out.put((item["id"], values))
+    await out.put(_DONE)
+
+
+async def writer(out: asyncio.Queue, progress: Progress, fields: Tuple[str, ...], workers: int,
+                 batch_size: int, flush_interval: float, dry_run: bool, checkpoint):
+    # NULL в параметре = «не нашли», существующее значение не трогаем
+    sql = "UPDATE items SET " + ", ".join(f"{f}=COALESCE(%s, {f})" for f in fields) + " WHERE id=%s"
+    pending: list = []
+    finished = 0
+    deadline = time.monotonic() + flush_interval
+
+    async def flush():
+        nonlocal pending, deadline
+        if pending and not dry_run:
+            async with app_db.get_conn() as conn:
+                cur = await conn.cursor()
+                await conn.start_transaction()
+                await cur.executemany(sql, [(*(v.get(f) for f in fields), item_id) for item_id, v in pending])
+                # ETag GET /items держится на lists.version — закэшированные страницы устарели
+                ids = [item_id for item_id, _ in pending]
+                await cur.execute(
+                    "UPDATE lists SET version=version+1 WHERE id IN "
+                    f"(SELECT DISTINCT list_id FROM items WHERE id IN ({','.join(['%s'] * len(ids))}))",
+                    ids,
+                )
+                await conn.commit()
+        for item_id, _ in pending:
+            progress.finish(item_id)
+        progress.written += len(pending)
+        pending = []
+        deadline = time.monotonic() + flush_interval
+        checkpoint(progress.watermark)
+
+    while finished < workers:
+        try:
+            msg = await asyncio.wait_for(out.get(), max(deadline - time.monotonic(), 0.01))
+        except asyncio.TimeoutError:
+            await flush()  # тихий период — не держим готовые обновления
+            continue
+        if msg is _DONE:
+            finished += 1
+            continue
+        pending.append(msg)
+        if len(pending) >= batch_size:
+            await flush()
+    await flush()
+
+
+async def reporter(progress: Progress, queue: asyncio.Queue, interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        print(progress.report(queue.qsize()))
+
 
 async def main():
-    parser = argparse.ArgumentParser(description="Fill missing 'year' for items via Kinopoisk proxy.")
-    parser.add_argument("--only-missing", action="store_true", help="Обрабатывать только записи без года (по умолчанию)")
+    parser = argparse.ArgumentParser(description="Fill missing year/rating/description for items via Kinopoisk.")
+    parser.add_argument("--fields", default="year", help="Что заполнять: year,rating,description")
+    parser.add_argument("--only-missing", dest="only_missing", action="store_true", help="Только строки с пустыми полями (по умолчанию)")
     parser.add_argument("--all", dest="only_missing", action="store_false", help="Обрабатывать все записи")
     parser.add_argument("--limit", type=int, default=None, help="Ограничить количество строк")
-    parser.add_argument("--dry-run", action="store_true", help="Не писать в БД, только вывод")
+    parser.add_argument("--workers", type=int, default=CONCURRENCY, help="Параллельных резолверов")
     parser.add_argument("--batch", type=int, default=200, help="Размер пакета для UPDATE")
+    parser.add_argument("--flush-interval", type=float, default=5.0, help="Писать накопленное не реже чем раз в N сек")
+    parser.add_argument("--checkpoint", type=Path, default=DEFAULT_CHECKPOINT, help="Файл с последним обработанным id")
+    parser.add_argument("--restart", action="store_true", help="Игнорировать checkpoint и начать сначала")
+    parser.add_argument("--progress", type=float, default=5.0, help="Интервал отчёта о прогрессе, сек")
+    parser.add_argument("--dry-run", action="store_true", help="Не писать в БД, только вывод")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Печатать результат по каждой строке")
+    parser.set_defaults(only_missing=True)
     args = parser.parse_args()
 
-    only_missing = True if args.only_missing or not args.all else False
+    fields = tuple(f for f in FIELDS if f in {s.strip() for s in args.fields.split(",")})
+    if not fields:
+        parser.error(f"--fields: ожидается одно или несколько из {', '.join(FIELDS)}")
 
-    items = fetch_items(only_missing=only_missing, limit=args.limit)
-    if not items:
-        print("Нет записей для обработки.")
-        return
+    after_id = 0 if args.restart or args.dry_run else load_checkpoint(args.checkpoint, fields, args.only_missing)
+    if after_id:
+        print(f"Продолжаем с id > {after_id} ({args.checkpoint})")
 
-    sem = asyncio.Semaphore(CONCURRENCY)
-    pending_updates: List[Tuple[int, int]] = []
+    def checkpoint(last_id: int):
+        if not args.dry_run and last_id:
+            save_checkpoint(args.checkpoint, fields, args.only_missing, last_id)
 
-    # Можно разбить список на чанки, чтобы периодически коммитить
-    CHUNK = 5
-    for i in range(0, len(items), CHUNK):
-        chunk = items[i:i+CHUNK]
-        await worker(chunk, sem, pending_updates, dry_run=args.dry_run)
-        if pending_updates and not args.dry_run:
-            # пачками коммитим
-            to_commit, pending_updates = pending_updates[:args.batch], pending_updates[args.batch:]
-            update_years(to_commit)
+    progress = Progress(watermark=after_id)
+    queue: asyncio.Queue = asyncio.Queue(maxsize=args.workers * 4)
+    out: asyncio.Queue = asyncio.Queue(maxsize=args.batch * 2)
+    sql, params = select_sql(fields, args.only_missing, after_id, args.limit)
 
-    # добиваем хвост
-    if pending_updates and not args.dry_run:
-        update_years(pending_updates)
+    report = asyncio.create_task(reporter(progress, queue, args.progress))
+    try:
+        await asyncio.gather(
+            reader(sql, params, queue, progress, args.workers),
+            *(resolver(queue, out, progress, fields, args.verbose) for _ in range(args.workers)),
+            writer(out, progress, fields, args.workers, args.batch, args.flush_interval, args.dry_run, checkpoint),
+        )
+    finally:
+        report.cancel()
+        print(progress.report(queue.qsize()))
+        await kinopoisk.drain()
+        await kp_client.stop()
+        await app_db.close_pool()
 
+    if progress.failed:
+        print(f"{progress.failed} строк не удалось обработать; повторить их: --restart")
+    if progress.read == 0:
+        print("Нет записей для обработки.")
     print("Готово.")
 
 if __name__ == "__main__":
@@ -0,0 +1,167 @@
+# back/scripts/migrate.py
+"""Миграции схемы MariaDB.
+
+Каждая миграция — (id, [DDL...]). Применённые записываются в schema_migrations,
+повторный запуск ничего не делает. Новые миграции только добавляются в конец.
+
+    python scripts/migrate.py            # применить всё новое
+    python scripts/migrate.py --list     # показать статус
+"""
+from __future__ import annotations
+import os
+import argparse
+from typing import List, Tuple
+
+import mysql.connector
+
+DB_HOST = os.getenv("MYSQL_HOST", "127.0.0.1")
+DB_PORT = int(os.getenv("MYSQL_PORT", "3306"))
+DB_USER = os.getenv("MYSQL_USER", "to_watch_list")
+DB_PASSWORD = os.getenv("MYSQL_PASSWORD", "")
+DB_NAME = os.getenv("MYSQL_DATABASE", "to_watch_list")
+
+MIGRATIONS: List[Tuple[str, List[str]]] = [
+    ("0001_titles_catalog", [
+        """
+        CREATE TABLE IF NOT EXISTS titles (
+            kp_id                 INT UNSIGNED NOT NULL PRIMARY KEY,
+            name                  VARCHAR(255) NULL,
+            alternative_name      VARCHAR(255) NULL,
+            en_name               VARCHAR(255) NULL,
+            name_norm             VARCHAR(255) NOT NULL DEFAULT '',
+            alternative_name_norm VARCHAR(255) NOT NULL DEFAULT '',
+            en_name_norm          VARCHAR(255) NOT NULL DEFAULT '',
+            type                  VARCHAR(32)  NULL,
+            year                  SMALLINT     NULL,
+            rating_kp             DECIMAL(5,3) NULL,
+            poster_url            VARCHAR(512) NULL,
+            poster_preview_url    VARCHAR(512) NULL,
+            genres                VARCHAR(255) NULL,
+            description           TEXT         NULL,
+            updated_at            TIMESTAMP    NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            KEY idx_titles_name_norm (name_norm),
+            KEY idx_titles_alt_norm (alternative_name_norm),
+            KEY idx_titles_en_norm (en_name_norm)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """,
+    ]),
+    # keyset-пагинация GET /items: страница = ограниченный range по (list_id, колонка, id)
+    ("0002_items_keyset_indexes", [
+        "CREATE INDEX IF NOT EXISTS idx_items_list_id_id ON items (list_id, id)",
+        "CREATE INDEX IF NOT EXISTS idx_items_list_title ON items (list_id, title, id)",
+        "CREATE INDEX IF NOT EXISTS idx_items_list_year ON items (list_id, year, id)",
+        "CREATE INDEX IF NOT EXISTS idx_items_list_rating ON items (list_id, rating, id)",
+        "CREATE INDEX IF NOT EXISTS idx_items_list_genre ON items (list_id, genre, id)",
+    ]),
+    # нормализованные жанры: точный фильтр по индексу вместо LIKE '%жанр%'
+    # (заполнение существующих строк — scripts/backfill_item_genres.py)
+    ("0003_item_genres", [
+        """
+        CREATE TABLE IF NOT EXISTS item_genres (
+            item_id INT         NOT NULL,
+            list_id INT         NOT NULL,
+            genre   VARCHAR(64) NOT NULL,
+            PRIMARY KEY (item_id, genre),
+            KEY idx_item_genres_list_genre (list_id, genre, item_id)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """,
+    ]),
+    # описание тайтла у элемента: заполняет scripts/fill_years.py --fields description
+    ("0004_items_description", [
+        "ALTER TABLE items ADD COLUMN IF NOT EXISTS description TEXT NULL",
+    ]),
+    # Счётчики версий для ETag: lists.version — содержимое списка,
+    # user_versions — набор списков пользователя (свои + расшаренные)
+    ("0005_list_versions", [
+        "ALTER TABLE lists ADD COLUMN IF NOT EXISTS version BIGINT UNSIGNED NOT NULL DEFAULT 0",
+        """
+        CREATE TABLE IF NOT EXISTS user_versions (
+            user_id INT NOT NULL PRIMARY KEY,
+            version BIGINT UNSIGNED NOT NULL DEFAULT 0
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """,
+    ]),
+    # сводка по списку для GET /lists (ведёт app.list_stats; заполнение
+    # существующих списков и починка расхождений — scripts/reconcile_list_stats.py).
+    # Счётчики знаковые: расхождение не должно ронять запись в strict-режиме
+    ("0006_list_stats", [
+        """
+        ALTER TABLE lists
+            ADD COLUMN IF NOT EXISTS item_count    INT          NOT NULL DEFAULT 0,
+            ADD COLUMN IF NOT EXISTS watched_count INT          NOT NULL DEFAULT 0,
+            ADD COLUMN IF NOT EXISTS last_modified TIMESTAMP    NULL DEFAULT NULL,
+            ADD COLUMN IF NOT EXISTS top_genres    VARCHAR(255) NULL
+        """,
+    ]),
+    # слова нормализованных названий для GET /items/search (ведёт app.items,
+    # заполнение существующих строк — scripts/backfill_title_tokens.py).
+    # Ключ начинается с list_id: поиск читает только списки пользователя.
+    # utf8mb4_bin: слова уже сведены textnorm.norm, сравнение — побайтно
+    ("0007_item_title_tokens", [
+        """
+        CREATE TABLE IF NOT EXISTS item_title_tokens (
+            list_id INT         NOT NULL,
+            token   VARCHAR(64) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin NOT NULL,
+            item_id INT         NOT NULL,
+            PRIMARY KEY (list_id, token, item_id),
+            KEY idx_item_title_tokens_item (item_id)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """,
+    ]),
+    # Отозванные (logout) JWT: переживают перезапуск и видны всем воркерам.
+    # Строка нужна только до exp токена — потом он недействителен и так
+    ("0008_revoked_tokens", [
+        """
+        CREATE TABLE IF NOT EXISTS revoked_tokens (
+            digest     CHAR(64)  NOT NULL PRIMARY KEY,
+            expires_at TIMESTAMP NOT NULL,
+            KEY idx_revoked_tokens_expires (expires_at)
+        ) ENGINE=InnoDB DEFAULT CHARSET=ascii
+        """,
+    ]),
+]
+
+
+def get_connection():
+    return mysql.connector.connect(
+        host=DB_HOST, port=DB_PORT, user=DB_USER,
+        password=DB_PASSWORD, database=DB_NAME,
+        autocommit=True,
+    )
+
+
+def applied_ids(cur) -> set:
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            id         VARCHAR(64) NOT NULL PRIMARY KEY,
+            applied_at TIMESTAMP   NOT NULL DEFAULT CURRENT_TIMESTAMP
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """)
+    cur.execute("SELECT id FROM schema_migrations")
+    return {row[0] for row in cur.fetchall()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply pending schema migrations.")
+    parser.add_argument("--list", action="store_true", help="Только показать статус миграций")
+    args = parser.parse_args()
+
+    with get_connection() as conn, conn.cursor() as cur:
+        done = applied_ids(cur)
+        for mig_id, statements in MIGRATIONS:
+            if mig_id in done:
+                print(f"[SKIP] {mig_id}")
+                continue
+            if args.list:
+                print(f"[TODO] {mig_id}")
+                continue
+            # DDL в MariaDB не транзакционный: при ошибке миграция не помечается
+            # применённой, а statements пишем идемпотентно (IF NOT EXISTS)
+            for sql in statements:
+                cur.execute(sql)
+            cur.execute("INSERT INTO schema_migrations (id) VALUES (%s)", (mig_id,))
+            print(f"[OK] {mig_id}")
+
+
+if __name__ == "__main__":
+    main()
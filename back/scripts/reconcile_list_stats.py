@@ -0,0 +1,96 @@
+# back/scripts/reconcile_list_stats.py
+"""Сверяет сводку lists (item_count, watched_count, top_genres) с items/item_genres
+и чинит расхождения. После миграции 0006 — первичное заполнение.
+
+Идемпотентен: трогает только списки, где значения разошлись (им же бампает
+lists.version, чтобы клиенты не держали старый ETag). last_modified не меняет.
+
+    python scripts/reconcile_list_stats.py [--batch 500] [--dry-run]
+"""
+from __future__ import annotations
+import sys
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from app.queries import LIST_TOP_GENRES  # noqa: E402
+from migrate import get_connection  # noqa: E402
+
+
+def reconcile_batch(cur, last_id: int, batch: int, dry_run: bool) -> tuple[int, int, int]:
+    """Один пакет списков: (последний id, сколько проверено, сколько исправлено)."""
+    # FOR UPDATE: пока считаем, приложение не двигает счётчики этих списков;
+    # его изменения, закоммиченные раньше, видны — снимок строится после блокировки
+    cur.execute("""
+        SELECT id, item_count, watched_count, top_genres FROM lists
+        WHERE id > %s ORDER BY id LIMIT %s FOR UPDATE
+    """, (last_id, batch))
+    stored = cur.fetchall()
+    if not stored:
+        return last_id, 0, 0
+    ids = [row[0] for row in stored]
+    in_ids = ",".join(["%s"] * len(ids))
+
+    cur.execute(f"""
+        SELECT list_id, COUNT(*), COALESCE(SUM(watched), 0) FROM items
+        WHERE list_id IN ({in_ids}) GROUP BY list_id
+    """, ids)
+    counts = {list_id: (int(n), int(w)) for list_id, n, w in cur.fetchall()}
+
+    # порядок (n DESC, genre) — тот же, что у list_stats.top_genres, и в той же collation
+    cur.execute(f"""
+        SELECT list_id, genre FROM item_genres
+        WHERE list_id IN ({in_ids}) GROUP BY list_id, genre
+        ORDER BY list_id, COUNT(*) DESC, genre
+    """, ids)
+    top: dict[int, list[str]] = {}
+    for list_id, genre in cur.fetchall():
+        genres = top.setdefault(list_id, [])
+        if len(genres) < LIST_TOP_GENRES:
+            genres.append(genre)
+
+    fixes = []
+    for list_id, item_count, watched_count, top_genres in stored:
+        n, w = counts.get(list_id, (0, 0))
+        genres = ", ".join(top.get(list_id, [])) or None
+        if (item_count, watched_count, top_genres) != (n, w, genres):
+            print(f"[FIX] list={list_id} items {item_count}->{n} watched {watched_count}->{w} "
+                  f"genres {top_genres!r}->{genres!r}")
+            fixes.append((n, w, genres, list_id))
+    if fixes and not dry_run:
+        cur.executemany(
+            "UPDATE lists SET item_count=%s, watched_count=%s, top_genres=%s, version=version+1 WHERE id=%s",
+            fixes,
+        )
+    return ids[-1], len(stored), len(fixes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reconcile lists summary columns with items.")
+    parser.add_argument("--batch", type=int, default=500, help="Сколько списков сверять за транзакцию")
+    parser.add_argument("--dry-run", action="store_true", help="Только показать расхождения")
+    args = parser.parse_args()
+
+    checked, fixed = 0, 0
+    with get_connection() as conn, conn.cursor() as cur:
+        last_id = 0
+        while True:
+            # keyset по id, транзакция на пакет: блокировки держатся недолго
+            conn.start_transaction()
+            try:
+                last_id, n, k = reconcile_batch(cur, last_id, args.batch, args.dry_run)
+            except Exception:
+                conn.rollback()
+                raise
+            conn.commit()
+            if not n:
+                break
+            checked += n
+            fixed += k
+            print(f"[..] lists={checked} fixed={fixed} last_id={last_id}")
+
+    print(f"Готово: проверено {checked}, {'расхождений' if args.dry_run else 'исправлено'}: {fixed}")
+
+
+if __name__ == "__main__":
+    main()
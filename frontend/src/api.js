@@ -11,6 +11,42 @@ api.interceptors.request.use(config => {
   return config;
 });
 
+// Условные GET: помним ETag и тело последнего ответа, шлём If-None-Match,
+// на 304 подставляем сохранённые данные — вызывающий код видит обычный 200.
+const etagCache = new Map();
+const ETAG_CACHE_MAX = 200;
+
+function cacheKey(config) {
+  // токен в ключе: после смены пользователя чужой ответ не подставится
+  return `${config.headers?.Authorization || ''} ${api.getUri(config)}`;
+}
+
+api.interceptors.request.use(config => {
+  if ((config.method || 'get').toLowerCase() !== 'get') return config;
+  const cached = etagCache.get(cacheKey(config));
+  if (cached) config.headers['If-None-Match'] = cached.etag;
+  config.validateStatus = status => (status >= 200 && status < 300) || status === 304;
+  return config;
+});
+
+api.interceptors.response.use(response => {
+  const { config } = response;
+  if ((config.method || 'get').toLowerCase() !== 'get') return response;
+  const key = cacheKey(config);
+  if (response.status === 304) {
+    const cached = etagCache.get(key);
+    if (cached) return { ...response, status: 200, data: cached.data };
+    return response;
+  }
+  const etag = response.headers?.etag;
+  if (etag) {
+    etagCache.delete(key);
+    etagCache.set(key, { etag, data: response.data });
+    if (etagCache.size > ETAG_CACHE_MAX) etagCache.delete(etagCache.keys().next().value);
+  }
+  return response;
+});
+
 export function getItems(params = {}) {
   // поддерживаем sort_by, order, list_id, limit, offset
   console.log(params)